@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+# c) 2001-2017 Simula Research Laboratory ALL RIGHTS RESERVED
+# Authors: Henrik Finsberg
+# END-USER LICENSE AGREEMENT
+# PLEASE READ THIS DOCUMENT CAREFULLY. By installing or using this
+# software you agree with the terms and conditions of this license
+# agreement. If you do not accept the terms of this license agreement
+# you may not install or use this software.
+
+# Permission to use, copy, modify and distribute any part of this
+# software for non-profit educational and research purposes, without
+# fee, and without a written agreement is hereby granted, provided
+# that the above copyright notice, and this license agreement in its
+# entirety appear in all copies. Those desiring to use this software
+# for commercial purposes should contact Simula Research Laboratory AS: post@simula.no
+#
+# IN NO EVENT SHALL SIMULA RESEARCH LABORATORY BE LIABLE TO ANY PARTY
+# FOR DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES,
+# INCLUDING LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE
+# "PULSE-ADJOINT" EVEN IF SIMULA RESEARCH LABORATORY HAS BEEN ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE. THE SOFTWARE PROVIDED HEREIN IS
+# ON AN "AS IS" BASIS, AND SIMULA RESEARCH LABORATORY HAS NO OBLIGATION
+# TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
+# SIMULA RESEARCH LABORATORY MAKES NO REPRESENTATIONS AND EXTENDS NO
+# WARRANTIES OF ANY KIND, EITHER IMPLIED OR EXPRESSED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY OR FITNESS
+"""
+Predictor and step size control for the continuation in the
+pressure (passive filling) and in gamma (active contraction).
+
+The control is moved along the straight line from its current
+value to the target in one or more steps. Before each newton
+solve the initial guess is extrapolated from the previous
+converged states, either
+
+* ``"secant"``: linearly from the last two converged states, or
+* ``"tangent"``: by solving the linearized system with the
+  jacobian in the last converged state, and the residual
+  evaluated with the new value of the control.
+
+The length of the next step is adapted from the number of newton
+iterations that was needed for the previous step, and a step
+is halved if the newton solver does not converge. If the step
+gets too small, the remaining part of the path is handed over
+to :func:`pulse.iterate.iterate`.
+"""
+from collections import deque
+
+import numpy as np
+import dolfin
+import dolfin_adjoint
+
+from pulse.mechanicsproblem import SolverDidNotConverge
+from pulse.iterate import iterate
+from pulse import numpy_mpi
+
+from .adjoint_contraction_args import logger
+
+PREDICTORS = ["none", "secant", "tangent"]
+
+
+class StepController(object):
+    """Adapt the length of the continuation steps from the number
+    of newton iterations. The step is given as a fraction of the
+    distance from the initial value of the control to the target.
+
+    :param float initial_step: Length of the first step
+    :param float min_step: Smallest step that is tried
+    :param int target_iterations: Wanted number of newton iterations
+                                  in each step
+    :param float max_factor: Largest factor the step is increased by
+
+    """
+
+    def __init__(
+        self, initial_step=1.0, min_step=0.05, target_iterations=5, max_factor=2.0
+    ):
+
+        self.step = initial_step
+        self.min_step = min_step
+        self.target_iterations = target_iterations
+        self.max_factor = max_factor
+
+    def accept(self, nliter):
+        """Update the step after a step that converged
+        in `nliter` newton iterations
+        """
+        factor = float(self.target_iterations) / max(nliter, 1)
+        factor = min(max(factor, 0.5), self.max_factor)
+        self.step = min(self.step * factor, 1.0)
+
+    def reject(self):
+        """Halve the step after a step that did not converge.
+        Return False if the step is smaller than the smallest step.
+        """
+        self.step *= 0.5
+        return self.step >= self.min_step
+
+
+def _as_list(control):
+    if isinstance(control, (tuple, list)):
+        return list(control)
+    return [control]
+
+
+def _is_function(f):
+    return isinstance(f, dolfin.Function)
+
+
+def _values(controls):
+    """Return the values of the controls as one (global) array
+    """
+    values = []
+    for c in controls:
+        if _is_function(c):
+            values.append(numpy_mpi.gather_broadcast(c.vector().get_local()))
+        else:
+            values.append(np.array([float(c)]))
+    return np.concatenate(values)
+
+
+def _copy(control):
+    return control.copy(True) if _is_function(control) else float(control)
+
+
+def _max_diff(v1, v2):
+
+    diff = v1 - v2
+    diff.abs()
+    return diff.max()
+
+
+class ContinuationStepper(object):
+    """Step the control of a mechanics problem to a target
+    with a predictor for the initial guess of the newton solver.
+
+    :param problem: The mechanics problem
+    :type problem: :class:`pulse.MechanicsProblem`
+    :param str predictor: Either "secant" or "tangent"
+    :param int target_iterations: Wanted number of newton
+                                  iterations in each step
+
+    """
+
+    def __init__(self, problem, predictor="secant", target_iterations=5):
+
+        if predictor not in PREDICTORS[1:]:
+            msg = "Unknown continuation predictor {}. Possible values: {}".format(
+                predictor, PREDICTORS[1:]
+            )
+            raise ValueError(msg)
+
+        self.problem = problem
+        self.predictor = predictor
+        self.controller = StepController(target_iterations=target_iterations)
+        self._history = deque(maxlen=2)
+
+        if predictor == "tangent" and self._forms() is None:
+            logger.warning(
+                "Unable to get the residual and jacobian of the "
+                "mechanics problem. Use the secant predictor"
+            )
+            self.predictor = "secant"
+
+    def _forms(self):
+
+        F = getattr(self.problem, "_virtual_work", getattr(self.problem, "_G", None))
+        J = getattr(self.problem, "_jacobian", getattr(self.problem, "_dG", None))
+        if F is None or J is None:
+            return None
+        return F, J
+
+    def _homogenized_bcs(self):
+
+        bcs = []
+        for bc in _as_list(getattr(self.problem, "_dirichlet_bc", None) or []):
+            bc = dolfin.DirichletBC(bc)
+            bc.homogenize()
+            bcs.append(bc)
+        return bcs
+
+    def _push(self, controls):
+        self._history.append((_values(controls), self.problem.state.copy(True)))
+
+    def _sync_history(self, controls):
+        """Make sure the last entry in the history is the current
+        state, which is not the case if the problem is reset
+        between two calls
+        """
+        if self._history:
+            values, state = self._history[-1]
+            diff = _max_diff(state.vector(), self.problem.state.vector())
+            if np.allclose(values, _values(controls)) and diff < dolfin.DOLFIN_EPS:
+                return
+            self._history.clear()
+
+        self._push(controls)
+
+    def _assign(self, controls, start, end, t):
+
+        for c, c0, c1 in zip(controls, start, end):
+            if _is_function(c):
+                c.vector().zero()
+                c.vector().axpy(1.0 - t, c0.vector())
+                c.vector().axpy(t, c1.vector())
+            else:
+                c.assign(dolfin_adjoint.Constant((1.0 - t) * c0 + t * c1))
+
+    def _secant(self, controls):
+
+        if len(self._history) < 2:
+            return
+
+        (c_a, w_a), (c_b, w_b) = self._history
+        dc = c_b - c_a
+        denom = dc.dot(dc)
+        if denom == 0.0:
+            return
+
+        delta = (_values(controls) - c_b).dot(dc) / denom
+        w = self.problem.state.vector()
+        w.axpy(delta, w_b.vector())
+        w.axpy(-delta, w_a.vector())
+
+    def _tangent(self, A):
+
+        F, J = self._forms()
+        b = dolfin.assemble(F)
+        b *= -1.0
+        for bc in self._homogenized_bcs():
+            bc.apply(A, b)
+
+        dw = self.problem.state.vector().copy()
+        dw.zero()
+        dolfin.solve(A, dw, b)
+        self.problem.state.vector().axpy(1.0, dw)
+
+    def step(self, control, target):
+        """Step the control to the target
+
+        :param control: The control (a constant, a function or
+                        a tuple of constants)
+        :param target: The target value(s) of the control
+        :returns: The converged states and the values of the controls
+                  in each step
+        :rtype: tuple
+
+        """
+
+        controls = _as_list(control)
+        start = [_copy(c) for c in controls]
+        end = []
+        for c, v in zip(controls, _as_list(target)):
+            if _is_function(c) and not _is_function(v):
+                f = dolfin.Function(c.function_space())
+                f.vector()[:] = float(v)
+                v = f
+            end.append(v if _is_function(v) else float(v))
+
+        self._sync_history(controls)
+
+        states, values = [], []
+        t = 0.0
+        niter = 0
+        while t < 1.0:
+
+            t_new = t + min(self.controller.step, 1.0 - t)
+            if 1.0 - t_new < self.controller.min_step:
+                t_new = 1.0
+
+            if self.predictor == "tangent":
+                # Jacobian in the last converged state
+                A = dolfin.assemble(self._forms()[1])
+
+            self._assign(controls, start, end, t_new)
+
+            if self.predictor == "tangent":
+                self._tangent(A)
+            else:
+                self._secant(controls)
+
+            try:
+                nliter, nlconv = self.problem.solve()
+
+            except SolverDidNotConverge:
+                self.problem.reinit(self._history[-1][1])
+                self._assign(controls, start, end, t)
+
+                if not self.controller.reject():
+                    logger.info("Continuation step is too small. Continue with iterate")
+                    old_states, old_values = iterate(
+                        problem=self.problem,
+                        control=control,
+                        target=target,
+                        continuation=True,
+                    )
+                    self._history.clear()
+                    self._push(controls)
+                    return states + list(old_states), values + list(old_values)
+
+                logger.debug(
+                    "Newton solver did not converge. Reduce step to {}".format(
+                        self.controller.step
+                    )
+                )
+                continue
+
+            niter += nliter
+            self.controller.accept(nliter)
+            t = t_new
+
+            self._push(controls)
+            states.append(self.problem.state.copy(True))
+            copies = [_copy(c) for c in controls]
+            values.append(copies[0] if len(copies) == 1 else tuple(copies))
+
+        logger.debug(
+            "Continuation: {} steps, {} newton iterations".format(len(states), niter)
+        )
+        return states, values
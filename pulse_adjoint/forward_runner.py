@@ -40,6 +40,62 @@ from .optimization_targets import *
 from .adjoint_contraction_args import *
 
 from .utils import Text, list_sum, Object, TablePrint, UnableToChangePressureExeption
+from .trace import tracer
+
+
+class StateCache(object):
+    """
+    Cache of converged states from previous evaluations of the
+    forward problem, keyed by the control. The states belonging to
+    the control closest (in the euclidean norm) to a given control
+    can be used as initial guess for the newton solver.
+
+    :param int maxsize: Maximum number of controls to keep. When
+                        the cache is full the oldest entry is removed.
+    """
+
+    def __init__(self, maxsize=10):
+        self.maxsize = maxsize
+        self._controls = []
+        self._states = []
+
+    def __len__(self):
+        return len(self._controls)
+
+    def add(self, m, states):
+        """Add the states from an evaluation with control `m`
+
+        :param m: The control
+        :param list states: List of converged states, one for each pressure step
+        """
+        self._controls.append(numpy_mpi.gather_broadcast(m.vector().get_local()))
+        self._states.append(states)
+
+        if len(self._controls) > self.maxsize:
+            self._controls.pop(0)
+            self._states.pop(0)
+
+    def nearest(self, m):
+        """Return the states from the control closest to `m`,
+        or None if the cache is empty.
+        """
+        if len(self) == 0:
+            return None
+
+        x = numpy_mpi.gather_broadcast(m.vector().get_local())
+        dist = [np.linalg.norm(x - c) for c in self._controls]
+
+        return self._states[int(np.argmin(dist))]
+
+
+def get_final_state(forward_result):
+    """Return the state after the last pressure step of a forward
+    run. Cached evaluations only keep the final state (`final_state`)
+    when the history is bounded. Return None if it is not available.
+    """
+    if forward_result.get("states") is not None:
+        return forward_result["states"][-1]
+    return forward_result.get("final_state")
 
 
 class BasicForwardRunner(object):
@@ -192,7 +248,9 @@ class BasicForwardRunner(object):
 
         for it, p in enumerate(self.bcs["pressure"][1:], start=1):
 
-            sol = next(phm)
+            self._set_initial_guess(phm, it)
+            with tracer.region("{} step".format(phase), step=it):
+                sol = next(phm)
             self.states.append(phm.solver.state.copy(True))
 
             if (
@@ -204,7 +262,8 @@ class BasicForwardRunner(object):
                 or int(self.params["passive_weights"]) == it
             ):
 
-                self.update_targets(it, dolfin.split(sol)[0], m, annotate=annotate)
+                with tracer.region("update targets", step=it):
+                    self.update_targets(it, dolfin.split(sol)[0], m, annotate=annotate)
 
                 # Print the values
                 logger.info(self._print_line(it))
@@ -223,13 +282,21 @@ class BasicForwardRunner(object):
                         it, it == len(self.bcs["pressure"]) - 1
                     )
 
-                functional_values.append(dolfin_adjoint.assemble(functional))
+                with tracer.region("assemble functional", step=it):
+                    functional_values.append(dolfin_adjoint.assemble(functional))
 
         forward_result = self._make_forward_result(functional_values, functionals_time)
 
         # self._print_finished_report(forward_result)
         return forward_result
 
+    def _set_initial_guess(self, phm, it):
+        """Set the initial guess for the newton solver
+        before solving for pressure step `it`.
+        Default is to start from the current state.
+        """
+        pass
+
     def make_functional(self):
 
         # Get the functional value of each term in the functional
@@ -318,6 +385,9 @@ class ActiveForwardRunner(BasicForwardRunner):
         adjoint contraction paramters
     gamma_previous: :py:class`dolfin.function`
         The active contraction parameter
+    initial_state: :py:class`dolfin.function`
+        The state of the previous point. If not given, it is
+        read from the result file
 
 
     **Example of usage**::
@@ -357,6 +427,7 @@ class ActiveForwardRunner(BasicForwardRunner):
         optimization_targets,
         params,
         gamma_previous,
+        initial_state=None,
     ):
 
         self.active_contraction_iteration_number = params[
@@ -378,11 +449,63 @@ class ActiveForwardRunner(BasicForwardRunner):
         )
 
         self.cphm = ActiveHeartProblem(
-            self.bcs, self.solver_parameters, self.pressure, self.params, annotate=False
+            self.bcs,
+            self.solver_parameters,
+            self.pressure,
+            self.params,
+            annotate=False,
+            initial_state=initial_state,
+        )
+
+        self.cphm.increase_pressure()
+
+    def reset(self, bcs, params, gamma_previous, initial_state=None):
+        """Prepare the runner for a new contract point, reusing the
+        optimization targets and the mechanics problem. The target data
+        for the new point should already be loaded into the targets.
+
+        :param dict bcs: Dictionary with boundary conditions coming from
+                         run_optimization.load_target_data()
+        :param dict params: adjoint contraction paramters
+        :param gamma_previous: The active contraction parameter
+        :param initial_state: The state of the previous point. If not
+                              given, it is read from the result file
+
+        """
+        self.active_contraction_iteration_number = params[
+            "active_contraction_iteration_number"
+        ]
+        self.gamma_previous = gamma_previous
+        self.bcs = bcs
+        self.params = params
+
+        self.opt_weights = {}
+        for k, v in list(params["Active_optimization_weigths"].items()):
+            if k in list(self.optimization_targets.keys()) or k == "regularization":
+                self.opt_weights[k] = v
+
+        self.solver_parameters["material"].activation.assign(
+            gamma_previous, annotate=True
         )
 
+        self.cphm.reset_point(bcs, params, annotate=False, initial_state=initial_state)
         self.cphm.increase_pressure()
 
+    def restore(self, m, forward_result):
+        """Put the runner in the state it has after a forward
+        run with control `m`, without solving. This is used when
+        the evaluation is taken from the cache.
+
+        :param m: The active contraction parameter
+        :param dict forward_result: The result of the forward run in `m`
+
+        """
+        self.gamma_previous.assign(m)
+        self.cphm.solver.material.activation.assign(m)
+        state = get_final_state(forward_result)
+        if state is not None:
+            self.cphm.solver.reinit(state)
+
     def __call__(self, m, annotate=False):
 
         logger.info("Evaluating model")
@@ -402,7 +525,8 @@ class ActiveForwardRunner(BasicForwardRunner):
         )
 
         try:
-            self.cphm.next_active(m, self.gamma_previous)
+            with tracer.region("gamma continuation"):
+                self.cphm.next_active(m, self.gamma_previous)
 
         except SolverDidNotConverge as ex:
             logger.debug("Stepping up gamma failed")
@@ -513,10 +637,21 @@ class PassiveForwardRunner(BasicForwardRunner):
         self.paramvec = paramvec
         self.cphm = self.get_phm(return_state=False)
 
+        if params["passive_state_cache_size"] > 0:
+            self.state_cache = StateCache(params["passive_state_cache_size"])
+        else:
+            self.state_cache = None
+        self._initial_guess = None
+
     def __call__(self, m, annotate=False):
 
         self.assign_material_parameters(m)
-        self.cphm = self.get_phm(annotate, return_state=False)
+        if self.state_cache is not None:
+            self._initial_guess = self.state_cache.nearest(self.paramvec)
+        if self.params["reuse_passive_problem"]:
+            self.reset_phm(annotate)
+        else:
+            self.cphm = self.get_phm(annotate, return_state=False)
         dolfin.parameters["adjoint"]["stop_annotating"] = not annotate
         try:
             forward_result = BasicForwardRunner.solve_the_forward_problem(
@@ -530,8 +665,35 @@ class PassiveForwardRunner(BasicForwardRunner):
             logger.warning(ex)
             raise SolverDidNotConverge
         else:
+            if self.state_cache is not None:
+                self.state_cache.add(self.paramvec, forward_result["states"])
             return forward_result, False
 
+    def restore(self, m, forward_result):
+        """Put the runner in the state it has after a forward
+        run with control `m`, without solving. This is used when
+        the evaluation is taken from the cache.
+
+        :param m: The material parameters
+        :param dict forward_result: The result of the forward run in `m`
+
+        """
+        self.assign_material_parameters(m)
+        state = get_final_state(forward_result)
+        if state is not None:
+            self.cphm.solver.reinit(state)
+
+    def _set_initial_guess(self, phm, it):
+        """Use the converged state for the same pressure step from
+        the closest previously evaluated control as initial guess
+        """
+        if self._initial_guess is None or it >= len(self._initial_guess):
+            return
+
+        w = phm.solver.state.vector()
+        w.zero()
+        w.axpy(1.0, self._initial_guess[it].vector())
+
     def assign_material_parameters(self, m):
 
         self.paramvec.assign(m)
@@ -575,6 +737,20 @@ class PassiveForwardRunner(BasicForwardRunner):
                 # mat.assign(v)
                 mat = v
 
+    def reset_phm(self, annotate=True):
+        """
+        Reset the current heart problem to the initial pressure
+        and a zero state, and do an initial solve. This is used
+        instead of :meth:`get_phm` when the mechanics problem
+        is reused between functional evaluations.
+        """
+        self.cphm.reset(self.bcs)
+
+        # Do an initial solve for the initial point
+        dolfin.parameters["adjoint"]["stop_annotating"] = True
+        self.cphm.solver.solve()
+        dolfin.parameters["adjoint"]["stop_annotating"] = not annotate
+
     def get_phm(self, annotate=True, return_state=False):
 
         phm = PassiveHeartProblem(self.bcs, self.solver_parameters, self.pressure)
@@ -33,6 +33,9 @@ import dolfin_adjoint
 from .adjoint_contraction_args import *
 
 from .utils import Text, UnableToChangePressureExeption
+from .io.writer import h5_lock
+from .trace import tracer
+from .continuation import ContinuationStepper
 from pulse.iterate import iterate, delist
 from pulse import numpy_mpi
 
@@ -108,6 +111,17 @@ class BasicHeartProblem(collections.Iterator):
 
         # Mechanical solver Active strain Holzapfel and Ogden
         self.solver = create_mechanics_problem(solver_parameters)
+        if tracer.enabled:
+            tracer.wrap(self.solver, "solve", "newton solve", timers=True)
+
+        continuation = solver_parameters.get("continuation", {})
+        predictor = continuation.get("predictor", "none")
+        if predictor == "none":
+            self.stepper = None
+        else:
+            self.stepper = ContinuationStepper(
+                self.solver, predictor, continuation.get("target_iterations", 5)
+            )
 
     def increase_pressure(self):
 
@@ -120,7 +134,12 @@ class BasicHeartProblem(collections.Iterator):
             target = p_lv_next
             control = self.p_lv
 
-        iterate(problem=self.solver, target=target, control=control, continuation=True)
+        if self.stepper is None:
+            iterate(
+                problem=self.solver, target=target, control=control, continuation=True
+            )
+        else:
+            self.stepper.step(control, target)
 
     def get_state(self, copy=True):
         """
@@ -142,6 +161,27 @@ class BasicHeartProblem(collections.Iterator):
         else:
             return gamma
 
+    def reset(self, bcs, state=None):
+        """Reset the problem to the first pressure in `bcs`
+
+        :param dict bcs: Dictionary with boundary conditions coming from
+                         run_optimization.load_target_data()
+        :param state: State to start from. If None, the state is set to zero.
+
+        """
+
+        self._init_pressures(bcs["pressure"], self.p_lv, "lv")
+        self.p_lv.assign(dolfin_adjoint.Constant(float(self.lv_pressure[0])))
+
+        if self.has_rv:
+            self._init_pressures(bcs["rv_pressure"], self.p_rv, "rv")
+            self.p_rv.assign(dolfin_adjoint.Constant(float(self.rv_pressure[0])))
+
+        if state is None:
+            self.solver.state.vector().zero()
+        else:
+            self.solver.reinit(state)
+
     def _init_pressures(self, pressure, p, chamber="lv"):
 
         setattr(self, "{}_pressure".format(chamber), pressure)
@@ -172,138 +212,199 @@ def get_max_diff(f1, f2):
     return diff.max()
 
 
-class ActiveHeartProblem(BasicHeartProblem):
+class StateStore(object):
     """
-    A heart problem for the regional contracting gamma.
+    Bounded in-memory store of states and gammas, which are used
+    as initial guess for the newton solver when stepping up gamma.
+
+    :param int maxsize: Maximum number of states kept in memory.
+                        When the store is full the oldest state is removed.
+                        If 0, the number of states is not bounded.
+    :param str spill_file: If given, states that are removed from
+                           memory are written to this file, and
+                           read back when the states are loaded.
     """
 
-    def __init__(self, bcs, solver_parameters, pressure, params, annotate=False):
+    def __init__(self, maxsize=0, spill_file=None):
 
-        passive_filling_duration = solver_parameters["passive_filling_duration"]
-        self.acin = params["active_contraction_iteration_number"]
-        fname = "active_state_{}.h5".format(self.acin)
-        if os.path.isfile(fname):
-            if dolfin.mpi_comm_world().rank == 0:
-                os.remove(fname)
+        self.maxsize = maxsize
+        self.spill_file = spill_file
+        self._states = []
+        self._gammas = []
+        self._nspilled = 0
 
-        BasicHeartProblem.__init__(self, bcs, solver_parameters, pressure)
+    def __len__(self):
+        return len(self._states) + self._nspilled
 
-        # Load the state from the previous iteration
-        w_temp = dolfin_adjoint.Function(self.solver.state_space, name="w_temp")
-        with dolfin.HDF5File(
-            dolfin.mpi_comm_world(), params["sim_file"], "r"
+    def store(self, states, gammas):
+
+        assert len(states) == len(
+            gammas
+        ), "Number of states does not math number of gammas"
+
+        for (w, g) in zip(states, gammas):
+            self._states.append(w.copy(True))
+            self._gammas.append(g.copy(True))
+
+        while self.maxsize > 0 and len(self._states) > self.maxsize:
+            w = self._states.pop(0)
+            g = self._gammas.pop(0)
+            if self.spill_file is not None:
+                self._spill(w, g)
+
+    def _spill(self, w, g):
+
+        file_mode = "a" if self._nspilled > 0 else "w"
+        with h5_lock, dolfin.HDF5File(
+            dolfin.mpi_comm_world(), self.spill_file, file_mode
         ) as h5file:
+            h5file.write(w, "{}/state".format(self._nspilled))
+            h5file.write(g, "{}/gamma".format(self._nspilled))
 
-            # Get previous state
-            if params["active_contraction_iteration_number"] == 0:
-                it = (
-                    passive_filling_duration
-                    if params["unload"]
-                    else passive_filling_duration - 1
-                )
-                group = "/".join(
-                    [params["h5group"], PASSIVE_INFLATION_GROUP, "states", str(it)]
-                )
-
-            else:
-                group = "/".join(
-                    [
-                        params["h5group"],
-                        ACTIVE_CONTRACTION_GROUP.format(
-                            params["active_contraction_iteration_number"] - 1
-                        ),
-                        "states",
-                        "0",
-                    ]
-                )
-
-            h5file.read(w_temp, group)
+        self._nspilled += 1
 
-        self.solver.reinit(w_temp, annotate=annotate)
-        self.solver.solve()
+    def _load_spilled(self):
 
-    def get_number_of_stored_states(self):
+        if self._nspilled == 0:
+            return [], []
 
-        fname = "active_state_{}.h5".format(self.acin)
-        if os.path.isfile(fname):
-            i = 0
-            with dolfin.HDF5File(dolfin.mpi_comm_world(), fname, "r") as h5file:
-                group_exist = h5file.has_dataset("0")
-                while group_exist:
-                    i += 1
-                    group_exist = h5file.has_dataset(str(i))
+        # Spilled states are only written when the store is
+        # full, so there is always a state in memory to copy
+        w_temp, g_temp = self._states[0], self._gammas[0]
+        states, gammas = [], []
+        with h5_lock, dolfin.HDF5File(
+            dolfin.mpi_comm_world(), self.spill_file, "r"
+        ) as h5file:
+            for i in range(self._nspilled):
+                w = w_temp.copy(True)
+                g = g_temp.copy(True)
+                h5file.read(w, "{}/state".format(i))
+                h5file.read(g, "{}/gamma".format(i))
+                states.append(w)
+                gammas.append(g)
 
-            return i
+        return states, gammas
 
-        else:
-            return 0
+    def load(self):
+        """Return all the stored states and gammas, oldest first.
+        This includes the states that are spilled to file.
+        """
+        states, gammas = self._load_spilled()
+        return states + self._states, gammas + self._gammas
 
-    def store_states(self, states, gammas):
 
-        fname = "active_state_{}.h5".format(self.acin)
-        file_mode = "a" if os.path.isfile(fname) else "w"
-        key = self.get_number_of_stored_states()
+class ActiveHeartProblem(BasicHeartProblem):
+    """
+    A heart problem for the regional contracting gamma.
+    """
 
-        gamma_group = "{}/gamma"
-        state_group = "{}/state"
+    def __init__(
+        self,
+        bcs,
+        solver_parameters,
+        pressure,
+        params,
+        annotate=False,
+        initial_state=None,
+    ):
+
+        self.passive_filling_duration = solver_parameters["passive_filling_duration"]
+        BasicHeartProblem.__init__(self, bcs, solver_parameters, pressure)
+        self._set_initial_state(params, annotate, initial_state)
 
-        assert len(states) == len(
-            gammas
-        ), "Number of states does not math number of gammas"
+    def reset_point(self, bcs, params, annotate=False, initial_state=None):
+        """Reset the problem to a new contract point
 
-        with dolfin.HDF5File(dolfin.mpi_comm_world(), fname, file_mode) as h5file:
+        :param dict bcs: Dictionary with boundary conditions coming from
+                         run_optimization.load_target_data()
+        :param dict params: adjoint contraction paramters
+        :param bool annotate: Annotate the initial solve
+        :param initial_state: The state of the previous point. If not
+                              given, it is read from the result file
 
-            for (w, g) in zip(states, gammas):
-                h5file.write(w, state_group.format(key))
-                h5file.write(g, gamma_group.format(key))
-                key += 1
+        """
+        self.reset(bcs)
+        self._set_initial_state(params, annotate, initial_state)
 
-    def load_states(self):
+    def _set_initial_state(self, params, annotate=False, initial_state=None):
 
+        passive_filling_duration = self.passive_filling_duration
+        self.acin = params["active_contraction_iteration_number"]
         fname = "active_state_{}.h5".format(self.acin)
-        if not os.path.isfile(fname):
-            return [], []
+        if os.path.isfile(fname):
+            if dolfin.mpi_comm_world().rank == 0:
+                os.remove(fname)
 
-        nstates = self.get_number_of_stored_states()
+        self.state_store = StateStore(
+            params["active_state_store_size"],
+            fname if params["active_state_spill"] else None,
+        )
 
-        gamma_group = "{}/gamma"
-        state_group = "{}/state"
+        # Load the state from the previous iteration
+        w_temp = dolfin_adjoint.Function(self.solver.state_space, name="w_temp")
+        if initial_state is not None:
+            # Use the state of the previous point kept in memory
+            w_temp.vector().axpy(1.0, initial_state.vector())
+        else:
+            with h5_lock, dolfin.HDF5File(
+                dolfin.mpi_comm_world(), params["sim_file"], "r"
+            ) as h5file:
+
+                # Get previous state
+                if params["active_contraction_iteration_number"] == 0:
+                    it = (
+                        passive_filling_duration
+                        if params["unload"]
+                        else passive_filling_duration - 1
+                    )
+                    group = "/".join(
+                        [params["h5group"], PASSIVE_INFLATION_GROUP, "states", str(it)]
+                    )
 
-        states = []
-        gammas = []
+                else:
+                    group = "/".join(
+                        [
+                            params["h5group"],
+                            ACTIVE_CONTRACTION_GROUP.format(
+                                params["active_contraction_iteration_number"] - 1
+                            ),
+                            "states",
+                            "0",
+                        ]
+                    )
+
+                h5file.read(w_temp, group)
 
-        w = self.solver.state.copy(True)
-        g = self.solver.material.activation.copy(True)
+        self.solver.reinit(w_temp, annotate=annotate)
+        self.solver.solve()
 
-        with dolfin.HDF5File(dolfin.mpi_comm_world(), fname, "r") as h5file:
+    def get_number_of_stored_states(self):
 
-            for i in range(nstates):
+        return len(self.state_store)
 
-                try:
-                    h5file.read(w, state_group.format(i))
-                    h5file.read(g, gamma_group.format(i))
+    def store_states(self, states, gammas):
 
-                except:
-                    logger.info("State {} does not exist".format(i))
+        self.state_store.store(states, gammas)
 
-                else:
-                    states.append(w.copy(True))
-                    gammas.append(g.copy(True))
+    def load_states(self):
 
-        return states, gammas
+        return self.state_store.load()
 
     def next_active(self, gamma_current, gamma, assign_prev_state=True, steps=None):
 
-        old_states, old_gammas = self.load_states()
-
-        states, gammas = iterate(
-            problem=self.solver,
-            control=gamma,
-            target=gamma_current,
-            continuation=True,
-            old_states=old_states,
-            old_controls=old_gammas,
-        )
+        if self.stepper is None:
+            old_states, old_gammas = self.load_states()
+
+            states, gammas = iterate(
+                problem=self.solver,
+                control=gamma,
+                target=gamma_current,
+                continuation=True,
+                old_states=old_states,
+                old_controls=old_gammas,
+            )
+        else:
+            states, gammas = self.stepper.step(gamma, gamma_current)
         # Store these gammas and states which can be used
         # as initial guess for the newton solver in a later
         # iteration
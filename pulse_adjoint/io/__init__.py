@@ -1,2 +1,4 @@
 from .store_results import write_opt_results_to_h5
-from .utils import contract_point_exists, passive_inflation_exists
+from .checkpoint import Checkpoint, get_checkpoint
+from .writer import AsyncResultWriter, h5_lock
+from .utils import contract_point_exists, passive_inflation_exists, read_displacement
@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+# c) 2001-2017 Simula Research Laboratory ALL RIGHTS RESERVED
+# Authors: Henrik Finsberg
+# END-USER LICENSE AGREEMENT
+# PLEASE READ THIS DOCUMENT CAREFULLY. By installing or using this
+# software you agree with the terms and conditions of this license
+# agreement. If you do not accept the terms of this license agreement
+# you may not install or use this software.
+
+# Permission to use, copy, modify and distribute any part of this
+# software for non-profit educational and research purposes, without
+# fee, and without a written agreement is hereby granted, provided
+# that the above copyright notice, and this license agreement in its
+# entirety appear in all copies. Those desiring to use this software
+# for commercial purposes should contact Simula Research Laboratory AS: post@simula.no
+#
+# IN NO EVENT SHALL SIMULA RESEARCH LABORATORY BE LIABLE TO ANY PARTY
+# FOR DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES,
+# INCLUDING LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE
+# "PULSE-ADJOINT" EVEN IF SIMULA RESEARCH LABORATORY HAS BEEN ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE. THE SOFTWARE PROVIDED HEREIN IS
+# ON AN "AS IS" BASIS, AND SIMULA RESEARCH LABORATORY HAS NO OBLIGATION
+# TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
+# SIMULA RESEARCH LABORATORY MAKES NO REPRESENTATIONS AND EXTENDS NO
+# WARRANTIES OF ANY KIND, EITHER IMPLIED OR EXPRESSED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY OR FITNESS
+"""
+Checkpoints of the optimization state, so that an optimization
+that is interrupted (e.g by a time limit on a cluster) can be
+resumed from where it stopped rather than from the start.
+"""
+import hashlib
+
+from .io_import import *
+from .writer import h5_lock
+
+
+class Checkpoint(object):
+    """Periodically save the state of the optimizer
+    for one optimization (the passive phase or one contract point).
+
+    The following is stored every `interval` evaluations of the
+    reduced functional: the functional values that are evaluated so
+    far, the controls kept in the history of the reduced functional,
+    the best control, and the counters and timings of the reduced
+    functional. The state of the forward model is not stored, since
+    the optimization is resumed from the best control.
+    The file is written by process 0 to a temporary file which is
+    then moved into place, so that a checkpoint is never half written.
+    The size of the control and a fingerprint of the parameters are
+    stored as well, and a checkpoint where these do not match is
+    not restored.
+
+    :param str fname: Path to the checkpoint file
+    :param int interval: Number of evaluations between each checkpoint
+    :param comm: The MPI communicator
+    :param str fingerprint: Fingerprint of the parameters,
+                            see :func:`get_fingerprint`
+
+    """
+
+    lists = [
+        "func_values_lst",
+        "forward_times",
+        "backward_times",
+        "grad_norm",
+        "grad_norm_scaled",
+    ]
+    counters = ["iter", "nr_crashes", "nr_der_calls"]
+
+    def __init__(
+        self, fname, interval=10, comm=dolfin.mpi_comm_world(), fingerprint=""
+    ):
+        self.fname = fname
+        self.interval = interval
+        self.comm = comm
+        self.fingerprint = fingerprint
+        self.nevals = 0
+
+    def __call__(self, rd):
+        """Called after each evaluation of the reduced
+        functional. Save a checkpoint every `interval` evaluation.
+        """
+        self.nevals += 1
+        if self.interval > 0 and self.nevals % self.interval == 0:
+            self.save(rd)
+
+    def save(self, rd):
+        """Save the state of the reduced functional
+
+        :param rd: The reduced functional
+        :type rd: :py:class:`pulse_adjoint.setup_optimization.MyReducedFunctional`
+
+        """
+        if len(rd.controls_lst) == 0:
+            return
+
+        controls = np.array(
+            [gather_broadcast(c.get_local()) for c in rd.controls_lst]
+        )
+        indices = np.array(rd.controls_lst.indices(), dtype=int)
+        best = gather_broadcast(rd.controls_lst.best()[1].get_local())
+
+        if self.comm.rank == 0:
+            logger.debug("Save checkpoint to {}".format(self.fname))
+            tmp = self.fname + ".tmp"
+            with h5_lock, h5py.File(tmp, "w") as h5file:
+                h5file.create_dataset("controls", data=controls)
+                h5file.create_dataset("control_indices", data=indices)
+                h5file.create_dataset("best_control", data=best)
+                for k in self.lists:
+                    h5file.create_dataset(
+                        k, data=np.array(getattr(rd, k), dtype=float)
+                    )
+                for k in self.counters:
+                    h5file.attrs[k] = getattr(rd, k)
+                h5file.attrs["control_size"] = len(best)
+                h5file.attrs["fingerprint"] = self.fingerprint
+            os.replace(tmp, self.fname)
+
+        MPI.barrier(self.comm)
+
+    def load(self):
+        """Load the checkpoint
+
+        :returns: The stored data, or None if there is no checkpoint
+        :rtype: dict
+
+        """
+        if not os.path.isfile(self.fname):
+            return None
+
+        data = {}
+        try:
+            with h5_lock, h5py.File(self.fname, "r") as h5file:
+                for k in [
+                    "controls",
+                    "control_indices",
+                    "best_control",
+                ] + self.lists:
+                    data[k] = np.array(h5file[k])
+                for k in self.counters:
+                    data[k] = int(h5file.attrs[k])
+                data["control_size"] = int(h5file.attrs["control_size"])
+                data["fingerprint"] = str(h5file.attrs["fingerprint"])
+        except (IOError, KeyError):
+            logger.warning("Unable to read checkpoint {}".format(self.fname))
+            return None
+
+        return data
+
+    def restore(self, rd, paramvec):
+        """Restore the state of the reduced functional from the
+        checkpoint, and assign the best control to `paramvec`.
+
+        :param rd: The reduced functional
+        :param paramvec: The control parameter
+        :returns: True if a checkpoint was restored
+        :rtype: bool
+
+        """
+        data = self.load()
+        if data is None:
+            return False
+
+        if (
+            data["control_size"] != paramvec.vector().size()
+            or data["fingerprint"] != self.fingerprint
+        ):
+            logger.warning(
+                (
+                    "Checkpoint {} does not match the control or the "
+                    "parameters of this optimization. Ignore it."
+                ).format(self.fname)
+            )
+            return False
+
+        logger.info(
+            Text.green(
+                "Resume optimization from checkpoint {} ({} evaluations)".format(
+                    self.fname, len(data["func_values_lst"])
+                )
+            )
+        )
+
+        for k in self.lists:
+            setattr(rd, k, data[k].tolist())
+
+        rd.controls_lst.clear()
+        for i, c in zip(data["control_indices"], data["controls"]):
+            v = dolfin.Vector(paramvec.vector())
+            assign_to_vector(v, c)
+            rd.controls_lst.append(v, rd.func_values_lst[i], int(i))
+        for k in self.counters:
+            setattr(rd, k, data[k])
+
+        assign_to_vector(paramvec.vector(), data["best_control"])
+        self.nevals = len(rd.func_values_lst)
+        return True
+
+    def remove(self):
+        """Remove the checkpoint file
+        """
+        if self.comm.rank == 0 and os.path.isfile(self.fname):
+            os.remove(self.fname)
+        MPI.barrier(self.comm)
+
+
+def get_fingerprint(params):
+    """Return a fingerprint of the parameters that determine the
+    control and the functional, i.e the space of the control, the
+    optimization targets and their weights.
+
+    :param params: Application parameters
+    :returns: The fingerprint
+    :rtype: str
+
+    """
+    if params["phase"] == PHASES[1]:
+        keys = ["gamma_space", "merge_active_control"]
+        weights = "Active_optimization_weigths"
+    else:
+        keys = ["matparams_space", "merge_passive_control", "passive_weights"]
+        weights = "Passive_optimization_weigths"
+
+    values = [(k, params[k]) for k in keys]
+    for group in ["Optimization_targets", weights, "Fixed_parameters"]:
+        values.append((group, sorted(params[group].to_dict().items())))
+
+    return hashlib.sha1(repr(values).encode()).hexdigest()
+
+
+def get_checkpoint(params):
+    """Return the checkpoint for the current optimization, i.e
+    the passive phase or the current contract point. The file is
+    stored next to the result file.
+
+    :param params: Application parameters
+    :returns: The checkpoint
+    :rtype: :class:`Checkpoint`
+
+    """
+    if params["phase"] == PHASES[1]:
+        group = CONTRACTION_POINT.format(
+            params["active_contraction_iteration_number"]
+        )
+    else:
+        group = PASSIVE_INFLATION_GROUP
+
+    name = "_".join([s for s in [params["h5group"], group] if s])
+    fname = "{}.checkpoint_{}.h5".format(
+        os.path.splitext(params["sim_file"])[0], name.replace("/", "_")
+    )
+    return Checkpoint(
+        fname, params["checkpoint_interval"], fingerprint=get_fingerprint(params)
+    )
@@ -34,6 +34,7 @@ except ImportError:
     has_h5py = False
 
 import os
+import json
 import yaml
 
 try:
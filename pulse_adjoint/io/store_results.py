@@ -26,11 +26,117 @@
 # NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY OR FITNESS
 from .io_import import *
 from .utils import *
+from .writer import h5_lock, write_datasets_h5py
 
 
 def write_opt_results_to_h5(
-    h5group, params, for_result_opt, solver, opt_result, comm=dolfin.mpi_comm_world()
+    h5group,
+    params,
+    for_result_opt,
+    solver,
+    opt_result,
+    comm=dolfin.mpi_comm_world(),
+    state=None,
 ):
+    """Write the results of an optimization to the result file
+
+    :param str h5group: The group where the results are stored
+    :param params: Application parameters
+    :param dict for_result_opt: The forward result at the optimal control
+    :param solver: The solver used in the forward run
+    :param dict opt_result: The results from the optimization algorithm
+    :param comm: The MPI communicator
+    :param state: Function in the state space used when writing the states.
+                  If None, the state of the solver is used.
+
+    """
+    if state is None:
+        state = solver.state
+
+    write_opt_functions_to_h5(h5group, params, for_result_opt, state, comm)
+
+    compression = params["result_compression"]
+    dict2h5_hpc(
+        get_opt_results_data(for_result_opt, opt_result),
+        params["sim_file"],
+        h5group,
+        comm,
+        overwrite_file=False,
+        overwrite_group=False,
+        stack=params["stack_results"],
+        compression=None if compression == "none" else compression,
+    )
+
+    # Keep the index of the result file up to date
+    get_result_index(params["sim_file"]).update(comm)
+
+
+def submit_opt_results(
+    writer,
+    h5group,
+    params,
+    for_result_opt,
+    solver,
+    opt_result,
+    comm=dolfin.mpi_comm_world(),
+    state=None,
+):
+    """Write the results of an optimization using a writer
+    (see :class:`pulse_adjoint.io.AsyncResultWriter`).
+
+    If the writer is asynchronous, the values of the functions and
+    the remaining results are copied to arrays in the calling thread.
+    The writer thread then writes these arrays using h5py only, with
+    the functions in the same layout as :py:class:`dolfin.HDF5File`,
+    so that no dolfin objects are used from two threads. The index of
+    the result file is not updated, see
+    :func:`pulse_adjoint.io.utils.get_result_index`.
+
+    In parallel the writer is synchronous, since the writing is
+    collective, and this is the same as :func:`write_opt_results_to_h5`.
+
+    Arguments are the same as for :func:`write_opt_results_to_h5`.
+
+    """
+    if not writer.asynchronous:
+        writer.submit(
+            write_opt_results_to_h5,
+            h5group,
+            params,
+            for_result_opt,
+            solver,
+            opt_result,
+            comm,
+            state,
+        )
+        return
+
+    if state is None:
+        state = solver.state
+
+    with h5_lock:
+        prepare_opt_group(h5group, params, comm)
+
+    functions = collect_opt_functions(h5group, params, for_result_opt, state)
+    datasets = collect_datasets(
+        get_opt_results_data(for_result_opt, opt_result),
+        h5group,
+        stack=params["stack_results"],
+    )
+    compression = params["result_compression"]
+    writer.submit(
+        write_datasets_h5py,
+        params["sim_file"],
+        datasets,
+        None if compression == "none" else compression,
+        functions,
+    )
+
+
+def prepare_opt_group(h5group, params, comm):
+    """Create the directory of the result file,
+    and delete the group if it exists.
+    """
 
     h5name = params["sim_file"]
     logger.info("Save results to {}:{}".format(h5name, h5group))
@@ -38,37 +144,68 @@ def write_opt_results_to_h5(
     filedir = os.path.abspath(os.path.dirname(params["sim_file"]))
     if not os.path.exists(filedir) and comm.rank == 0:
         os.makedirs(filedir)
-        write_append = "w"
 
     if os.path.isfile(h5name):
         # Open the file in h5py
         check_and_delete(h5name, h5group, comm)
-        # Open the file in HDF5File format
-        open_file_format = "a"
 
-    else:
-        open_file_format = "w"
 
-    # Make sure to save the state as a function, and
-    # make sure that we don't destroy the dof-structure
-    # by first assigning the state to te correction function
-    # and then save it.
+def iter_opt_functions(h5group, params, for_result_opt, state):
+    """Yield the name and the function for the optimal control
+    and the states (and displacements) that are stored.
+
+    Make sure to save the state as a function, and
+    make sure that we don't destroy the dof-structure
+    by first assigning the state to te correction function
+    and then save it.
+    """
+    yield "/".join([h5group, "optimal_control"]), for_result_opt["optimal_control"]
+
+    # States
+    for i, w in enumerate(for_result_opt["states"]):
+
+        state.vector().zero()
+        state.vector().axpy(1.0, w.vector())
+        yield "/".join([h5group, "states/{}".format(i)]), state
+
+        if not params["store_displacement"]:
+            # The displacement is extracted from the state when read
+            continue
+
+        u, p = state.split(deepcopy=True)
+        yield "/".join([h5group, "displacement/{}".format(i)]), u
+        yield "/".join([h5group, "lagrange_multiplier/{}".format(i)]), p
+
+
+def write_opt_functions_to_h5(h5group, params, for_result_opt, state, comm):
+    """Delete the group if it exists, and write the optimal control
+    and the states (and displacements) to the result file.
+    """
+    prepare_opt_group(h5group, params, comm)
+    h5name = params["sim_file"]
+    open_file_format = "a" if os.path.isfile(h5name) else "w"
+
     with dolfin.HDF5File(comm, h5name, open_file_format) as h5file:
+        for name, f in iter_opt_functions(h5group, params, for_result_opt, state):
+            h5file.write(f, name)
 
-        h5file.write(
-            for_result_opt["optimal_control"], "/".join([h5group, "optimal_control"])
-        )
 
-        # States
-        for i, w in enumerate(for_result_opt["states"]):
+def collect_opt_functions(h5group, params, for_result_opt, state):
+    """Copy the values of the optimal control and the states (and
+    displacements) together with their layout, so that they can be
+    written in serial with
+    :func:`pulse_adjoint.io.writer.write_function_h5py`.
+    """
+    return [
+        (name, f.vector().get_local(), get_function_layout(f.function_space()))
+        for name, f in iter_opt_functions(h5group, params, for_result_opt, state)
+    ]
 
-            solver.state.vector().zero()
-            solver.state.vector().axpy(1.0, w.vector())
-            h5file.write(solver.state, "/".join([h5group, "states/{}".format(i)]))
 
-            u, p = solver.state.split(deepcopy=True)
-            h5file.write(u, "/".join([h5group, "displacement/{}".format(i)]))
-            h5file.write(p, "/".join([h5group, "lagrange_multiplier/{}".format(i)]))
+def get_opt_results_data(for_result_opt, opt_result):
+    """Return the dictionary with the results, other than the
+    functions, that are stored in the result file.
+    """
 
     data = {
         "initial_control": for_result_opt["initial_control"],
@@ -77,27 +214,16 @@ def write_opt_results_to_h5(
     }
 
     if "regularization" in for_result_opt:
-        data["regularization"] = for_result_opt["regularization"].results
+        data["regularization"] = for_result_opt["regularization"].get_results()
 
     for k, v in for_result_opt["optimization_targets"].items():
 
-        data[k] = v.results
+        data[k] = v.get_results()
 
         if hasattr(v, "weights_arr"):
             data[k]["weights"] = v.weights_arr
 
-    gathered_data = gather_dictionary(data)
-    numpy_dict_to_h5(
-        gathered_data,
-        h5name,
-        h5group,
-        comm,
-        overwrite_file=False,
-        overwrite_group=False,
-    )
-
-    # dict2h5_hpc(data, h5name, h5group, comm,
-    #             overwrite_file = False, overwrite_group = False)
+    return data
 
 
 if __name__ == "__main__":
@@ -27,21 +27,176 @@
 from .io_import import *
 
 
+class ResultIndex(object):
+    """A small sidecar index of a result file, that records which
+    groups exist in the file and the final pressure of every group
+    with boundary conditions (e.g the contract points).
+    The index is stored as JSON next to the result file
+    (`<sim_file>.index.json`), and is only valid as long as the
+    modification time and size of the result file are unchanged.
+    Otherwise it is rebuilt from the result file.
+
+    :param str h5name: Path to the result file
+    :param int depth: Groups up to this depth are indexed
+
+    """
+
+    def __init__(self, h5name, depth=3):
+        self.h5name = h5name
+        self.fname = h5name + ".index.json"
+        self.depth = depth
+        self._data = None
+
+    def _stat(self):
+        st = os.stat(self.h5name)
+        return {"mtime": st.st_mtime, "size": st.st_size}
+
+    def _is_valid(self, data):
+        return data is not None and data.get("file") == self._stat()
+
+    def build(self):
+        """Build the index from the result file
+        """
+        groups = []
+        pressures = {}
+
+        def visit(group, path, level):
+            for key in group.keys():
+                if not isinstance(group[key], h5py.Group):
+                    continue
+                p = "/".join([path, key]) if path else key
+                groups.append(p)
+                if key == "bcs" and "pressure" in group[key]:
+                    pressures[path] = float(np.array(group[key]["pressure"])[-1])
+                if level < self.depth:
+                    visit(group[key], p, level + 1)
+
+        with h5py.File(self.h5name, "r") as h5file:
+            visit(h5file, "", 1)
+
+        return {
+            "file": self._stat(),
+            "depth": self.depth,
+            "groups": sorted(groups),
+            "pressures": pressures,
+        }
+
+    def write(self, data, comm=dolfin.mpi_comm_world()):
+        """Write the index atomically (on process 0)
+        """
+        if comm.rank == 0:
+            tmp = self.fname + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.fname)
+
+    def update(self, comm=dolfin.mpi_comm_world()):
+        """Rebuild the index from the result file and write it
+        """
+        self._data = self.build()
+        self.write(self._data, comm)
+
+    @property
+    def data(self):
+
+        if self._is_valid(self._data):
+            return self._data
+
+        data = None
+        if os.path.isfile(self.fname):
+            try:
+                with open(self.fname, "r") as f:
+                    data = json.load(f)
+            except (IOError, ValueError):
+                data = None
+
+        if not self._is_valid(data) or data.get("depth") != self.depth:
+            logger.debug("Rebuild index for {}".format(self.h5name))
+            data = self.build()
+            try:
+                self.write(data)
+            except (IOError, OSError):
+                logger.debug("Unable to write index {}".format(self.fname))
+
+        self._data = data
+        return data
+
+    def has_group(self, h5group):
+        """Return True if the group exists in the result file
+        """
+        h5group = h5group.strip("/")
+        if h5group == "":
+            return False
+
+        if h5group.count("/") >= self.depth:
+            # Not indexed
+            with h5py.File(self.h5name, "r") as h5file:
+                return h5group in h5file
+
+        return h5group in self.data["groups"]
+
+    def pressure(self, h5group):
+        """Return the final pressure stored in the group, or None
+        """
+        return self.data["pressures"].get(h5group.strip("/"))
+
+
+_result_indices = {}
+
+
+def get_result_index(h5name):
+    """Return the (cached) index of the given result file.
+    See :class:`ResultIndex`
+    """
+    key = os.path.abspath(h5name)
+    if key not in _result_indices:
+        _result_indices[key] = ResultIndex(h5name)
+    return _result_indices[key]
+
+
+def check_group_exists(h5name, h5group):
+
+    if not os.path.exists(h5name):
+        return False
+
+    try:
+        return get_result_index(h5name).has_group(h5group)
+    except:
+        return False
+
+
+def get_simulated_pressure(params):
+    """
+    Get the last simulated pressure stored in
+    the result file specified by given parameters
+
+    :param dict params: adjoint contracion parameters
+    :returns: The final pressure
+    :rtype: float
+
+    """
+    group = "/".join(
+        [
+            ACTIVE_CONTRACTION,
+            CONTRACTION_POINT.format(params["active_contraction_iteration_number"]),
+        ]
+    )
+    return get_result_index(params["sim_file"]).pressure(group)
+
+
 def passive_inflation_exists(params):
 
     if not os.path.exists(params["sim_file"]):
         return False
 
-    h5file = open_h5py(params["sim_file"], "r")
+    index = get_result_index(params["sim_file"])
     key = PASSIVE_INFLATION_GROUP
 
     # Check if pv point is already computed
-    if key in list(h5file.keys()):
+    if index.has_group(key):
         logger.info(Text.green("Passive inflation, {}".format("fetched from database")))
-        h5file.close()
         return True
     logger.info(Text.blue("Passive inflation, {}".format("Run Optimization")))
-    h5file.close()
     return False
 
 
@@ -52,51 +207,42 @@ def contract_point_exists(params):
         raise IOError("Need state from passive inflation")
         return False
 
-    h5file = open_h5py(params["sim_file"], "r")
+    index = get_result_index(params["sim_file"])
     key1 = ACTIVE_CONTRACTION
     key2 = CONTRACTION_POINT.format(params["active_contraction_iteration_number"])
     key3 = PASSIVE_INFLATION_GROUP
 
-    if not key3 in list(h5file.keys()):
+    if not index.has_group(key3):
         logger.info(Text.red("Run passive inflation before systole"))
         raise IOError("Need state from passive inflation")
 
     if params["phase"] == PHASES[0]:
-        h5file.close()
         return False
 
-    if not key1 in list(h5file.keys()):
-        h5file.close()
+    if not index.has_group(key1):
         return False
 
-    try:
-
-        # Check if pv point is already computed
-        if key1 in list(h5file.keys()) and key2 in list(h5file[key1].keys()):
-            pressure = np.array(h5file[key1][key2]["bcs"]["pressure"])[-1]
-            logger.info(
-                Text.green(
-                    "Contract point {}, pressure = {:.3f} {}".format(
-                        params["active_contraction_iteration_number"],
-                        pressure,
-                        "fetched from database",
-                    )
-                )
-            )
-            h5file.close()
-            return True
+    # Check if pv point is already computed
+    pressure = index.pressure("/".join([key1, key2]))
+    if pressure is not None:
         logger.info(
-            Text.blue(
-                "Contract point {}, {}".format(
-                    params["active_contraction_iteration_number"], "Run Optimization"
+            Text.green(
+                "Contract point {}, pressure = {:.3f} {}".format(
+                    params["active_contraction_iteration_number"],
+                    pressure,
+                    "fetched from database",
                 )
             )
         )
-        h5file.close()
-        return False
-    except KeyError:
-        h5file.close()
-        return False
+        return True
+    logger.info(
+        Text.blue(
+            "Contract point {}, {}".format(
+                params["active_contraction_iteration_number"], "Run Optimization"
+            )
+        )
+    )
+    return False
 
 
 if has_h5py:
@@ -190,6 +336,200 @@ def check_and_delete(h5name, h5group, comm=dolfin.mpi_comm_world()):
                     del h5file[h5group]
 
 
+def write_vector_h5py(h5file, name, vec, comm=dolfin.mpi_comm_world()):
+    """Write a dolfin vector to a HDF5 dataset without
+    gathering it on every process.
+
+    If h5py is built with MPI support the dataset is preallocated
+    with the global size, and each process writes the slice that it
+    owns. Otherwise the vector is gathered on process 0 only, which
+    writes the dataset. In that case `h5file` is only used (and only
+    needs to be open) on process 0.
+
+    :param h5file: An open h5py file
+    :param str name: Name of the dataset
+    :param vec: The vector to be saved
+    :type vec: :py:class:`dolfin.GenericVector`
+    :param comm: The MPI communicator
+
+    """
+    if parallel_h5py:
+        dset = h5file.create_dataset(name, shape=(vec.size(),), dtype=float)
+        r0, r1 = vec.local_range()
+        dset[r0:r1] = vec.get_local()
+    else:
+        arr = vec.gather_on_zero()
+        if comm.rank == 0:
+            h5file.create_dataset(name, data=arr)
+
+
+_function_layouts = {}
+
+
+def get_function_layout(function_space):
+    """Return the datasets and attributes, other than the vector,
+    that :py:class:`dolfin.HDF5File` writes for a function in the given
+    space. They are obtained (once for each mesh and element) by writing
+    a function to a temporary file, so that a function can later be
+    written with h5py only, see :func:`pulse_adjoint.io.writer.write_function_h5py`.
+    The layout is only valid in serial.
+
+    :param function_space: The function space
+    :returns: A dictionary with the attributes of the group (`attrs`),
+              the datasets with their attributes (`datasets`) and
+              the attributes of the vector (`vector_attrs`)
+    :rtype: dict
+
+    """
+    key = (function_space.mesh().id(), function_space.element().signature())
+    if key in _function_layouts:
+        return _function_layouts[key]
+
+    import tempfile
+
+    fd, fname = tempfile.mkstemp(suffix=".h5")
+    os.close(fd)
+    try:
+        with dolfin.HDF5File(dolfin.mpi_comm_self(), fname, "w") as h5file:
+            h5file.write(dolfin.Function(function_space), "/function")
+
+        with h5py.File(fname, "r") as h5file:
+            group = h5file["function"]
+            layout = {
+                "attrs": dict(group.attrs),
+                "datasets": {
+                    k: (np.array(v), dict(v.attrs))
+                    for k, v in group.items()
+                    if k != "vector_0"
+                },
+                "vector_attrs": dict(group["vector_0"].attrs),
+            }
+    finally:
+        os.remove(fname)
+
+    _function_layouts[key] = layout
+    return layout
+
+
+def is_stack_leaf(f):
+    return isinstance(
+        f,
+        (dolfin.GenericVector, dolfin.Function, dolfin_adjoint.Function, np.ndarray),
+    )
+
+
+def stack_leaf_size(f):
+    if isinstance(f, np.ndarray):
+        return f.size if f.ndim == 1 else None
+    if isinstance(f, (dolfin.Function, dolfin_adjoint.Function)):
+        return f.vector().size()
+    return f.size()
+
+
+def get_stack_shape(val):
+    """Return the shape of the dataset obtained by stacking
+    the (possibly nested) list `val` of vectors, functions or
+    1D arrays. If the leaves does not have the same size, or
+    `val` cannot be stacked, return None.
+
+    :param val: Nested list of vectors, functions or arrays
+    :returns: The shape, or None
+    :rtype: tuple
+
+    """
+    if not isinstance(val, (list, tuple)) or len(val) == 0:
+        return None
+
+    if all(is_stack_leaf(f) for f in val):
+        sizes = set(stack_leaf_size(f) for f in val)
+        if len(sizes) == 1 and None not in sizes:
+            return (len(val), sizes.pop())
+        return None
+
+    shapes = [get_stack_shape(v) for v in val]
+    if shapes[0] is not None and all(s == shapes[0] for s in shapes):
+        return (len(val),) + shapes[0]
+    return None
+
+
+def iter_stack(val, index=()):
+    """Iterate over the leaves in a nested list,
+    and yield the index and the leaf.
+    """
+    for i, v in enumerate(val):
+        if is_stack_leaf(v):
+            yield index + (i,), v
+        else:
+            for item in iter_stack(v, index + (i,)):
+                yield item
+
+
+def write_stacked_h5py(
+    h5file, name, val, shape, comm=dolfin.mpi_comm_world(), compression=None
+):
+    """Write a nested list of vectors, functions or arrays
+    of equal size to one chunked dataset with the given shape.
+    The attribute `stacked_depth` of the dataset is the number
+    of stacked dimensions, so that the loaders can expand the
+    dataset into the same dictionary as if every leaf was stored
+    in a separate dataset.
+
+    :param h5file: An open h5py file
+    :param str name: Name of the dataset
+    :param val: Nested list of vectors, functions or arrays
+    :param tuple shape: Shape of the dataset, see :func:`get_stack_shape`
+    :param comm: The MPI communicator
+    :param str compression: Compression filter (serial h5py only)
+
+    """
+    if parallel_h5py and compression is not None:
+        logger.warning("Compression is not supported with parallel h5py")
+        compression = None
+
+    dset = None
+    if parallel_h5py or comm.rank == 0:
+        chunks = (1,) * (len(shape) - 1) + (max(1, min(shape[-1], 2 ** 16)),)
+        dset = h5file.create_dataset(
+            name, shape=shape, dtype=float, chunks=chunks, compression=compression
+        )
+        dset.attrs["stacked_depth"] = len(shape) - 1
+
+    for index, f in iter_stack(val):
+
+        if isinstance(f, np.ndarray):
+            # Arrays are the same on all processes
+            if comm.rank == 0:
+                dset[index] = f
+            continue
+
+        if isinstance(f, (dolfin.Function, dolfin_adjoint.Function)):
+            vec = f.vector()
+        else:
+            vec = f
+
+        if parallel_h5py:
+            r0, r1 = vec.local_range()
+            dset[index + (slice(r0, r1),)] = vec.get_local()
+        else:
+            arr = vec.gather_on_zero()
+            if comm.rank == 0:
+                dset[index] = arr
+
+
+def unstack_dataset(arr, depth):
+    """Expand the stacked dimensions of an array into
+    a dictionary with keys '0', '1', ...
+
+    :param arr: The array
+    :param int depth: Number of stacked dimensions
+    :returns: The nested dictionary
+
+    """
+    if depth == 0:
+        return arr
+    return {str(i): unstack_dataset(a, depth - 1) for i, a in enumerate(arr)}
+
+
 def dict2h5_hpc(
     d,
     h5name,
@@ -197,6 +537,8 @@ def dict2h5_hpc(
     comm=dolfin.mpi_comm_world(),
     overwrite_file=True,
     overwrite_group=True,
+    stack=False,
+    compression=None,
 ):
     """Create a HDF5 file and put the
     data in the dictionary in the 
@@ -206,14 +548,24 @@ def dict2h5_hpc(
     float, numpy.ndrray, list or 
     dolfin.GenericVector.
 
+    Vectors and functions are never gathered on every process.
+    With parallel h5py each process writes its own part of the
+    vector into a preallocated dataset, otherwise the vector
+    is gathered on process 0, which does all the writing.
+
     :param d: Dictionary to be saved
     :param h5fname: Name of the file where you want to save
+    :param bool stack: If True, (nested) lists of vectors, functions
+                       or arrays of equal size are stored in one dataset.
+                       See :func:`write_stacked_h5py`
+    :param str compression: Compression used for the stacked datasets
     
     
     """
     if overwrite_file:
-        if os.path.isfile(h5name):
+        if os.path.isfile(h5name) and comm.rank == 0:
             os.remove(h5name)
+        MPI.barrier(comm)
 
     file_mode = "a" if os.path.isfile(h5name) and not overwrite_file else "w"
 
@@ -223,111 +575,178 @@ def dict2h5_hpc(
     if file_mode == "a" and overwrite_group and h5group != "":
         check_and_delete(h5name, h5group, comm)
 
-    # First gather the whole dictionary as numpy arrays
+    # Without parallel h5py only the root process opens the file
+    if parallel_h5py or comm.rank == 0:
+        h5file = open_h5py(h5name, file_mode, comm)
+    else:
+        h5file = None
+
+    def write_array(name, v):
+        if parallel_h5py or comm.rank == 0:
+            h5file.create_dataset(name, data=v)
+
+    def dict2h5(a, group):
 
-    with open_h5py(h5name, file_mode, comm) as h5file:
+        for key, val in a.items():
 
-        def dict2h5(a, group):
+            subgroup = "/".join([group, str(key)])
 
-            for key, val in a.items():
+            if isinstance(val, dict):
+                dict2h5(val, subgroup)
 
-                subgroup = "/".join([group, str(key)])
+            elif isinstance(val, (list, np.ndarray, tuple)):
 
-                if isinstance(val, dict):
-                    dict2h5(val, subgroup)
+                if len(val) == 0:
+                    # If the list is empty we do nothing
+                    pass
 
-                elif isinstance(val, (list, np.ndarray, tuple)):
+                elif stack and get_stack_shape(val) is not None:
+                    write_stacked_h5py(
+                        h5file, subgroup, val, get_stack_shape(val), comm, compression
+                    )
 
-                    if len(val) == 0:
-                        # If the list is empty we do nothing
-                        pass
+                elif isinstance(val[0], (dolfin.Vector, dolfin.GenericVector)):
+                    for i, f in enumerate(val):
+                        write_vector_h5py(h5file, subgroup + "/{}".format(i), f, comm)
 
-                    elif isinstance(val[0], (dolfin.Vector, dolfin.GenericVector)):
-                        for i, f in enumerate(val):
+                elif isinstance(val[0], (dolfin.Function, dolfin_adjoint.Function)):
+                    for i, f in enumerate(val):
+                        write_vector_h5py(
+                            h5file, subgroup + "/{}".format(i), f.vector(), comm
+                        )
 
-                            if parallel_h5py:
-                                v = f.array()
-                                h5file.create_dataset(
-                                    subgroup + "/{}".format(i), data=v
-                                )
-                            else:
-                                v = gather_broadcast(f.array())
+                elif np.isscalar(val[0]):
+                    write_array(subgroup, np.array(val, dtype=float))
 
-                                if comm.rank == 0:
-                                    h5file.create_dataset(
-                                        subgroup + "/{}".format(i), data=v
-                                    )
+                elif (
+                    isinstance(val[0], list)
+                    or isinstance(val[0], np.ndarray)
+                    or isinstance(val[0], dict)
+                ):
+                    # Make this list of lists into a dictionary
+                    f = {str(i): v for i, v in enumerate(val)}
+                    dict2h5(f, subgroup)
 
-                    elif isinstance(val[0], (dolfin.Function, dolfin_adjoint.Function)):
-                        for i, f in enumerate(val):
+                else:
+                    raise ValueError("Unknown type {}".format(type(val[0])))
 
-                            if parallel_h5py:
-                                v = f.vector().array()
-                                h5file.create_dataset(
-                                    subgroup + "/{}".format(i), data=v
-                                )
-                            else:
-                                v = gather_broadcast(f.vector().array())
-                                if comm.rank == 0:
-                                    h5file.create_dataset(
-                                        subgroup + "/{}".format(i), data=v
-                                    )
+            elif isinstance(val, (float, int)):
+                write_array(subgroup, np.array([float(val)], dtype=float))
 
-                    elif isinstance(val[0], (float, int)):
+            elif isinstance(val, (dolfin.Vector, dolfin.GenericVector)):
+                write_vector_h5py(h5file, subgroup, val, comm)
 
-                        v = np.array(val, dtype=float)
-                        if parallel_h5py:
-                            h5file.create_dataset(subgroup, data=v)
-                        else:
-                            if comm.rank == 0:
-                                h5file.create_dataset(subgroup, data=v)
+            elif isinstance(val, (dolfin.Function, dolfin_adjoint.Function)):
+                write_vector_h5py(h5file, subgroup, val.vector(), comm)
 
-                    elif (
-                        isinstance(val[0], list)
-                        or isinstance(val[0], np.ndarray)
-                        or isinstance(val[0], dict)
-                    ):
-                        # Make this list of lists into a dictionary
-                        f = {str(i): v for i, v in enumerate(val)}
-                        dict2h5(f, subgroup)
+            else:
+                raise ValueError("Unknown type {}".format(type(val)))
 
-                    else:
-                        raise ValueError("Unknown type {}".format(type(val[0])))
+    try:
+        dict2h5(d, h5group)
+    finally:
+        if h5file is not None:
+            h5file.close()
 
-                elif isinstance(val, (float, int)):
-                    v = np.array([float(val)], dtype=float)
+    MPI.barrier(comm)
 
-                    if parallel_h5py:
-                        h5file.create_dataset(subgroup, data=v)
-                    else:
-                        if comm.rank == 0:
-                            h5file.create_dataset(subgroup, data=v)
 
-                elif isinstance(val, (dolfin.Vector, dolfin.GenericVector)):
+def collect_datasets(d, h5group="", stack=False):
+    """Copy the data in the dictionary into numpy arrays, with
+    the same datasets as written by :func:`dict2h5_hpc`. The
+    arrays can be written later without using any dolfin objects,
+    see :func:`pulse_adjoint.io.writer.write_datasets_h5py`.
+    Vectors are not gathered, so this should only be used in serial.
 
-                    if parallel_h5py:
-                        v = val.array()
-                        h5file.create_dataset(subgroup, data=v)
-                    else:
-                        v = gather_broadcast(val.array())
-                        if comm.rank == 0:
-                            h5file.create_dataset(subgroup, data=v)
+    :param d: Dictionary with the data
+    :param str h5group: The group where the data are stored
+    :param bool stack: If True, stack the lists as in :func:`dict2h5_hpc`
+    :returns: List of tuples with the name of the dataset, the array
+              and the number of stacked dimensions (None if the
+              dataset is not stacked)
+    :rtype: list
 
-                elif isinstance(val, (dolfin.Function, dolfin_adjoint.Function)):
+    """
 
-                    if parallel_h5py:
-                        v = val.vector().array()
-                        h5file.create_dataset(subgroup, data=v)
-                    else:
-                        v = gather_broadcast(val.vector().array())
-                        if comm.rank == 0:
-                            h5file.create_dataset(subgroup, data=v)
+    def get_array(f):
+        if isinstance(f, np.ndarray):
+            return np.array(f, dtype=float)
+        if isinstance(f, (dolfin.Function, dolfin_adjoint.Function)):
+            return f.vector().get_local()
+        return f.get_local()
+
+    datasets = []
+
+    def collect(a, group):
+
+        for key, val in a.items():
+
+            subgroup = "/".join([group, str(key)])
+
+            if isinstance(val, dict):
+                collect(val, subgroup)
+
+            elif isinstance(val, (list, np.ndarray, tuple)):
+
+                if len(val) == 0:
+                    # If the list is empty we do nothing
+                    pass
+
+                elif stack and get_stack_shape(val) is not None:
+                    shape = get_stack_shape(val)
+                    arr = np.zeros(shape, dtype=float)
+                    for index, f in iter_stack(val):
+                        arr[index] = get_array(f)
+                    datasets.append((subgroup, arr, len(shape) - 1))
+
+                elif isinstance(
+                    val[0],
+                    (
+                        dolfin.Vector,
+                        dolfin.GenericVector,
+                        dolfin.Function,
+                        dolfin_adjoint.Function,
+                    ),
+                ):
+                    for i, f in enumerate(val):
+                        datasets.append(
+                            (subgroup + "/{}".format(i), get_array(f), None)
+                        )
+
+                elif np.isscalar(val[0]):
+                    datasets.append((subgroup, np.array(val, dtype=float), None))
+
+                elif (
+                    isinstance(val[0], list)
+                    or isinstance(val[0], np.ndarray)
+                    or isinstance(val[0], dict)
+                ):
+                    # Make this list of lists into a dictionary
+                    f = {str(i): v for i, v in enumerate(val)}
+                    collect(f, subgroup)
 
                 else:
-                    raise ValueError("Unknown type {}".format(type(val)))
+                    raise ValueError("Unknown type {}".format(type(val[0])))
 
-        dict2h5(d, h5group)
-        comm.Barrier()
+            elif isinstance(val, (float, int)):
+                datasets.append((subgroup, np.array([float(val)], dtype=float), None))
+
+            elif isinstance(
+                val,
+                (
+                    dolfin.Vector,
+                    dolfin.GenericVector,
+                    dolfin.Function,
+                    dolfin_adjoint.Function,
+                ),
+            ):
+                datasets.append((subgroup, get_array(val), None))
+
+            else:
+                raise ValueError("Unknown type {}".format(type(val)))
+
+    collect(d, h5group)
+    return datasets
 
 
 def numpy_dict_to_h5(
@@ -384,3 +803,62 @@ def numpy_dict_to_h5(
             dict2h5(d, h5group)
 
     MPI.barrier(comm)
+
+
+def read_displacement(h5file, u, h5group, i, state=None, state_space="P_2:P_1"):
+    """Read the displacement for step `i` stored in `h5group`
+    into the function `u`. If the displacement is not stored
+    (see the parameter `store_displacement`) it is extracted
+    from the stored state.
+
+    :param h5file: An open file
+    :type h5file: :py:class:`dolfin.HDF5File`
+    :param u: The function to read the displacement into
+    :type u: :py:class:`dolfin.Function`
+    :param str h5group: The group with the results
+    :param int i: The step number
+    :param state: A function in the state space. If provided, and the
+                  displacement is not stored, the state is read into
+                  this function. Otherwise it is created using `state_space`
+    :type state: :py:class:`dolfin.Function`
+    :param str state_space: The state space, e.g 'P_2:P_1'
+    :returns: The displacement
+    :rtype: :py:class:`dolfin.Function`
+
+    """
+    group = "/".join([h5group, "displacement", str(i)])
+    if h5file.has_dataset(group):
+        h5file.read(u, group)
+        return u
+
+    logger.debug("Extract displacement from state {}".format(i))
+    state_group = "/".join([h5group, "states", str(i)])
+
+    if state is None:
+        if ":" not in state_space:
+            # The state is the displacement
+            h5file.read(u, state_group)
+            return u
+
+        mesh = u.function_space().mesh()
+        elements = []
+        for j, sp in enumerate(state_space.split(":")):
+            family, degree = sp.split("_")
+            if j == 0:
+                elements.append(
+                    dolfin.VectorElement(family, mesh.ufl_cell(), int(degree))
+                )
+            else:
+                elements.append(
+                    dolfin.FiniteElement(family, mesh.ufl_cell(), int(degree))
+                )
+        state = dolfin.Function(
+            dolfin.FunctionSpace(mesh, dolfin.MixedElement(elements))
+        )
+
+    h5file.read(state, state_group)
+    assigner = dolfin.FunctionAssigner(
+        u.function_space(), state.function_space().sub(0)
+    )
+    assigner.assign(u, state.sub(0))
+    return u
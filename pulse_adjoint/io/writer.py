@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# c) 2001-2017 Simula Research Laboratory ALL RIGHTS RESERVED
+# Authors: Henrik Finsberg
+# END-USER LICENSE AGREEMENT
+# PLEASE READ THIS DOCUMENT CAREFULLY. By installing or using this
+# software you agree with the terms and conditions of this license
+# agreement. If you do not accept the terms of this license agreement
+# you may not install or use this software.
+
+# Permission to use, copy, modify and distribute any part of this
+# software for non-profit educational and research purposes, without
+# fee, and without a written agreement is hereby granted, provided
+# that the above copyright notice, and this license agreement in its
+# entirety appear in all copies. Those desiring to use this software
+# for commercial purposes should contact Simula Research Laboratory AS: post@simula.no
+#
+# IN NO EVENT SHALL SIMULA RESEARCH LABORATORY BE LIABLE TO ANY PARTY
+# FOR DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES,
+# INCLUDING LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE
+# "PULSE-ADJOINT" EVEN IF SIMULA RESEARCH LABORATORY HAS BEEN ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE. THE SOFTWARE PROVIDED HEREIN IS
+# ON AN "AS IS" BASIS, AND SIMULA RESEARCH LABORATORY HAS NO OBLIGATION
+# TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
+# SIMULA RESEARCH LABORATORY MAKES NO REPRESENTATIONS AND EXTENDS NO
+# WARRANTIES OF ANY KIND, EITHER IMPLIED OR EXPRESSED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY OR FITNESS
+"""
+Write results in a background thread, so that the next
+contract point can be set up and solved while the results
+of the previous point are written to disk.
+"""
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from .io_import import *
+
+# The HDF5 library is in general not thread safe. Any access to a
+# HDF5 file from the main thread while a writer may be active
+# should be done while holding this lock.
+h5_lock = threading.RLock()
+
+
+def snapshot(obj):
+    """Return a copy of `obj` that is not changed when the
+    original object is changed. Functions and vectors are copied,
+    and dictionaries, lists and tuples are copied recursively.
+    Other objects (e.g floats and strings) are returned as is.
+
+    :param obj: The object to be copied
+    :returns: A copy of the object
+
+    """
+    if isinstance(obj, dolfin.Function):
+        f = dolfin.Function(obj.function_space(), name=obj.name())
+        f.vector().axpy(1.0, obj.vector())
+        return f
+
+    if isinstance(obj, dolfin.GenericVector):
+        return obj.copy()
+
+    if isinstance(obj, np.ndarray):
+        return obj.copy()
+
+    if isinstance(obj, dict):
+        return obj.__class__((k, snapshot(v)) for k, v in obj.items())
+
+    if isinstance(obj, (list, tuple)):
+        return obj.__class__(snapshot(v) for v in obj)
+
+    return obj
+
+
+def write_function_h5py(h5file, name, arr, layout):
+    """Write the values of a function to a HDF5 group using h5py
+    only, in the same layout as :py:class:`dolfin.HDF5File`, so that
+    the function can be read with :py:meth:`dolfin.HDF5File.read`.
+
+    :param h5file: An open h5py file
+    :param str name: Name of the group
+    :param arr: The (serial) values of the function
+    :type arr: :py:class:`numpy.ndarray`
+    :param dict layout: See :func:`pulse_adjoint.io.utils.get_function_layout`
+
+    """
+    group = h5file.create_group(name)
+    for k, v in layout["attrs"].items():
+        group.attrs[k] = v
+
+    for k, (data, attrs) in layout["datasets"].items():
+        dset = group.create_dataset(k, data=data)
+        for ak, av in attrs.items():
+            dset.attrs[ak] = av
+
+    dset = group.create_dataset("vector_0", data=arr)
+    for k, v in layout["vector_attrs"].items():
+        dset.attrs[k] = v
+
+
+def write_datasets_h5py(h5name, datasets, compression=None, functions=()):
+    """Write datasets and functions to a HDF5 file using h5py only,
+    so that this is safe to call from the writer thread. They are
+    collected in the main thread using
+    :func:`pulse_adjoint.io.utils.collect_datasets` and
+    :func:`pulse_adjoint.io.utils.get_function_layout`.
+
+    :param str h5name: Name of the file
+    :param list datasets: List of tuples with the name of the dataset,
+                          the array and the number of stacked dimensions
+    :param str compression: Compression used for the stacked datasets
+    :param list functions: List of tuples with the name of the group,
+                           the values and the layout of a function
+                           (see :func:`write_function_h5py`)
+
+    """
+    with h5py.File(h5name, "a") as h5file:
+        for name, arr, layout in functions:
+            write_function_h5py(h5file, name, arr, layout)
+
+        for name, arr, depth in datasets:
+
+            if depth is None:
+                h5file.create_dataset(name, data=arr)
+                continue
+
+            shape = arr.shape
+            chunks = (1,) * (len(shape) - 1) + (max(1, min(shape[-1], 2 ** 16)),)
+            dset = h5file.create_dataset(
+                name, data=arr, chunks=chunks, compression=compression
+            )
+            dset.attrs["stacked_depth"] = depth
+
+
+class AsyncResultWriter(object):
+    """Execute write jobs in a background thread.
+
+    Jobs are put in a bounded queue, so that the main thread waits
+    when there are `maxsize` jobs that are not yet written. Call
+    :meth:`flush` to wait for all jobs to be written, and :meth:`close`
+    to stop the thread. If a job fails, the exception is raised in the
+    main thread the next time a job is submitted, or when the writer
+    is flushed. Remaining jobs are then skipped.
+
+    In parallel, the writing to HDF5 is collective, and the jobs
+    are executed directly in the main thread.
+
+    :param int maxsize: Maximum number of jobs in the queue
+    :param comm: The MPI communicator
+
+    """
+
+    def __init__(self, maxsize=2, comm=dolfin.mpi_comm_world()):
+
+        self.comm = comm
+        self.asynchronous = comm.size == 1
+        self._error = None
+
+        if not self.asynchronous:
+            logger.debug("Results are written synchronously in parallel")
+            return
+
+        self._queue = queue.Queue(maxsize)
+        self._thread = threading.Thread(target=self._run, name="ResultWriter")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+
+                if self._error is None:
+                    func, args, kwargs = job
+                    with h5_lock:
+                        func(*args, **kwargs)
+
+            except Exception as ex:
+                logger.error("Writing of results failed: {}".format(ex))
+                self._error = ex
+
+            finally:
+                self._queue.task_done()
+
+    def _raise_error(self):
+
+        if self._error is not None:
+            ex, self._error = self._error, None
+            raise ex
+
+    def submit(self, func, *args, **kwargs):
+        """Write the results by calling `func(*args, **kwargs)`.
+        Make sure that the arguments are not changed before the
+        job is written, and that the job does not use any dolfin
+        objects (see :func:`write_datasets_h5py`).
+        """
+        self._raise_error()
+
+        if not self.asynchronous:
+            func(*args, **kwargs)
+            return
+
+        self._queue.put((func, args, kwargs))
+
+    def flush(self):
+        """Wait until all the submitted jobs are written
+        """
+        if self.asynchronous:
+            self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        """Flush the writer and stop the thread
+        """
+        if self.asynchronous and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._raise_error()
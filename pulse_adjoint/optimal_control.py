@@ -149,6 +149,40 @@ def minimize_1d(f, x0, **kwargs):
     return scipy_minimize_1d(f, **kwargs)
 
 
+def get_value_and_gradient_callbacks(rd):
+    """Get callables for the functional and the gradient that share
+    one call to `rd.value_and_gradient` for the same control.
+    This is used for optimization modules that require two
+    separate callbacks.
+
+    rd : :py:class`setup_optimization.MyReducedFunctional`
+        The reduced functional
+
+    *Returns*
+
+    callbacks : tuple
+        The functional and the gradient, (J, dJ)
+    """
+
+    last = {}
+
+    def evaluate(x):
+        x = np.asarray(x, dtype=float)
+        if "x" not in last or not np.array_equal(last["x"], x):
+            last["value"], last["gradient"] = rd.value_and_gradient(x)
+            last["x"] = np.copy(x)
+
+        return last["value"], last["gradient"]
+
+    def J(x, user_data=None):
+        return evaluate(x)[0]
+
+    def dJ(x, user_data=None):
+        return evaluate(x)[1]
+
+    return J, dJ
+
+
 def get_ipopt_options(rd, lb, ub, tol, max_iter, **kwargs):
     """Get options for IPOPT module (interior point algorithm)
 
@@ -190,8 +224,11 @@ def get_ipopt_options(rd, lb, ub, tol, max_iter, **kwargs):
         else:
             return empty
 
-    J = rd.__call__
-    dJ = rd.derivative
+    if kwargs.pop("value_and_gradient", False):
+        J, dJ = get_value_and_gradient_callbacks(rd)
+    else:
+        J = rd.__call__
+        dJ = rd.derivative
 
     nlp = pyipopt.create(
         ncontrols,  # length of control vector
@@ -287,9 +324,13 @@ def get_scipy_options(method, rd, lb, ub, tol, max_iter, **kwargs):
     else:
         callback = MyCallBack(rd, tol, max_iter)
 
+    # If jac is True the functional returns both the
+    # functional value and the gradient
+    value_and_gradient = kwargs.pop("value_and_gradient", False)
+
     options = {
         "method": method,
-        "jac": rd.derivative,
+        "jac": True if value_and_gradient else rd.derivative,
         "tol": tol,
         "callback": callback,
         "options": {
@@ -333,10 +374,21 @@ def get_pyOpt_options(method, rd, lb, ub, tol, max_iter, **kwargs):
 
     """
 
+    value_and_gradient = kwargs.pop("value_and_gradient", False)
+    last_gradient = {}
+
     def obj(x):
 
+        last_gradient.pop("dj", None)
         f, fail = rd(x, True)
 
+        if value_and_gradient and not fail:
+            # Compute the gradient from the same recording
+            try:
+                last_gradient["dj"] = rd.derivative(x)
+            except:
+                fail = True
+
         g = []
 
         return f, g, fail
@@ -344,7 +396,10 @@ def get_pyOpt_options(method, rd, lb, ub, tol, max_iter, **kwargs):
     def grad(x, f, g):
         fail = False
         try:
-            dj = rd.derivative()
+            if value_and_gradient:
+                dj = last_gradient["dj"]
+            else:
+                dj = rd.derivative()
         except:
             fail = True
 
@@ -523,14 +578,12 @@ class OptimalControl(object):
         elif module == "pyOpt":
             assert has_pyOpt, "pyOpt not installed"
             self.problem, self.options = get_pyOpt_options(
-                self.rd, lb, ub, tol, max_iter, **kwargs
+                method, self.rd, lb, ub, tol, max_iter, **kwargs
             )
 
         elif module == "ipopt":
             assert has_pyipopt, "IPOPT not installed"
-            self.solver = get_ipopt_options(
-                method, self.rd, lb, ub, tol, max_iter, **kwargs
-            )
+            self.solver = get_ipopt_options(self.rd, lb, ub, tol, max_iter, **kwargs)
 
         else:
             msg = (
@@ -573,7 +626,11 @@ class OptimalControl(object):
         else:
 
             if module == "scipy":
-                res = scipy_minimize(self.rd, self.x, **self.options)
+                if self.options["jac"] is True:
+                    fun = self.rd.value_and_gradient
+                else:
+                    fun = self.rd
+                res = scipy_minimize(fun, self.x, **self.options)
                 x = res["x"]
 
             elif module == "pyOpt":
@@ -607,7 +664,8 @@ class OptimalControl(object):
         opt_result["njev"] = self.rd.nr_der_calls
         opt_result["ncrash"] = self.rd.nr_crashes
         opt_result["run_time"] = run_time
-        opt_result["controls"] = self.rd.controls_lst
+        opt_result["controls"] = list(self.rd.controls_lst)
+        opt_result["control_indices"] = self.rd.controls_lst.indices()
         opt_result["func_vals"] = self.rd.func_values_lst
         opt_result["forward_times"] = self.rd.forward_times
         opt_result["backward_times"] = self.rd.backward_times
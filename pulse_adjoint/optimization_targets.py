@@ -52,6 +52,10 @@ class OptimizationTarget(object):
     """Base class for optimization target
     """
 
+    # If True, the saved targets and simulated values are
+    # stored as (gathered) numpy arrays instead of vectors
+    compact = False
+
     def __init__(self, mesh):
         """
         Initialize base class for optimization targets
@@ -96,15 +100,50 @@ class OptimizationTarget(object):
         self.results["target"] = []
         self.results["simulated"] = []
 
+    def _copy(self, f):
+        """Copy of the values of the function `f` that is saved.
+        In compact mode only the local values are saved, see
+        :meth:`get_results`.
+        """
+        if self.compact:
+            return f.vector().get_local()
+        return dolfin.Vector(f.vector())
+
+    def get_results(self):
+        """Return the saved results. In compact mode the local
+        target and simulated values of all processes are gathered,
+        so this should be called on all processes.
+        """
+        if not self.compact:
+            return self.results
+
+        def gather(v):
+            if isinstance(v, np.ndarray):
+                return numpy_mpi.gather_broadcast(v)
+            return [gather(vi) for vi in v]
+
+        results = dict(self.results)
+        for key in ["target", "simulated"]:
+            results[key] = gather(self.results[key])
+        return results
+
     def save(self):
         self.func_value += self.get_value()
         self.results["func_value"].append(self.func_value)
-        self.results["target"].append(dolfin.Vector(self.target_fun.vector()))
-        self.results["simulated"].append(dolfin.Vector(self.simulated_fun.vector()))
+        self.results["target"].append(self._copy(self.target_fun))
+        self.results["simulated"].append(self._copy(self.simulated_fun))
 
     def next_target(self, it, annotate=False):
         self.assign_target(self.data[it], annotate)
 
+    def clear(self):
+        """Remove the target data and the saved results, so that
+        the target can be reused with new data
+        """
+        self.data = []
+        self.results = {"func_value": [], "target": [], "simulated": []}
+        self.reset()
+
     def set_target_functions(self):
         """Initialize the functions
         """
@@ -187,6 +226,7 @@ class RegionalStrainTarget(OptimizationTarget):
         F_ref=None,
         approx="original",
         map_strain=False,
+        batched=False,
     ):
         """
         Initialize regional strain target
@@ -208,9 +248,13 @@ class RegionalStrainTarget(OptimizationTarget):
             Which strain tensor to use, e.g gradu, E, C, F
         F_ref: :py:class:`dolfin.Function`
             Tensor to map strains to reference
+        batched: bool
+            If True, the strains and the functional for all regions
+            are computed with one solve, rather than one solve per region.
         
         """
         self._name = "Regional Strain"
+        self._batched = batched
 
         assert tensor in ["gradu", "E"]
         self._tensor = tensor
@@ -264,6 +308,10 @@ class RegionalStrainTarget(OptimizationTarget):
 
         self.target_space = dolfin.VectorFunctionSpace(mesh, "R", 0, dim=self.nbasis)
         self.weight_space = dolfin.TensorFunctionSpace(mesh, "R", 0)
+        # Space holding the strains in all regions, used in batched mode
+        self.batch_space = dolfin.VectorFunctionSpace(
+            mesh, "R", 0, dim=self.nregions * self.nbasis
+        )
         self.dmu = dmu
 
         self.meshvols = [
@@ -290,8 +338,8 @@ class RegionalStrainTarget(OptimizationTarget):
         simulated = []
         for i in range(self.nregions):
 
-            target.append(dolfin.Vector(self.target_fun[i].vector()))
-            simulated.append(dolfin.Vector(self.simulated_fun[i].vector()))
+            target.append(self._copy(self.target_fun[i]))
+            simulated.append(self._copy(self.simulated_fun[i]))
 
         self.results["target"].append(target)
         self.results["simulated"].append(simulated)
@@ -346,9 +394,26 @@ class RegionalStrainTarget(OptimizationTarget):
             for i in range(self.nregions)
         ]
 
+        if self._batched:
+            self._simulated_batch = dolfin_adjoint.Function(
+                self.batch_space, name="Simulated Strains"
+            )
+            self._functional_batch = dolfin_adjoint.Function(
+                self.realspace, name="Strains Functional"
+            )
+            self._set_batch_matrix()
+
         self._set_weights()
         self._set_form()
 
+    def _region_components(self, f, i):
+        """Return the strain components in region number `i`
+        from a function in the batch space
+        """
+        return dolfin.as_vector(
+            [f[i * self.nbasis + j] for j in range(self.nbasis)]
+        )
+
     def _set_weights(self):
 
         for i in range(self.nregions):
@@ -358,13 +423,25 @@ class RegionalStrainTarget(OptimizationTarget):
 
     def _set_form(self):
 
+        if self._batched:
+            simulated = [
+                self._region_components(self._simulated_batch, i)
+                for i in range(self.nregions)
+            ]
+        else:
+            simulated = self.simulated_fun
+
         self._form = [
-            (dolfin.dot(self.weights[i], self.simulated_fun[i] - self.target_fun[i]))
-            ** 2
+            (dolfin.dot(self.weights[i], simulated[i] - self.target_fun[i])) ** 2
             for i in range(self.nregions)
         ]
 
     def get_value(self):
+        if self._batched:
+            return numpy_mpi.gather_broadcast(
+                self._functional_batch.vector().get_local()
+            )[0]
+
         return sum(
             [
                 numpy_mpi.gather_broadcast(self.functional[i].vector().get_local())[0]
@@ -419,6 +496,10 @@ class RegionalStrainTarget(OptimizationTarget):
                 [dolfin.inner(tensor * e, e) for e in self.crl_basis]
             )
 
+            if self._batched:
+                self._assign_simulated_batched(tensor_diag)
+                return
+
             # Make a project for dolfin-adjoint recording
             for i, r in enumerate(self.regions):
 
@@ -432,9 +513,64 @@ class RegionalStrainTarget(OptimizationTarget):
 
             logger.warning("No local basis exist. Regional strain cannot be computed")
 
+    def _assign_simulated_batched(self, tensor_diag):
+        """Compute the average strain in all regions at once.
+        The mass matrix of the regional projections is diagonal with
+        the region volumes on the diagonal, so the averages are the
+        right hand side divided by the region volumes. This is recorded
+        as a projection with the identity matrix (see
+        :meth:`_set_batch_matrix`), so that only the right hand side
+        is assembled in each call.
+        """
+
+        test = dolfin.TestFunction(self.batch_space)
+        L = list_sum(
+            [
+                dolfin.inner(self._region_components(test, i), tensor_diag)
+                / self.meshvols[i]
+                * self.dmu(int(r))
+                for i, r in enumerate(self.regions)
+            ]
+        )
+        b = dolfin_adjoint.assemble(L)
+        dolfin_adjoint.solve(
+            self._batch_matrix, self._simulated_batch.vector(), b, "cg", "jacobi"
+        )
+
+        # Copy the regional values for printing and storage
+        arr = numpy_mpi.gather_broadcast(self._simulated_batch.vector().get_local())
+        for i in range(self.nregions):
+            numpy_mpi.assign_to_vector(
+                self.simulated_fun[i].vector(),
+                arr[i * self.nbasis : (i + 1) * self.nbasis],
+            )
+
+    def _set_batch_matrix(self):
+        """Assemble the identity matrix on the batch space, which
+        is the mass matrix of the projection onto the diagonal
+        """
+        trial = dolfin.TrialFunction(self.batch_space)
+        test = dolfin.TestFunction(self.batch_space)
+        self._batch_matrix = dolfin_adjoint.assemble(
+            dolfin.inner(trial, test) / self.meshvol * dolfin.dx
+        )
+
     def assign_functional(self):
 
         logger.debug("Assign functional for {}".format(self._name))
+        if self._batched:
+            L = list_sum(
+                [
+                    self._test_r * self._form[i] / self.meshvols[i] * self.dmu(int(r))
+                    for i, r in enumerate(self.regions)
+                ]
+            )
+            dolfin_adjoint.solve(
+                self._trial_r * self._test_r / self.meshvol * dolfin.dx == L,
+                self._functional_batch,
+            )
+            return
+
         for i, r in enumerate(self.regions):
             dolfin_adjoint.solve(
                 self._trial_r * self._test_r / self.meshvol * dolfin.dx
@@ -443,6 +579,9 @@ class RegionalStrainTarget(OptimizationTarget):
             )
 
     def get_functional(self):
+        if self._batched:
+            return (self._functional_batch / self.meshvol) * dolfin.dx
+
         return (list_sum(self.functional) / self.meshvol) * dolfin.dx
 
 
@@ -651,6 +790,17 @@ class Regularization(object):
         self.func_value = 0.0
         self._value = 0.0
 
+    def clear(self):
+        """Remove the saved results
+        """
+        self.results = {"func_value": []}
+        self.reset()
+
+    def get_results(self):
+        """Return the saved results
+        """
+        return self.results
+
     def save(self):
 
         self.func_value += self.get_value()
@@ -26,6 +26,11 @@
 # NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY OR FITNESS
 import dolfin
 import numpy as np
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
 from ..setup_optimization import RegionalParameter, merge_control
 from ..adjoint_contraction_args import *
 
@@ -36,6 +36,7 @@ This will be included later.
 import os
 import h5py
 from copy import deepcopy
+from collections import OrderedDict
 import numpy as np
 import pulse
 from .args import *
@@ -272,7 +273,7 @@ def get_value_from_h5dict(d):
 
     if isinstance(d, np.ndarray):
         return d
-    elif isinstance(d, dict):
+    elif isinstance(d, Mapping):
         if len(list(d.keys())) == 0:
             logger.warning("Dictionary is empty")
             return []
@@ -314,7 +315,7 @@ def flatten_dict(d, toint=True):
             else:
                 dii = di[0]
 
-        elif isinstance(di, dict):
+        elif isinstance(di, Mapping):
             dii = {}
             for k, v in di.items():
                 dii[k] = flatten(v)
@@ -407,10 +408,151 @@ def get_unloaded_data(params):
     plt.show()
 
 
-def load_dict_from_h5(fname, h5group=""):
+def read_h5_dataset(dset):
+    """
+    Read a h5py dataset. Datasets that are stored stacked
+    (see :func:`pulse_adjoint.io.utils.write_stacked_h5py`)
+    are expanded into a dictionary with keys '0', '1', ...,
+    which is the same as if every item was stored in a
+    separate dataset.
+    """
+    from ..io.utils import unstack_dataset
+
+    depth = int(dset.attrs.get("stacked_depth", 0))
+    return unstack_dataset(np.array(dset), depth)
+
+
+class H5Dict(Mapping):
+    """
+    A lazy, read only dictionary view of a group in a HDF5 file.
+
+    The file is only opened when an item is accessed. Subgroups are
+    returned as new :class:`H5Dict` objects and datasets are read
+    using :func:`read_h5_dataset`. The most recently accessed items
+    are kept in a LRU cache that is shared between the group and
+    its subgroups. Items that are set on the object are stored in
+    memory, and shadows the items in the file. These are also shared
+    with the parent group by their path, so they are kept when a
+    subgroup is evicted from the cache.
+
+    Parameters
+    ----------
+    fname : str
+        Path to the HDF5 file
+    h5group : str
+        The group in the file
+    cache_size : int
+        Number of items kept in the cache
+
+    """
+
+    def __init__(self, fname, h5group="", cache_size=32, _cache=None, _overlay=None):
+
+        self.fname = fname
+        self.h5group = h5group.strip("/")
+        self.cache_size = cache_size
+        self._cache = OrderedDict() if _cache is None else _cache
+        self._overlay = {} if _overlay is None else _overlay
+
+        with h5py.File(fname, "r") as h5file:
+            group = h5file[self.h5group] if self.h5group else h5file
+            self._keys = [str(k) for k in group.keys()]
+
+    def _path(self, key):
+        return "/".join([self.h5group, key]) if self.h5group else key
+
+    def _overlay_keys(self):
+        for path in self._overlay:
+            group, _, key = path.rpartition("/")
+            if group == self.h5group:
+                yield key
+
+    def __getitem__(self, key):
+
+        if self._path(key) in self._overlay:
+            return self._overlay[self._path(key)]
+
+        if key not in self._keys:
+            raise KeyError(key)
+
+        path = self._path(key)
+        if path in self._cache:
+            value = self._cache.pop(path)
+            self._cache[path] = value
+            return value
+
+        with h5py.File(self.fname, "r") as h5file:
+            if isinstance(h5file[path], h5py._hl.group.Group):
+                value = None
+            else:
+                value = read_h5_dataset(h5file[path])
+
+        if value is None:
+            value = H5Dict(
+                self.fname, path, self.cache_size, self._cache, self._overlay
+            )
+
+        self._cache[path] = value
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+        return value
+
+    def __setitem__(self, key, value):
+        self._overlay[self._path(key)] = value
+
+    def __contains__(self, key):
+        return self._path(key) in self._overlay or key in self._keys
+
+    def __iter__(self):
+        for k in self._keys:
+            yield k
+        for k in self._overlay_keys():
+            if k not in self._keys:
+                yield k
+
+    def __len__(self):
+        return len(set(self._keys) | set(self._overlay_keys()))
+
+    def __repr__(self):
+        return "{}({}:{})".format(self.__class__.__name__, self.fname, self.h5group)
+
+    def read(self, key, slc=slice(None)):
+        """
+        Read a slice of a dataset without reading the full dataset.
+
+        Parameters
+        ----------
+        key : str
+            The name of the dataset. May be a path relative to
+            this group, e.g 'volume/simulated'
+        slc : slice or tuple
+            The slice to read
+
+        Returns
+        -------
+        arr : :py:class:`numpy.ndarray`
+            The values
+
+        """
+        with h5py.File(self.fname, "r") as h5file:
+            return h5file[self._path(key)][slc]
+
+    def to_dict(self):
+        """
+        Return the group as a (fully loaded) nested dictionary
+        """
+        return {
+            k: v.to_dict() if isinstance(v, H5Dict) else v for k, v in self.items()
+        }
+
+
+def load_dict_from_h5(fname, h5group="", lazy=False, cache_size=32):
     """
     Load the given h5file into
-    a dictionary
+    a dictionary. If `lazy` is True,
+    a :class:`H5Dict` that reads the items
+    when they are accessed is returned instead.
     """
     import h5py
 
@@ -425,6 +567,14 @@ def load_dict_from_h5(fname, h5group=""):
 
     with h5py.File(fname, "r") as h5file:
 
+        if h5group != "" and h5group not in h5file:
+            msg = "h5group {} does not exist in h5file {}".format(fname, h5group)
+            logger.warning(msg)
+            return {}
+
+        if lazy:
+            return H5Dict(fname, h5group, cache_size)
+
         def h52dict(hdf):
             if isinstance(hdf, h5py._hl.group.Group):
                 t = {}
@@ -433,18 +583,12 @@ def load_dict_from_h5(fname, h5group=""):
                     t[str(key)] = h52dict(hdf[key])
 
             elif isinstance(hdf, h5py._hl.dataset.Dataset):
-                t = np.array(hdf)
+                t = read_h5_dataset(hdf)
 
             return t
 
         if h5group != "":
-            if h5group in h5file:
-                d = h52dict(h5file[h5group])
-            else:
-                msg = "h5group {} does not exist in h5file {}".format(fname,
-                                                                      h5group)
-                logger.warning(msg)
-                return {}
+            d = h52dict(h5file[h5group])
         else:
             d = h52dict(h5file)
 
@@ -567,7 +711,7 @@ def get_data(params, patient=None):
         raise IOError("File {} does not exist".format(params["sim_file"]))
 
     ####### Containers and keys
-    all_data = load_dict_from_h5(params["sim_file"])
+    all_data = load_dict_from_h5(params["sim_file"], lazy=True)
 
     passive = (
         {} if "passive_inflation" not in all_data else all_data["passive_inflation"]
@@ -835,23 +979,25 @@ def get_data(params, patient=None):
             for k in list(opt_res.keys()):
 
                 if k in h5file[passive_group]["optimization_results"]:
-                    data["passive_optimization_results"][k] = h5file[passive_group][
-                        "optimization_results"
-                    ][k][:]
+                    data["passive_optimization_results"][k] = read_h5_dataset(
+                        h5file[passive_group]["optimization_results"][k]
+                    )
 
         for p in range(len(active_keys)):
 
             if active_group.format(p) in h5file:
                 opt_res_ = deepcopy(opt_res)
                 for k in list(opt_res.keys()):
-                    opt_res_[k] = h5file[active_group.format(p)][
-                        "optimization_results"
-                    ][k][:]
+                    opt_res_[k] = read_h5_dataset(
+                        h5file[active_group.format(p)]["optimization_results"][k]
+                    )
 
                 data["active_optimization_results"][
                     "contract_point_{}".format(p)
                 ] = opt_res_
 
+    from ..io.utils import read_displacement
+
     with dolfin.HDF5File(dolfin.mpi_comm_world(), params["sim_file"], "r") as h5file:
 
         it = 0
@@ -874,7 +1020,7 @@ def get_data(params, patient=None):
 
             if not it in interpolation_points:
                 h5file.read(state, "/".join([passive_group, "states", str(p)]))
-                h5file.read(u, "/".join([passive_group, "displacement", str(p)]))
+                read_displacement(h5file, u, passive_group, p, state)
 
                 data["displacements"].append(dolfin.Vector(u.vector()))
                 data["states"].append(dolfin.Vector(state.vector()))
@@ -886,7 +1032,7 @@ def get_data(params, patient=None):
 
             if not it in interpolation_points:
                 h5file.read(state, "/".join([active_group.format(p), "states/0"]))
-                h5file.read(u, "/".join([active_group.format(p), "displacement/0"]))
+                read_displacement(h5file, u, active_group.format(p), 0, state)
                 h5file.read(
                     gamma, "/".join([active_group.format(p), "optimal_control"])
                 )
@@ -107,7 +107,7 @@ class PostProcess(object):
 
         self._results = {}
         self._features = {}
-        self._data = load.load_dict_from_h5(fname)
+        self._data = load.load_dict_from_h5(fname, lazy=True)
 
         self.set_feature_keys()
 
@@ -156,7 +156,7 @@ class PostProcess(object):
         def listize(dic):
             d1 = {}
             for k, v in list(dic.items()):
-                if isinstance(v, dict):
+                if isinstance(v, Mapping):
                     d1[k] = listize(v)
                 elif isinstance(v, np.ndarray):
                     d1[k] = v.tolist()
@@ -29,8 +29,32 @@ to compute the different features that we want to visualise.
 # SIMULA RESEARCH LABORATORY MAKES NO REPRESENTATIONS AND EXTENDS NO
 # WARRANTIES OF ANY KIND, EITHER IMPLIED OR EXPRESSED, INCLUDING, BUT
 # NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY OR FITNESS
+from collections import OrderedDict
+
 from .args import *
 
+# Number of region average operators and volume evaluators that
+# are cached. Each of them keeps the function spaces, forms and
+# factorized matrices for one mesh alive.
+MAX_CACHED_OPERATORS = 4
+
+
+def _get_cached(cache, key, create):
+    """Return `cache[key]`, and create it with `create()` if it does
+    not exist. The least recently used entry is removed when the cache
+    has more than `MAX_CACHED_OPERATORS` entries.
+    """
+    if key in cache:
+        value = cache.pop(key)
+    else:
+        value = create()
+
+    cache[key] = value
+    while len(cache) > MAX_CACHED_OPERATORS:
+        cache.popitem(last=False)
+
+    return value
+
 
 def default_mechanical_features():
     from itertools import product
@@ -168,6 +192,90 @@ def compute_apical_registration(mesh, patient, endo_surf_apex):
     return u
 
 
+class RegionAverage(object):
+    """
+    Linear operator that maps the degrees of freedom of a
+    scalar function to the average value in each region.
+    The operator is assembled once, and can then be applied
+    to many functions at once.
+
+    Parameters
+    ----------
+    dx : :py:class:`dolfin.Measure`
+        Volume measure marked according to the regions
+    V : :py:class:`dolfin.FunctionSpace`
+        A scalar function space
+    regions : list
+        The region markers
+
+    """
+
+    def __init__(self, dx, V, regions):
+
+        from pulse.numpy_mpi import gather_broadcast
+
+        v = dolfin.TestFunction(V)
+        self.regions = list(regions)
+        self.meshvols = np.array(
+            [dolfin.assemble(dolfin.Constant(1.0) * dx(i)) for i in regions]
+        )
+
+        rows = np.array(
+            [
+                gather_broadcast(dolfin.assemble(v * dx(i)).get_local()) / vol
+                for i, vol in zip(regions, self.meshvols)
+            ]
+        )
+
+        try:
+            from scipy.sparse import csr_matrix
+        except ImportError:
+            self.matrix = rows
+        else:
+            self.matrix = csr_matrix(rows)
+
+    def __call__(self, arr):
+        """Compute the regional averages
+
+        Parameters
+        ----------
+        arr : :py:class:`numpy.ndarray`
+            Array with shape (ndofs,) or (ntimes, ndofs)
+
+        Returns
+        -------
+        :py:class:`numpy.ndarray`
+            The averages with shape (nregions,) or (ntimes, nregions)
+        """
+        arr = np.asarray(arr)
+        return np.asarray(self.matrix.dot(arr.T)).T
+
+    def global_average(self, arr):
+        """Compute the volume weighted average over all regions
+        """
+        return self(arr).dot(self.meshvols) / np.sum(self.meshvols)
+
+
+_region_average_operators = OrderedDict()
+
+
+def get_region_average(dx, V, regions):
+    """Get a (cached) :class:`RegionAverage` for the given
+    measure, function space and regions. Only the most
+    recently used operators are kept.
+    """
+
+    key = (
+        V.mesh().id(),
+        str(V.ufl_element()),
+        dx.subdomain_data().id(),
+        tuple(int(r) for r in regions),
+    )
+    return _get_cached(
+        _region_average_operators, key, lambda: RegionAverage(dx, V, regions)
+    )
+
+
 def get_regional(dx, fun, fun_lst, regions=list(range(1, 18)), T_ref=1.0):
     """Return the average value of the function 
     in each segment
@@ -185,15 +293,8 @@ def get_regional(dx, fun, fun_lst, regions=list(range(1, 18)), T_ref=1.0):
         else:
             return np.multiply(T_ref, fun_lst)
 
-    meshvols = get_meshvols(dx, regions)
-    lst = []
-    for f in fun_lst:
-        fun.vector()[:] = f
-        lst_i = []
-        for t, i in enumerate(regions):
-            lst_i.append(T_ref * dolfin.assemble((fun / meshvols[t]) * dx(i)))
-
-        lst.append(lst_i)
+    op = get_region_average(dx, fun.function_space(), regions)
+    lst = T_ref * op(np.array(fun_lst))
 
     if len(fun_lst) == 1:
         return np.array(lst[0])
@@ -240,6 +341,10 @@ def get_global(dx, fun, fun_lst, regions=list(range(1, 18)), T_ref=1.0):
 
     """
 
+    if fun.value_size() == 1:
+        op = get_region_average(dx, fun.function_space(), regions)
+        return list(T_ref * op.global_average(np.array(fun_lst)))
+
     meshvols = []
 
     for i in regions:
@@ -251,14 +356,7 @@ def get_global(dx, fun, fun_lst, regions=list(range(1, 18)), T_ref=1.0):
     for f in fun_lst:
 
         fun.vector()[:] = f
-
-        if fun.value_size() > 1:
-            fun_tot = np.sum(np.multiply(fun.vector().array(), meshvols))
-
-        else:
-            fun_tot = 0
-            for i in regions:
-                fun_tot += dolfin.assemble((fun) * dx(i))
+        fun_tot = np.sum(np.multiply(fun.vector().array(), meshvols))
 
         fun_mean.append(T_ref * fun_tot / meshvol)
 
@@ -330,6 +428,89 @@ def compute_inner_cavity_volume(mesh, ffun, marker, u=None, approx="project"):
     return target.simulated_fun.vector().array()[0]
 
 
+class VolumeEvaluator(object):
+    """
+    Compute the cavity volume for a series of displacements.
+    The boundary integral is compiled once, and the volume
+    is assembled directly as a scalar for each displacement.
+
+    Parameters
+    ----------
+    mesh : :py:class:`dolfin.Mesh`
+        The mesh
+    ffun : :py:class:`dolfin.MeshFunction`
+        Facet function
+    marker : int
+        The marker of the endocardium
+    approx : str
+        How to handle the displacement before computing the volume,
+        'project', 'interpolate' (onto a CG 1 space) or 'original'
+
+    """
+
+    def __init__(self, mesh, ffun, marker, approx="project"):
+
+        assert approx in ["project", "interpolate", "original"]
+        self.approx = approx
+
+        self.u = dolfin.Function(dolfin.VectorFunctionSpace(mesh, "CG", 2))
+
+        if approx == "original":
+            u_int = self.u
+        else:
+            V = dolfin.VectorFunctionSpace(mesh, "CG", 1)
+            self.u_int = dolfin.Function(V)
+            u_int = self.u_int
+
+            if approx == "project":
+                # The mass matrix is the same for all displacements
+                v = dolfin.TestFunction(V)
+                M = dolfin.assemble(dolfin.inner(dolfin.TrialFunction(V), v) * dolfin.dx)
+                self._solver = dolfin.LUSolver(M)
+                self._solver.parameters["reuse_factorization"] = True
+                self._L = dolfin.Form(dolfin.inner(self.u, v) * dolfin.dx)
+
+        X = dolfin.SpatialCoordinate(mesh)
+        N = dolfin.FacetNormal(mesh)
+        dS = dolfin.Measure("exterior_facet", subdomain_data=ffun, domain=mesh)(marker)
+
+        F = dolfin.grad(u_int) + dolfin.Identity(3)
+        J = dolfin.det(F)
+        self._form = dolfin.Form(
+            (-1.0 / 3.0) * dolfin.dot(X + u_int, J * dolfin.inv(F).T * N) * dS
+        )
+
+    def __call__(self, u_arr):
+        """Return the volume for the displacement with
+        degrees of freedom `u_arr`
+        """
+
+        self.u.vector()[:] = u_arr
+
+        if self.approx == "project":
+            self._solver.solve(self.u_int.vector(), dolfin.assemble(self._L))
+        elif self.approx == "interpolate":
+            self.u_int.interpolate(self.u)
+
+        return dolfin.assemble(self._form)
+
+
+_volume_evaluators = OrderedDict()
+
+
+def get_volume_evaluator(mesh, ffun, marker, approx="project"):
+    """Get a (cached) :class:`VolumeEvaluator`. Only the
+    most recently used evaluators are kept.
+    """
+
+    key = (mesh.id(), ffun.id(), int(marker), approx)
+    return _get_cached(
+        _volume_evaluators,
+        key,
+        lambda: VolumeEvaluator(mesh, ffun, marker, approx),
+    )
+
+
 def get_volumes(disps, patient, chamber="lv", approx="project"):
 
     if chamber == "lv":
@@ -350,25 +531,14 @@ def get_volumes(disps, patient, chamber="lv", approx="project"):
 
         marker = patient.markers["ENDO_RV"][0]
 
-    V = dolfin.VectorFunctionSpace(patient.mesh, "CG", 2)
-    u = dolfin.Function(V)
-
-    ffun = patient.ffun
+    volume = get_volume_evaluator(patient.mesh, patient.ffun, marker, approx)
 
-    volumes = []
-    if isinstance(disps, dict):
+    if isinstance(disps, Mapping):
         times = sorted(list(disps.keys()), key=asint)
     else:
         times = list(range(len(disps)))
-    for t in times:
-        us = disps[t]
-        u.vector()[:] = us
-
-        volumes.append(
-            compute_inner_cavity_volume(patient.mesh, ffun, marker, u, approx)
-        )
 
-    return volumes
+    return [volume(disps[t]) for t in times]
 
 
 def get_regional_strains(
@@ -404,7 +574,7 @@ def get_regional_strains(
                 idx = patient.passive_filling_duration - 1
 
         u0 = dolfin.Function(dolfin.VectorFunctionSpace(patient.mesh, "CG", 2))
-        if isinstance(disps, dict):
+        if isinstance(disps, Mapping):
             u0.vector()[:] = disps[str(idx)]
         else:
             u0.vector()[:] = disps[idx]
@@ -457,7 +627,7 @@ def get_regional_strains(
     V = dolfin.VectorFunctionSpace(patient.mesh, "CG", 2)
     u = dolfin.Function(V)
 
-    if isinstance(disps, dict):
+    if isinstance(disps, Mapping):
         times = sorted(list(disps.keys()), key=asint)
     else:
         times = list(range(len(disps)))
@@ -1191,7 +1361,7 @@ def make_simulation(params, features, outdir, patient, data):
     moving_mesh = dolfin.Mesh(mesh)
 
     # The time stamps
-    if isinstance(data["gammas"], dict):
+    if isinstance(data["gammas"], Mapping):
         times = sorted(list(data["gammas"].keys()), key=asint)
     else:
         times = list(range(len(data["gammas"])))
@@ -1335,7 +1505,7 @@ def make_refined_simulation(params, features, outdir, patient, data):
     moving_mesh = dolfin.Mesh(mesh)
 
     # The time stamps
-    if isinstance(data["gammas"], dict):
+    if isinstance(data["gammas"], Mapping):
         times = sorted(list(data["gammas"].keys()), key=asint)
     else:
         times = list(range(len(data["gammas"])))
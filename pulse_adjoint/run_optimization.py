@@ -25,6 +25,8 @@
 # WARRANTIES OF ANY KIND, EITHER IMPLIED OR EXPRESSED, INCLUDING, BUT
 # NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY OR FITNESS
 
+import os
+
 import dolfin
 import dolfin_adjoint
 
@@ -57,8 +59,12 @@ from .utils import (
 from .forward_runner import ActiveForwardRunner, PassiveForwardRunner
 from .optimization_targets import *
 from .adjoint_contraction_args import *
-from .io import write_opt_results_to_h5
+from .io import write_opt_results_to_h5, read_displacement, get_checkpoint
+from .io.store_results import submit_opt_results
+from .io.utils import get_result_index
+from .io.writer import AsyncResultWriter, h5_lock, snapshot
 from .optimal_control import OptimalControl
+from .trace import tracer
 
 
 def assimilate(geometry, data, params):
@@ -276,7 +282,13 @@ def run_passive_optimization_step(
 
     # Initialize MyReducedFuctional
     rd = MyReducedFunctional(
-        for_run, paramvec, relax=params["passive_relax"], verbose=params["verbose"]
+        for_run,
+        paramvec,
+        relax=params["passive_relax"],
+        verbose=params["verbose"],
+        cache_size=params["Optimization_parameters"]["cache_size"],
+        cache_policy=params["Optimization_parameters"]["cache_policy"],
+        history_size=params["Optimization_parameters"]["history_size"],
     )
 
     return rd, paramvec
@@ -299,119 +311,221 @@ def run_active_optimization(params, patient):
     # Load patient data, and set up the simulation
     measurements, solver_parameters, pressure, gamma = setup_simulation(params, patient)
 
+    # Write the results in the background while the next point is solved
+    writer = AsyncResultWriter() if params["async_store"] else None
+    # Optimal state of the previous point, used as initial state
+    # for the next point instead of reading it from the result file
+    state = None
+    # Reuse the targets and the forward runner between the points
+    session = (
+        ActiveOptimizationSession() if params["persistent_active_session"] else None
+    )
+
     # Loop over contract points
     i = 0
     logger.info("Number of contract points: {}".format(patient.num_contract_points))
 
-    while i < patient.num_contract_points:
-        params["active_contraction_iteration_number"] = i
+    try:
+        while i < patient.num_contract_points:
+            params["active_contraction_iteration_number"] = i
+
+            # Points after a point that is solved in this run are not
+            # checked, since the results might not be written yet
+            skip_check = writer is not None and state is not None
+            if skip_check or not contract_point_exists(params):
+
+                # Number of times we have interpolated in order
+                # to be able to change the pressure
+                attempts = 0
+                pressure_change = False
+
+                while not pressure_change and attempts < 8:
+
+                    try:
+                        rd, gamma = run_active_optimization_step(
+                            params,
+                            patient,
+                            solver_parameters,
+                            measurements,
+                            pressure,
+                            gamma,
+                            initial_state=state,
+                            session=session,
+                        )
+                    except UnableToChangePressureExeption:
+                        logger.info("Unable to change pressure. Exception caught")
+
+                        logger.info("Lets interpolate. Add one extra point")
+                        patient.interpolate_data(i + patient.passive_filling_duration - 1)
+
+                        # Update the measurements
+                        measurements = get_measurements(params, patient)
+
+                        attempts += 1
+
+                    else:
+                        pressure_change = True
+
+                        # If you want to apply a different initial guess than
+                        # the pevious value, assign this now and evaluate.
+
+                        if params["initial_guess"] == "zero":
+                            zero = get_constant(gamma.value_size(), gamma.value_rank(), 0.0)
+
+                            g = Function(gamma.function_space())
+                            g.assign(zero)
+                            rd(g)
+                        elif params["initial_guess"] == "smooth":
+
+                            # We find a constant that represents the previous state
+
+                            if params["gamma_space"] == "regional":
+
+                                # Sum all regional values with weights given by the size of the regions
+                                meshvols = [
+                                    assemble(
+                                        (1.0)
+                                        * dx(
+                                            domain=patient.mesh, subdomain_data=patient.sfun
+                                        )(int(r))
+                                    )
+                                    for r in set(
+                                        numpy_mpi.gather_broadcast(patient.sfun.array())
+                                    )
+                                ]
+                                meshvol = sum(meshvols)
+                                g_arr = numpy_mpi.gather_broadcast(
+                                    gamma.vector().get_local()
+                                )
+                                val = sum(np.multiply(g_arr, meshvols)) / float(meshvol)
+                                c = get_constant(
+                                    gamma.value_size(), gamma.value_rank(), val
+                                )
 
-        if not contract_point_exists(params):
+                            else:
 
-            # Number of times we have interpolated in order
-            # to be able to change the pressure
-            attempts = 0
-            pressure_change = False
+                                # Project the activation parameter onto the real line
+                                g_proj = dolfin_adjoint.project(
+                                    gamma, dolfin.FunctionSpace(patient.mesh, "R", 0)
+                                )
+                                val = numpy_mpi.gather_broadcast(
+                                    g_proj.vector().get_local()
+                                )[0]
+                                c = get_constant(
+                                    gamma.value_size(), gamma.value_rank(), val
+                                )
 
-            while not pressure_change and attempts < 8:
+                            g = Function(gamma.function_space())
+                            g.assign(c)
+                            rd(g)
 
-                try:
-                    rd, gamma = run_active_optimization_step(
-                        params,
-                        patient,
-                        solver_parameters,
-                        measurements,
-                        pressure,
-                        gamma,
-                    )
-                except UnableToChangePressureExeption:
-                    logger.info("Unable to change pressure. Exception caught")
-
-                    logger.info("Lets interpolate. Add one extra point")
-                    patient.interpolate_data(i + patient.passive_filling_duration - 1)
+                        logger.info("\nSolve optimization problem.......")
+                        solve_oc_problem(params, rd, gamma, writer=writer)
+                        # Keep the optimal state in memory, so that the next
+                        # point does not read it from the result file
+                        if writer is not None or session is not None:
+                            state = snapshot(rd.for_res["states"][0])
+                        dolfin_adjoint.adj_reset()
 
-                    # Update the measurements
-                    measurements = get_measurements(params, patient)
+                if not pressure_change:
+                    raise RuntimeError("Unable to increasure")
 
-                    attempts += 1
+            else:
 
-                else:
-                    pressure_change = True
+                # Load the state of this point from the result file
+                state = None
 
-                    # If you want to apply a different initial guess than
-                    # the pevious value, assign this now and evaluate.
+                # Make sure to do interpolation if that was done earlier
+                plv = get_simulated_pressure(params)
+                if not plv == measurements["pressure"][i + 1]:
+                    logger.info("Interpolate")
+                    patient.interpolate_data(i + patient.passive_filling_duration - 1)
+                    measurements = get_measurements(params, patient)
+                    i -= 1
+            i += 1
 
-                    if params["initial_guess"] == "zero":
-                        zero = get_constant(gamma.value_size(), gamma.value_rank(), 0.0)
+    finally:
+        # Make sure that all results are written
+        if writer is not None:
+            writer.close()
+            # The index is not updated by the writer thread
+            if os.path.isfile(params["sim_file"]):
+                get_result_index(params["sim_file"]).update()
 
-                        g = Function(gamma.function_space())
-                        g.assign(zero)
-                        rd(g)
-                    elif params["initial_guess"] == "smooth":
 
-                        # We find a constant that represents the previous state
+class ActiveOptimizationSession(object):
+    """
+    The optimization targets and the forward runner of the active
+    phase. They are built for the first contract point, and reused
+    for the following points, where only the target data, the
+    pressure and the initial state are changed.
+    """
 
-                        if params["gamma_space"] == "regional":
+    def __init__(self):
+        self.for_run = None
 
-                            # Sum all regional values with weights given by the size of the regions
-                            meshvols = [
-                                assemble(
-                                    (1.0)
-                                    * dx(
-                                        domain=patient.mesh, subdomain_data=patient.sfun
-                                    )(int(r))
-                                )
-                                for r in set(
-                                    numpy_mpi.gather_broadcast(patient.sfun.array())
-                                )
-                            ]
-                            meshvol = sum(meshvols)
-                            g_arr = numpy_mpi.gather_broadcast(
-                                gamma.vector().get_local()
-                            )
-                            val = sum(np.multiply(g_arr, meshvols)) / float(meshvol)
-                            c = get_constant(
-                                gamma.value_size(), gamma.value_rank(), val
-                            )
-
-                        else:
-
-                            # Project the activation parameter onto the real line
-                            g_proj = dolfin_adjoint.project(
-                                gamma, dolfin.FunctionSpace(patient.mesh, "R", 0)
-                            )
-                            val = numpy_mpi.gather_broadcast(
-                                g_proj.vector().get_local()
-                            )[0]
-                            c = get_constant(
-                                gamma.value_size(), gamma.value_rank(), val
-                            )
-
-                        g = Function(gamma.function_space())
-                        g.assign(c)
-                        rd(g)
-
-                    logger.info("\nSolve optimization problem.......")
-                    solve_oc_problem(params, rd, gamma)
-                    dolfin_adjoint.adj_reset()
-
-            if not pressure_change:
-                raise RuntimeError("Unable to increasure")
+    def get_forward_runner(
+        self,
+        params,
+        solver_parameters,
+        measurements,
+        pressure,
+        gamma,
+        mshfun=None,
+        initial_state=None,
+    ):
+        """Return the forward runner for the current contract point
+
+        :param params: Application parameters
+        :param solver_parameters: Solver parameters
+        :param measurements: The measurements
+        :param pressure: The pressure
+        :param gamma: The active contraction parameter
+        :param mshfun: Mesh function for regional gamma
+        :param initial_state: The optimal state of the previous point
+        :returns: The forward runner
+        :rtype: :py:class:`pulse_adjoint.forward_runner.ActiveForwardRunner`
+
+        """
+        if self.for_run is None:
+            optimization_targets, bcs = load_targets(
+                params, solver_parameters, measurements, mshfun
+            )
+            self.for_run = ActiveForwardRunner(
+                solver_parameters,
+                pressure,
+                bcs,
+                optimization_targets,
+                params,
+                gamma,
+                initial_state=initial_state,
+            )
+            return self.for_run
 
-        else:
+        logger.debug(Text.blue("Reuse optimization targets"))
+        dolfin.parameters["adjoint"]["stop_annotating"] = True
+
+        optimization_targets = self.for_run.optimization_targets
+        for target in optimization_targets.values():
+            target.clear()
+        self.for_run.regularization.clear()
 
-            # Make sure to do interpolation if that was done earlier
-            plv = get_simulated_pressure(params)
-            if not plv == measurements["pressure"][i + 1]:
-                logger.info("Interpolate")
-                patient.interpolate_data(i + patient.passive_filling_duration - 1)
-                measurements = get_measurements(params, patient)
-                i -= 1
-        i += 1
+        _, bcs = load_target_data(measurements, params, optimization_targets)
+        dolfin.parameters["adjoint"]["stop_annotating"] = False
+
+        self.for_run.reset(bcs, params, gamma, initial_state)
+        return self.for_run
 
 
 def run_active_optimization_step(
-    params, patient, solver_parameters, measurements, pressure, gamma
+    params,
+    patient,
+    solver_parameters,
+    measurements,
+    pressure,
+    gamma,
+    initial_state=None,
+    session=None,
 ):
     """FIXME! briefly describe function
 
@@ -421,6 +535,11 @@ def run_active_optimization_step(
     :param measurements: 
     :param pressure: 
     :param gamma: 
+    :param initial_state: The optimal state of the previous point. If given,
+                          gamma is assumed to hold the optimal control of the
+                          previous point, and nothing is read from the result file.
+    :param session: If given, the targets and the forward runner are reused
+                    (see :class:`ActiveOptimizationSession`)
     :returns: 
     :rtype: 
 
@@ -429,12 +548,12 @@ def run_active_optimization_step(
     if params["active_contraction_iteration_number"] == 0:
         zero = get_constant(gamma.value_size(), gamma.value_rank(), 0.0)
         gamma.assign(zero)
-    else:
+    elif initial_state is None:
 
         # Use gamma from the previous point as initial guess
         # Load gamma from previous point
         g_temp = dolfin_adjoint.Function(gamma.function_space())
-        with dolfin.HDF5File(
+        with h5_lock, dolfin.HDF5File(
             dolfin.mpi_comm_world(), params["sim_file"], "r"
         ) as h5file:
             h5file.read(
@@ -452,12 +571,29 @@ def run_active_optimization_step(
     else:
         mshfun = None
 
-    optimization_targets, bcs = load_targets(
-        params, solver_parameters, measurements, mshfun
-    )
-    for_run = ActiveForwardRunner(
-        solver_parameters, pressure, bcs, optimization_targets, params, gamma
-    )
+    if session is not None:
+        for_run = session.get_forward_runner(
+            params,
+            solver_parameters,
+            measurements,
+            pressure,
+            gamma,
+            mshfun=mshfun,
+            initial_state=initial_state,
+        )
+    else:
+        optimization_targets, bcs = load_targets(
+            params, solver_parameters, measurements, mshfun
+        )
+        for_run = ActiveForwardRunner(
+            solver_parameters,
+            pressure,
+            bcs,
+            optimization_targets,
+            params,
+            gamma,
+            initial_state=initial_state,
+        )
 
     # Update weights so that the initial value of the
     # functional is 0.1
@@ -478,13 +614,28 @@ def run_active_optimization_step(
     dolfin.parameters["adjoint"]["stop_annotating"] = True
 
     rd = MyReducedFunctional(
-        for_run, gamma, relax=params["active_relax"], verbose=params["verbose"]
+        for_run,
+        gamma,
+        relax=params["active_relax"],
+        verbose=params["verbose"],
+        cache_size=params["Optimization_parameters"]["cache_size"],
+        cache_policy=params["Optimization_parameters"]["cache_policy"],
+        history_size=params["Optimization_parameters"]["history_size"],
     )
 
     return rd, gamma
 
 
-def store(params, rd, opt_result):
+def store(params, rd, opt_result, writer=None):
+    """Store the results of the optimization
+
+    :param params: Application parameters
+    :param rd: The reduced functional
+    :param dict opt_result: The results from the optimization algorithm
+    :param writer: If given, the results are written by the writer
+                   (see :func:`pulse_adjoint.io.store_results.submit_opt_results`)
+
+    """
 
     solver = rd.for_run.cphm.solver
 
@@ -502,15 +653,22 @@ def store(params, rd, opt_result):
             ]
         )
 
-    write_opt_results_to_h5(h5group, params, rd.for_res, solver, opt_result)
+    if writer is None:
+        write_opt_results_to_h5(h5group, params, rd.for_res, solver, opt_result)
+        return
 
+    submit_opt_results(writer, h5group, params.copy(), rd.for_res, solver, opt_result)
 
-def solve_oc_problem(params, rd, paramvec, return_solution=False, store_solution=True):
+
+def solve_oc_problem(
+    params, rd, paramvec, return_solution=False, store_solution=True, writer=None
+):
     """Solve the optimal control problem
 
     :param params: Application parameters
     :param rd: The reduced functional
     :param paramvec: The control parameter(s)
+    :param writer: Writer used to store the solution (see :func:`store`)
 
     """
 
@@ -529,7 +687,7 @@ def solve_oc_problem(params, rd, paramvec, return_solution=False, store_solution
         rd.for_res["optimal_control"] = rd.paramvec
 
         if store_solution:
-            store(params, rd, {})
+            store(params, rd, {}, writer)
 
         if return_solution:
             return params, rd, {}
@@ -540,6 +698,13 @@ def solve_oc_problem(params, rd, paramvec, return_solution=False, store_solution
         logger.info("Solve optimal contol problem".center(72, "-"))
         logger.info("".center(72, "-"))
 
+        # Resume from a checkpoint if the optimization was interrupted
+        checkpoint = None
+        if params["checkpoint_interval"] > 0:
+            checkpoint = get_checkpoint(params)
+            checkpoint.restore(rd, paramvec)
+            rd.checkpoint = checkpoint
+
         # Some flags
         solved = False
         done = False
@@ -637,7 +802,8 @@ def solve_oc_problem(params, rd, paramvec, return_solution=False, store_solution
         numpy_mpi.assign_to_vector(optimum.vector(), numpy_mpi.gather_broadcast(x))
 
         logger.info(Text.blue("\nForward solution at optimal parameters"))
-        val = rd.for_run(optimum, False)
+        if not rd.restore(optimum):
+            rd.for_res, _ = rd.for_run(optimum, False)
 
         numpy_mpi.assign_to_vector(paramvec.vector(), numpy_mpi.gather_broadcast(x))
 
@@ -654,7 +820,17 @@ def solve_oc_problem(params, rd, paramvec, return_solution=False, store_solution
         )
 
         if store_solution:
-            store(params, rd, opt_result)
+            store(params, rd, opt_result, writer)
+
+        if checkpoint is not None:
+            # Do not remove the checkpoint before the results are written
+            if writer is not None:
+                writer.flush()
+            checkpoint.remove()
+            rd.checkpoint = None
+
+        if tracer.enabled:
+            tracer.write()
 
         if return_solution:
             return params, rd, opt_result
@@ -852,15 +1028,18 @@ def get_optimization_targets(params, solver_parameters, mshfun=None):
             )
 
             logger.debug("Load displacement from state number {}.".format(group))
-            with dolfin.HDF5File(
+            with h5_lock, dolfin.HDF5File(
                 dolfin.mpi_comm_world(), params["sim_file"], "r"
             ) as h5file:
 
                 # Get previous state
-                group = "/".join(
-                    [params["h5group"], PASSIVE_INFLATION_GROUP, "displacement", group]
+                read_displacement(
+                    h5file,
+                    u,
+                    "/".join([params["h5group"], PASSIVE_INFLATION_GROUP]),
+                    group,
+                    state_space=solver_parameters["state_space"],
                 )
-                h5file.read(u, group)
 
             if params["strain_approx"] in ["project", "interpolate"]:
 
@@ -889,8 +1068,14 @@ def get_optimization_targets(params, solver_parameters, mshfun=None):
             F_ref=F_ref,
             approx=params["strain_approx"],
             map_strain=params["map_strain"],
+            batched=params["batched_strain"],
         )
 
+    # Keep the results of the targets as numpy arrays
+    if params["Optimization_parameters"]["history_size"] > 0:
+        for target in targets.values():
+            target.compact = True
+
     return targets
 
 
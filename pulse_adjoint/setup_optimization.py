@@ -26,6 +26,8 @@
 # NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY OR FITNESS
 import numpy as np
 import logging
+import hashlib
+from collections import OrderedDict
 import pulse
 from pulse import numpy_mpi
 from pulse.dolfin_utils import (
@@ -37,6 +39,7 @@ from pulse.dolfin_utils import (
 
 from .dolfinimport import *
 from .utils import Object, Text, print_line, print_head
+from .trace import tracer
 from .adjoint_contraction_args import *
 from .setup_parameters import *
 
@@ -439,6 +442,10 @@ def make_solver_parameters(
         "material": material,
         "bc": {"dirichlet": base_bc, "neumann": neumann_bc, "robin": robin_bc},
         "solve": setup_solver_parameters(),
+        "continuation": {
+            "predictor": params["continuation_predictor"],
+            "target_iterations": params["continuation_target_iterations"],
+        },
     }
 
     if params["phase"] in [PHASES[0], PHASES[2]]:
@@ -756,6 +763,8 @@ def get_volume_offset(patient, params, chamber="lv"):
 
 def setup_simulation(params, patient):
 
+    tracer.setup(params)
+
     # check_patient_attributes(patient)
     # Load measurements
     measurements = get_measurements(params, patient)
@@ -766,6 +775,233 @@ def setup_simulation(params, patient):
     return measurements, solver_parameters, pressure, controls
 
 
+class EvaluationCache(object):
+    """
+    Cache of evaluations of the reduced functional, keyed by
+    a hash of the (gathered) control.
+
+    *Parameters*
+
+    maxsize: int
+        Maximum number of evaluations to keep
+    policy: str
+        Eviction policy when the cache is full. 'lru' removes
+        the least recently used evaluation, and 'fifo' removes
+        the oldest evaluation.
+
+    """
+
+    def __init__(self, maxsize=10, policy="lru"):
+
+        assert policy in ["lru", "fifo"], "Unknown eviction policy {}".format(policy)
+        self.maxsize = maxsize
+        self.policy = policy
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(x):
+        """Hash of the control array
+        """
+        return hashlib.sha1(np.ascontiguousarray(x, dtype=float).tobytes()).hexdigest()
+
+    def get(self, key):
+
+        entry = self._entries.get(key, None)
+        if entry is not None and self.policy == "lru":
+            self._entries.move_to_end(key)
+
+        return entry
+
+    def set(self, key, entry):
+
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def remove(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class ControlHistory(object):
+    """
+    History of the controls evaluated by the reduced functional.
+    Each process stores its local part of the controls in a
+    float64 buffer, and the control with the lowest functional
+    value is always kept.
+
+    Entries are accessed with the index of the evaluation (as in
+    `MyReducedFunctional.func_values_lst`), and are returned as
+    :py:class:`dolfin.Vector`. Iterating over the history gives
+    the controls that are kept, ordered by the evaluation index.
+
+    *Parameters*
+
+    maxsize: int
+        Maximum number of controls to keep. When the history is
+        full the oldest control is removed (but the best control is
+        kept). If 0, all controls are kept.
+
+    """
+
+    def __init__(self, maxsize=0):
+
+        self.maxsize = maxsize
+        self.clear()
+
+    def clear(self):
+
+        # Number of evaluations
+        self.count = 0
+        self._buffer = None
+        self._indices = None
+        self._values = None
+        self._start = 0
+        self._size = 0
+        self._template = None
+        # Index, functional value and local control of the best evaluation
+        self._best = None
+
+    def _allocate(self, capacity, n):
+
+        buffer = np.empty((capacity, n), dtype=np.float64)
+        indices = np.empty(capacity, dtype=int)
+        values = np.empty(capacity, dtype=np.float64)
+
+        if self._buffer is not None:
+            slots = self._slots()
+            buffer[: self._size] = self._buffer[slots]
+            indices[: self._size] = self._indices[slots]
+            values[: self._size] = self._values[slots]
+
+        self._buffer, self._indices, self._values = buffer, indices, values
+        self._start = 0
+
+    def _slots(self):
+        capacity = len(self._indices)
+        return (self._start + np.arange(self._size)) % capacity
+
+    def _vector(self, x):
+
+        v = dolfin.Vector(self._template)
+        v.set_local(x)
+        v.apply("insert")
+        return v
+
+    def _best_evicted(self):
+        return self._best is not None and self._best[0] not in self.indices(False)
+
+    def __len__(self):
+        return self._size + int(self._best_evicted())
+
+    def append(self, vec, func_value, index=None):
+        """Add a control
+
+        :param vec: The control
+        :type vec: :py:class:`dolfin.GenericVector`
+        :param float func_value: The functional value in the control
+        :param int index: The index of the evaluation. Default is the
+                          next index.
+
+        """
+        x = vec.get_local()
+        index = self.count if index is None else index
+
+        if self._template is None:
+            self._template = dolfin.Vector(vec)
+            self._allocate(self.maxsize if self.maxsize > 0 else 16, len(x))
+
+        capacity = len(self._indices)
+        if self._size == capacity:
+            if self.maxsize > 0:
+                # Remove the oldest control
+                self._start = (self._start + 1) % capacity
+                self._size -= 1
+            else:
+                self._allocate(2 * capacity, len(x))
+                capacity = len(self._indices)
+
+        slot = (self._start + self._size) % capacity
+        self._buffer[slot] = x
+        self._indices[slot] = index
+        self._values[slot] = func_value
+        self._size += 1
+        self.count = index + 1
+
+        if self._best is None or func_value < self._best[1]:
+            self._best = (index, func_value, x.copy())
+
+    def pop(self):
+        """Remove the latest control
+        """
+        if self._size == 0:
+            raise IndexError("pop from empty history")
+
+        slot = self._slots()[-1]
+        self._size -= 1
+        self.count = self._indices[slot]
+
+        if self._best is not None and self._best[0] == self._indices[slot]:
+            # Find the best of the remaining controls
+            self._best = None
+            for slot in self._slots():
+                if self._best is None or self._values[slot] < self._best[1]:
+                    self._best = (
+                        self._indices[slot],
+                        self._values[slot],
+                        self._buffer[slot].copy(),
+                    )
+
+    def indices(self, include_best=True):
+        """The indices of the evaluations that are kept
+        """
+        if self._size == 0:
+            indices = []
+        else:
+            indices = self._indices[self._slots()].tolist()
+
+        if include_best and self._best_evicted():
+            indices.insert(0, self._best[0])
+
+        return indices
+
+    def best(self):
+        """Return the index of the evaluation with the
+        lowest functional value, and the control
+        """
+        if self._best is None:
+            return None, None
+        return self._best[0], self._vector(self._best[2])
+
+    def __getitem__(self, index):
+
+        if index < 0:
+            index += self.count
+
+        if self._best is not None and index == self._best[0]:
+            return self._vector(self._best[2])
+
+        if self._size > 0:
+            slots = self._slots()
+            slot = slots[self._indices[slots] == index]
+            if len(slot) > 0:
+                return self._vector(self._buffer[slot[0]])
+
+        raise IndexError("Control {} is not kept in the history".format(index))
+
+    def __iter__(self):
+
+        for index in self.indices():
+            yield self[index]
+
+
 class MyReducedFunctional(dolfin_adjoint.ReducedFunctional):
     """
     A modified reduced functional of the `dolfin_adjoint.ReducedFuctionl`
@@ -782,14 +1018,50 @@ class MyReducedFunctional(dolfin_adjoint.ReducedFunctional):
     relax: float
         Scale factor for the derivative. Note the total scale factor for the 
         derivative will be scale*relax
-
+    cache_size: int
+        Number of evaluations (functional value, forward result and
+        gradient) to keep. Evaluating the functional in a control that
+        is cached will not run the forward model. If 0, nothing is cached.
+    cache_policy: str
+        Eviction policy for the cache, 'lru' or 'fifo'
+    history_size: int
+        Number of evaluated controls to keep (see :class:`ControlHistory`).
+        If 0, all controls are kept. If positive, the cached evaluations
+        only keep the final state, to keep the memory usage flat.
+
+    Note that an evaluation taken from the cache is not counted as
+    a forward run, i.e `iter`, `func_values_lst` and `controls_lst` are
+    not updated. The forward runner is put back in the state it had
+    after the cached evaluation (see `restore` in the forward runners).
 
     """
 
-    def __init__(self, for_run, paramvec, scale=1.0, relax=1.0, verbose=False):
+    def __init__(
+        self,
+        for_run,
+        paramvec,
+        scale=1.0,
+        relax=1.0,
+        verbose=False,
+        cache_size=0,
+        cache_policy="lru",
+        history_size=0,
+    ):
 
         self.log_level = logger.level
+        self.history_size = history_size
         self.reset()
+        self.evaluation_cache = (
+            EvaluationCache(cache_size, cache_policy) if cache_size > 0 else None
+        )
+        # Key of the control that the current recording belongs to
+        self._tape_key = None
+        # Key and value of the control of the last evaluation
+        self._last_key = None
+        self._last_value = None
+        self.nr_cache_hits = 0
+        # Called with the reduced functional after each evaluation
+        self.checkpoint = None
         self.for_run = for_run
         self.paramvec = paramvec
 
@@ -800,16 +1072,45 @@ class MyReducedFunctional(dolfin_adjoint.ReducedFunctional):
         self.derivative_scale = relax
         self.verbose = verbose
 
-    def __call__(self, value, return_fail=False):
+    def _gather_control(self, value):
+        """Return the control as a gathered numpy array
+        """
 
-        logger.debug("\nEvaluate functional...")
-        dolfin_adjoint.adj_reset()
-        self.iter += 1
+        if isinstance(value, (dolfin.Function, RegionalParameter, MixedParameter)):
+            return numpy_mpi.gather_broadcast(value.vector().get_local())
+        elif isinstance(value, float) or isinstance(value, int):
+            return np.array([value], dtype=float)
+        elif isinstance(value, dolfin_adjoint.enlisting.Enlisted):
+            val_delisted = delist(value, self.controls)
+            return numpy_mpi.gather_broadcast(val_delisted.vector().get_local())
+        else:
+            return numpy_mpi.gather_broadcast(value)
+
+    def _cache_key(self, value):
+
+        if self.evaluation_cache is None:
+            return None
+
+        return self.evaluation_cache.key(self._gather_control(value))
+
+    def _snapshot_targets(self):
+        """Copy the results stored in the optimization targets,
+        since the targets are reused between evaluations
+        """
+        targets = dict(self.for_res["optimization_targets"])
+        targets["regularization"] = self.for_res["regularization"]
 
+        return {
+            k: (t.func_value, {r: list(v) for r, v in t.results.items()})
+            for k, t in targets.items()
+        }
+
+    def _make_control(self, value):
+        """Return the control as a new function
+        """
         paramvec_new = dolfin_adjoint.Function(
             self.paramvec.function_space(), name="new control"
         )
-        # paramvec_new = RegionalParameter(self.paramvec._meshfunction)
 
         if isinstance(value, (dolfin.Function, RegionalParameter, MixedParameter)):
             paramvec_new.assign(value)
@@ -824,6 +1125,75 @@ class MyReducedFunctional(dolfin_adjoint.ReducedFunctional):
                 paramvec_new.vector(), numpy_mpi.gather_broadcast(value)
             )
 
+        return paramvec_new
+
+    def _restore_entry(self, entry, value):
+        """Make a cached evaluation the current evaluation,
+        and return the control as a function
+        """
+        self.for_res = entry["for_res"]
+
+        targets = dict(self.for_res["optimization_targets"])
+        targets["regularization"] = self.for_res["regularization"]
+        for k, (func_value, results) in entry["targets"].items():
+            targets[k].func_value = func_value
+            targets[k].results = {r: list(v) for r, v in results.items()}
+
+        annotate = not dolfin.parameters["adjoint"]["stop_annotating"]
+        dolfin.parameters["adjoint"]["stop_annotating"] = True
+        m = self._make_control(value)
+        if hasattr(self.for_run, "restore"):
+            # Put the forward runner in the state after the evaluation
+            self.for_run.restore(m, self.for_res)
+        dolfin.parameters["adjoint"]["stop_annotating"] = not annotate
+
+        return m
+
+    def restore(self, value):
+        """Make a cached evaluation the current evaluation
+
+        :param value: The control
+        :returns: True if the control was found in the cache
+                  (with the states of the evaluation)
+        :rtype: bool
+
+        """
+        key = self._cache_key(value)
+        if key is None:
+            return False
+
+        entry = self.evaluation_cache.get(key)
+        if entry is None or entry["for_res"]["states"] is None:
+            return False
+
+        self._restore_entry(entry, value)
+        return True
+
+    def __call__(self, value, return_fail=False):
+
+        logger.debug("\nEvaluate functional...")
+
+        key = self._cache_key(value)
+        entry = None if key is None else self.evaluation_cache.get(key)
+        self._last_key = key
+        if entry is not None:
+            logger.debug("Use cached evaluation")
+            self.nr_cache_hits += 1
+            self._last_value = self._restore_entry(entry, value)
+            self.print_line()
+
+            if return_fail:
+                return self.scale * entry["func_value"], entry["crash"]
+
+            return self.scale * entry["func_value"]
+
+        dolfin_adjoint.adj_reset()
+        self._tape_key = None
+        self.iter += 1
+
+        paramvec_new = self._make_control(value)
+        self._last_value = paramvec_new
+
         logger.debug(Text.yellow("Start annotating"))
         dolfin.parameters["adjoint"]["stop_annotating"] = False
 
@@ -854,7 +1224,8 @@ class MyReducedFunctional(dolfin_adjoint.ReducedFunctional):
 
         logger.debug("\nEvaluate forward model")
 
-        self.for_res, crash = self.for_run(paramvec_new, True)
+        with tracer.region("forward run", iteration=self.iter):
+            self.for_res, crash = self.for_run(paramvec_new, True)
 
         for_time = t.stop()
         logger.debug(
@@ -903,13 +1274,37 @@ class MyReducedFunctional(dolfin_adjoint.ReducedFunctional):
         )
 
         self.func_values_lst.append(func_value * self.scale)
-        self.controls_lst.append(dolfin.Vector(paramvec_new.vector()))
+        self.controls_lst.append(paramvec_new.vector(), func_value * self.scale)
+
+        if key is not None:
+            self._tape_key = key
+            for_res = self.for_res
+            if self.history_size > 0:
+                # Do not keep the states of the cached evaluations, except
+                # the final state which is needed to restore the evaluation
+                states = for_res.get("states")
+                for_res = dict(
+                    for_res, states=None, final_state=states[-1] if states else None
+                )
+            self.evaluation_cache.set(
+                key,
+                {
+                    "func_value": func_value,
+                    "crash": crash,
+                    "for_res": for_res,
+                    "targets": self._snapshot_targets(),
+                    "gradient": None,
+                },
+            )
 
         logger.debug(Text.yellow("Stop annotating"))
         dolfin.parameters["adjoint"]["stop_annotating"] = True
 
         self.print_line()
 
+        if self.checkpoint is not None:
+            self.checkpoint(self)
+
         if return_fail:
             return self.scale * func_value, crash
 
@@ -926,7 +1321,7 @@ class MyReducedFunctional(dolfin_adjoint.ReducedFunctional):
             self.iter = 0
             self.nr_der_calls = 0
             self.func_values_lst = []
-            self.controls_lst = []
+            self.controls_lst = ControlHistory(self.history_size)
             self.forward_times = []
             self.backward_times = []
             self.grad_norm = []
@@ -950,16 +1345,55 @@ class MyReducedFunctional(dolfin_adjoint.ReducedFunctional):
 
         logger.info(print_line(self.for_res, self.iter, grad_norm, func_value))
 
+    def value_and_gradient(self, value):
+        """Evaluate the functional and the gradient in the same
+        control. The forward model is run once, and the gradient
+        is computed from that recording.
+
+        :param value: The control
+        :returns: The (scaled) functional value and gradient
+        :rtype: tuple
+
+        """
+        func_value = self(value)
+        return func_value, self.derivative(value)
+
     def derivative(self, *args, **kwargs):
 
         logger.debug("\nEvaluate gradient...")
+
+        key = self._tape_key
+        if self.evaluation_cache is not None:
+            # Without a control, the gradient is taken in
+            # the control of the last evaluation
+            if len(args) > 0:
+                value = args[0]
+                key = self._cache_key(value)
+            else:
+                value = self._last_value
+                key = self._last_key
+
+        if key is not None:
+            entry = self.evaluation_cache.get(key)
+            if entry is not None and entry["gradient"] is not None:
+                logger.debug("Use cached gradient")
+                self.nr_cache_hits += 1
+                return self.scale * entry["gradient"] * self.derivative_scale
+
+            if key != self._tape_key:
+                # The current recording belongs to a different control,
+                # so we need to run the forward model again.
+                self.evaluation_cache.remove(key)
+                self(value)
+
         self.nr_der_calls += 1
         import math
 
         t = dolfin.Timer("Backward run")
         t.start()
 
-        out = dolfin_adjoint.ReducedFunctional.derivative(self, forget=False)
+        with tracer.region("adjoint run", iteration=self.iter):
+            out = dolfin_adjoint.ReducedFunctional.derivative(self, forget=False)
         back_time = t.stop()
         logger.debug(
             (
@@ -985,4 +1419,9 @@ class MyReducedFunctional(dolfin_adjoint.ReducedFunctional):
                 self.grad_norm[-1], self.grad_norm_scaled[-1]
             )
         )
+        if key is not None and self.evaluation_cache is not None:
+            entry = self.evaluation_cache.get(key)
+            if entry is not None:
+                entry["gradient"] = gathered_out.copy()
+
         return self.scale * gathered_out * self.derivative_scale
@@ -360,6 +360,39 @@ def setup_application_parameters(material_model="holzapfel_ogden"):
     params.add("sim_file", "result.h5")
     # Store the results in the file within a folder
     params.add("h5group", "")
+    # Store lists of vectors in the results as one chunked
+    # dataset (step x dof) instead of one dataset per step
+    params.add("stack_results", False)
+    # Compression of the stacked datasets (serial h5py only)
+    params.add("result_compression", "none", ["none", "gzip", "lzf"])
+    # Store the displacement and lagrange multiplier in addition to
+    # the state. If False, only the state is stored and the displacement
+    # is extracted from the state when the results are read
+    params.add("store_displacement", True)
+    # Save a checkpoint of the optimization every n-th evaluation
+    # of the functional, so that it can be resumed if it is interrupted.
+    # If 0, no checkpoints are saved
+    params.add("checkpoint_interval", 0)
+    # Write the results of each contract point in a background thread,
+    # while the next point is solved. Only used in serial
+    params.add("async_store", False)
+    # Write the time spent in the different parts of the optimization
+    # (forward and adjoint runs, newton solves, ...) to this file.
+    # Use the extension .json to get a Chrome trace, otherwise a JSON
+    # lines file is written. If empty, nothing is recorded
+    params.add("trace_file", "")
+    # Build the optimization targets and the mechanics problem once in
+    # the active phase, and reuse them for all the contract points
+    params.add("persistent_active_session", False)
+    # Predictor for the initial guess of the newton solver in the
+    # continuation steps of the pressure and gamma. Possible values:
+    # "none" (use pulse.iterate), "secant" (extrapolate from the last
+    # two converged states) and "tangent" (solve the linearized system)
+    params.add("continuation_predictor", "none")
+    # Wanted number of newton iterations in each continuation step.
+    # The step is increased if fewer iterations are needed, and
+    # reduced if more are needed
+    params.add("continuation_target_iterations", 5)
 
     ## Parameters ##
 
@@ -451,6 +484,26 @@ def setup_application_parameters(material_model="holzapfel_ogden"):
     # or use gamma from previous iteration as initial guess (True)
     params.add("initial_guess", "previous", ["previous", "zero", "smooth"])
 
+    # Build the mechanics problem for the passive phase only once, and
+    # reuse it for every functional evaluation. Only the pressure, the
+    # material parameters and the state are reset between evaluations.
+    params.add("reuse_passive_problem", False)
+
+    # Number of previously evaluated passive controls for which the
+    # converged states are kept. The states from the closest control
+    # are used as initial guess for the newton solver in each pressure
+    # step. If 0, no states are cached.
+    params.add("passive_state_cache_size", 0)
+
+    # Maximum number of intermediate states and gammas kept in memory
+    # during the active phase, used as initial guess when stepping up gamma.
+    # If 0, all states are kept in memory
+    params.add("active_state_store_size", 10)
+    # If True, states removed from the store are written to
+    # active_state_<contract point>.h5, and read back when they are used.
+    # Otherwise they are discarded
+    params.add("active_state_spill", True)
+
     # Log level
     params.add("log_level", logging.INFO)
     # If False turn of logging of the forward model during functional evaluation
@@ -475,6 +528,9 @@ def setup_application_parameters(material_model="holzapfel_ogden"):
 
     params.add("strain_tensor", "gradu", ["E", "gradu"])
     params.add("map_strain", False)
+    # Compute the regional strains for all regions with one solve,
+    # instead of one solve per region
+    params.add("batched_strain", False)
 
     # e.g merge region 1,2 into one region -> "1,2"
     # e.g merge region 1,2 into one region and
@@ -575,6 +631,23 @@ def setup_optimization_parameters():
     params.add("adapt_scale", True)
     params.add("disp", False)
 
+    # Number of evaluations of the reduced functional to cache.
+    # Evaluating the functional or the gradient in a control that is
+    # cached will not rerun the forward or adjoint model (0 = no cache)
+    params.add("cache_size", 0)
+    params.add("cache_policy", "lru", ["lru", "fifo"])
+
+    # Number of evaluated controls to keep in memory. The control with
+    # the lowest functional value is always kept. If positive, the
+    # results of the optimization targets are kept as numpy arrays and
+    # cached evaluations only keep the final state (0 = keep everything)
+    params.add("history_size", 0)
+
+    # Compute the functional value and the gradient in one call,
+    # so that the optimizer gets both from one forward and one
+    # backward run (scipy uses jac=True)
+    params.add("value_and_gradient", False)
+
     # Add indices seprated with comma,
     # e.g fix first and third control "1,3"
     params.add("fixed_matparams", "")
@@ -616,7 +689,9 @@ def setup_unloading_parameters():
 
     params = dolfin.Parameters("Unloading_parameters")
 
-    params.add("method", "fixed_point", ["fixed_point", "raghavan"])
+    params.add(
+        "method", "fixed_point", ["fixed_point", "anderson", "raghavan", "hybrid"]
+    )
     # Terminate if difference in reference (unloaded) volume
     # is less than tol
     params.add("tol", 0.05)
@@ -633,6 +708,10 @@ def setup_unloading_parameters():
     unload_options.add("ub", 2.0)
     unload_options.add("lb", 0.5)
     unload_options.add("regen_fibers", False)
+    # Number of previous iterations used in the Anderson mixing
+    unload_options.add("anderson_depth", 5)
+    # Relaxation parameter in the Anderson mixing
+    unload_options.add("anderson_beta", 1.0)
 
     params.add(unload_options)
 
@@ -0,0 +1,363 @@
+#!/usr/bin/env python
+# c) 2001-2017 Simula Research Laboratory ALL RIGHTS RESERVED
+# Authors: Henrik Finsberg
+# END-USER LICENSE AGREEMENT
+# PLEASE READ THIS DOCUMENT CAREFULLY. By installing or using this
+# software you agree with the terms and conditions of this license
+# agreement. If you do not accept the terms of this license agreement
+# you may not install or use this software.
+
+# Permission to use, copy, modify and distribute any part of this
+# software for non-profit educational and research purposes, without
+# fee, and without a written agreement is hereby granted, provided
+# that the above copyright notice, and this license agreement in its
+# entirety appear in all copies. Those desiring to use this software
+# for commercial purposes should contact Simula Research Laboratory AS: post@simula.no
+#
+# IN NO EVENT SHALL SIMULA RESEARCH LABORATORY BE LIABLE TO ANY PARTY
+# FOR DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES,
+# INCLUDING LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE
+# "PULSE-ADJOINT" EVEN IF SIMULA RESEARCH LABORATORY HAS BEEN ADVISED
+# OF THE POSSIBILITY OF SUCH DAMAGE. THE SOFTWARE PROVIDED HEREIN IS
+# ON AN "AS IS" BASIS, AND SIMULA RESEARCH LABORATORY HAS NO OBLIGATION
+# TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR MODIFICATIONS.
+# SIMULA RESEARCH LABORATORY MAKES NO REPRESENTATIONS AND EXTENDS NO
+# WARRANTIES OF ANY KIND, EITHER IMPLIED OR EXPRESSED, INCLUDING, BUT
+# NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY OR FITNESS
+"""
+Structured timing of the different parts of an optimization.
+
+Regions of the code are timed with :meth:`Tracer.region`, and the
+records are written to a trace file which is either a JSON lines file
+with one record per line, or (if the file ends with `.json`) a trace
+that can be opened in the Chrome trace viewer (chrome://tracing).
+The records of all processes are gathered on process 0.
+
+**Example of usage**::
+
+    from pulse_adjoint.trace import tracer
+    tracer.enable("trace.jsonl")
+    with tracer.region("forward run", iteration=1):
+        ...
+    tracer.write()
+
+Every call to :meth:`Tracer.write` appends the records since the
+previous call to the trace file, and removes them from the tracer.
+
+"""
+import json
+import time
+import functools
+from collections import OrderedDict
+
+import dolfin
+
+from .adjoint_contraction_args import logger
+
+# Dolfin timers that are recorded for the newton solves. Timers
+# that are not used by the installed version of dolfin are ignored.
+DOLFIN_TIMERS = {
+    "assemble": [
+        "Assemble cells",
+        "Assemble exterior facets",
+        "Assemble interior facets",
+        "Assemble system",
+    ],
+    "linear_solve": [
+        "PETSc LU solver",
+        "PETSc Krylov solver",
+        "LU solver",
+        "Krylov solver",
+    ],
+}
+
+
+def dolfin_timer(tasks):
+    """Return the total wall time spent in the given
+    dolfin timers (see :func:`dolfin.timing`)
+    """
+    total = 0.0
+    for task in tasks:
+        try:
+            total += dolfin.timing(task, dolfin.TimingClear.keep)[1]
+        except RuntimeError:
+            # No timer with this name
+            pass
+    return total
+
+
+class _NullRegion(object):
+    """Region used when the tracer is disabled
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_null_region = _NullRegion()
+
+
+class Region(object):
+    """A timed region of the code. Use
+    :meth:`Tracer.region` to create a region.
+
+    :param tracer: The tracer where the record is stored
+    :param str name: Name of the region
+    :param dict meta: Additional information stored with the record
+    :param bool timers: If True, record the time spent in
+                        assembly and linear solves (see :data:`DOLFIN_TIMERS`)
+
+    """
+
+    def __init__(self, tracer, name, meta, timers=False):
+        self.tracer = tracer
+        self.name = name
+        self.meta = meta
+        self.timers = timers
+
+    def __enter__(self):
+        self.tracer._stack.append(self.name)
+        self.path = "/".join(self.tracer._stack)
+        if self.timers:
+            self._timers = {k: dolfin_timer(v) for k, v in DOLFIN_TIMERS.items()}
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.time() - self.start
+        self.tracer._stack.pop()
+
+        if self.timers:
+            for k, v in DOLFIN_TIMERS.items():
+                self.meta[k] = dolfin_timer(v) - self._timers[k]
+        if exc_type is not None:
+            self.meta["error"] = exc_type.__name__
+
+        self.tracer.records.append(
+            {
+                "name": self.name,
+                "path": self.path,
+                "rank": self.tracer.comm.rank,
+                "start": self.start - self.tracer.t0,
+                "duration": duration,
+                "args": self.meta,
+            }
+        )
+        return False
+
+
+class Tracer(object):
+    """Collect timings of regions of the code.
+    When the tracer is disabled, regions are not timed.
+
+    :param comm: The MPI communicator
+
+    """
+
+    def __init__(self, comm=dolfin.mpi_comm_world()):
+        self.comm = comm
+        self.enabled = False
+        self.fname = None
+        self.records = []
+        self._stack = []
+        self.t0 = time.time()
+        # Number of events written to each trace file
+        self._written = {}
+
+    def setup(self, params):
+        """Enable the tracer if a trace file is given
+        in the application parameters (`trace_file`),
+        otherwise disable it
+        """
+        if params["trace_file"] != "":
+            self.enable(params["trace_file"])
+        else:
+            self.disable()
+
+    def enable(self, fname=None):
+        """Start recording
+
+        :param str fname: The trace file
+        """
+        if fname is not None and fname != self.fname:
+            # Records of a previous run are not written to the new file
+            self.clear()
+            self.fname = fname
+        if not self.enabled:
+            self.enabled = True
+            self.t0 = time.time()
+            logger.debug("Trace the optimization to {}".format(self.fname))
+
+    def disable(self):
+        """Stop recording, and remove the records that
+        are not written. The next write to a trace file
+        overwrites the file.
+        """
+        self.enabled = False
+        self.fname = None
+        self._written = {}
+        self.clear()
+
+    def clear(self):
+        """Remove all records
+        """
+        self.records = []
+
+    def region(self, name, timers=False, **meta):
+        """Time a region of the code. Use it as a context manager,
+        and pass additional information as keyword arguments.
+
+        :param str name: Name of the region
+        :param bool timers: If True, record the time spent in
+                            assembly and linear solves
+        :returns: The region
+        :rtype: :class:`Region`
+
+        """
+        if not self.enabled:
+            return _null_region
+        return Region(self, name, meta, timers)
+
+    def wrap(self, obj, method, name, timers=False):
+        """Time every call to the method `method` of `obj`.
+        If the method returns a tuple with the number of
+        newton iterations and a convergence flag, the number
+        of iterations is also recorded.
+
+        :param obj: The object
+        :param str method: Name of the method
+        :param str name: Name of the region
+        :param bool timers: If True, record the time spent in
+                            assembly and linear solves
+
+        """
+        func = getattr(obj, method)
+        if getattr(func, "_traced", False):
+            return
+
+        @functools.wraps(func)
+        def traced(*args, **kwargs):
+            if not self.enabled:
+                return func(*args, **kwargs)
+
+            with self.region(name, timers=timers) as region:
+                out = func(*args, **kwargs)
+                if isinstance(out, tuple) and len(out) == 2:
+                    region.meta["newton_iterations"] = out[0]
+            return out
+
+        traced._traced = True
+        setattr(obj, method, traced)
+
+    def gather(self):
+        """Gather the records of all processes on process 0
+
+        :returns: The records on process 0, and None on the other processes
+        :rtype: list
+
+        """
+        if self.comm.size == 1:
+            return list(self.records)
+
+        records = self.comm.gather(self.records, root=0)
+        if self.comm.rank != 0:
+            return None
+        return [r for rank_records in records for r in rank_records]
+
+    def summary(self, records):
+        """Total time spent in each region. The total time on each
+        process is computed, and the mean and maximum over the
+        processes are reported.
+
+        :param list records: The (gathered) records
+        :returns: A dictionary with `count`, `mean` and `max` of each region
+        :rtype: dict
+
+        """
+        totals = OrderedDict()
+        counts = OrderedDict()
+        for r in records:
+            totals.setdefault(r["path"], {}).setdefault(r["rank"], 0.0)
+            totals[r["path"]][r["rank"]] += r["duration"]
+            counts.setdefault(r["path"], {}).setdefault(r["rank"], 0)
+            counts[r["path"]][r["rank"]] += 1
+
+        summary = OrderedDict()
+        for path, total in totals.items():
+            values = list(total.values())
+            summary[path] = {
+                "count": max(counts[path].values()),
+                "mean": sum(values) / float(len(values)),
+                "max": max(values),
+            }
+        return summary
+
+    def write(self, fname=None):
+        """Gather the records and append them to the trace file.
+        The records are then removed from the tracer. The first
+        write to a file after the tracer is enabled overwrites
+        the file. A summary of the records is written to the log.
+
+        :param str fname: The trace file. If None use the file the
+                          tracer was enabled with.
+
+        """
+        fname = self.fname if fname is None else fname
+        records = self.gather()
+        self.clear()
+        if records is None:
+            return
+
+        summary = self.summary(records)
+        logger.info("\nTime spent in each region (s):")
+        logger.info("\t{:50}\t{:>8}\t{:>10}\t{:>10}".format("", "count", "mean", "max"))
+        for path, s in summary.items():
+            logger.info(
+                "\t{:50}\t{:>8d}\t{:>10.3f}\t{:>10.3f}".format(
+                    path, s["count"], s["mean"], s["max"]
+                )
+            )
+
+        if fname is None:
+            return
+
+        written = self._written.get(fname, 0)
+        if not fname.endswith(".json"):
+            with open(fname, "a" if written else "w") as f:
+                for r in records:
+                    f.write(json.dumps(r) + "\n")
+            self._written[fname] = written + len(records)
+            return
+
+        events = ",".join(
+            json.dumps(
+                {
+                    "name": r["name"],
+                    "ph": "X",
+                    "ts": 1e6 * r["start"],
+                    "dur": 1e6 * r["duration"],
+                    "pid": r["rank"],
+                    "tid": 0,
+                    "args": r["args"],
+                }
+            )
+            for r in records
+        )
+        if not written:
+            with open(fname, "w") as f:
+                f.write('{"displayTimeUnit": "ms", "traceEvents": [' + events + "]}")
+        elif events:
+            # Insert the events before the closing brackets, so
+            # that the file is a valid trace after every write
+            with open(fname, "r+") as f:
+                f.seek(0, 2)
+                f.seek(f.tell() - 2)
+                f.write("," + events + "]}")
+        self._written[fname] = written + len(records)
+
+
+# The tracer used in pulse_adjoint
+tracer = Tracer()
@@ -38,9 +38,9 @@ import dolfin as df
 
 from pulse import HeartGeometry
 from pulse.numpy_mpi import *
-from pulse.unloader import *
 
 from .utils import *
+from .unloader import FixedPoint, AndersonFixedPoint, Raghavan, Hybrid
 
 from ..setup_optimization import (
     setup_adjoint_contraction_parameters,
@@ -50,7 +50,7 @@ from ..setup_optimization import (
     make_solver_parameters,
 )
 from ..run_optimization import run_passive_optimization_step, solve_oc_problem, store
-from ..heart_problem import create_mechanics_problem
+from ..io import read_displacement
 
 
 class UnloadedMaterial(object):
@@ -83,7 +83,8 @@ class UnloadedMaterial(object):
         Used to setup the solver paramteteres. Note that the path to the original mesh should be in this
         dictionary, with key `Patient_parameters/mesh_path`. The output file will be saved to `sim_file`        
     method : str
-        Which method to use for unloading. Options = ['fixed_point', 'raghavan', 'hybrid'].
+        Which method to use for unloading.
+        Options = ['fixed_point', 'anderson', 'raghavan', 'hybrid'].
         Default = 'hybrid'. For more info see :func`unloader.py`.
     tol : float
         Relative tolerance for difference in reference volume. Default = 5%.
@@ -137,11 +138,15 @@ class UnloadedMaterial(object):
         self.maxiter = maxiter
 
         if method == "fixed_point":
-            self.MeshUnloader = FixedPointUnloader
+            self.MeshUnloader = FixedPoint
+        elif method == "anderson":
+            self.MeshUnloader = AndersonFixedPoint
         elif method == "raghavan":
-            self.MeshUnloader = RaghavanUnloader
+            self.MeshUnloader = Raghavan
+        elif method == "hybrid":
+            self.MeshUnloader = Hybrid
         else:
-            methods = ["fixed_point", "raghavan"]
+            methods = ["fixed_point", "anderson", "raghavan", "hybrid"]
             msg = "Unknown unloading algorithm {}. ".format(
                 method
             ) + "Possible values are {}".format(methods)
@@ -200,7 +205,8 @@ class UnloadedMaterial(object):
 
     def unload(self):
 
-        paramvec, gamma, matparams = make_control(self.params, self.geometry)
+        geometry = self.geometry
+        paramvec, gamma, matparams = make_control(self.params, geometry)
 
         if self.it == 0 and self.initial_guess:
             assign_to_vector(
@@ -223,20 +229,17 @@ class UnloadedMaterial(object):
 
         self.params["phase"] = "unloading"
 
-        params, p_expr = make_solver_parameters(self.params, self.geometry, matparams)
-
-        problem = create_mechanics_problem(params)
-
+        pressure = tuple(self.p_geo) if self.is_biv else self.p_geo
         unloader = self.MeshUnloader(
-            problem=problem,
-            pressure=self.p_geo,
+            geometry=geometry,
+            pressure=pressure,
+            material_parameters=matparams,
             h5name=self.params["sim_file"],
             options=self.unload_options,
             h5group=str(self.it),
+            solver_parameters=self.params,
             merge_control=self.params["merge_passive_control"],
         )
-        # from IPython import embed; embed()
-        # exit()
         unloader.unload()
         new_geometry = unloader.unloaded_geometry
         backward_displacement = unloader.backward_displacement
@@ -310,11 +313,13 @@ class UnloadedMaterial(object):
         V = df.VectorFunctionSpace(geo.mesh, "CG", 2)
         u = df.Function(V)
         try:
-            group = "/".join([str(self.it), "passive_inflation", "displacement", "1"])
+            group = "/".join([str(self.it), "passive_inflation"])
             with df.HDF5File(
                 df.mpi_comm_world(), self.params["sim_file"], "r"
             ) as h5file:
-                h5file.read(u, group)
+                read_displacement(
+                    h5file, u, group, 1, state_space=self.params["state_space"]
+                )
             logger.info(
                 "Load displacement from {}:{}".format(self.params["sim_file"], group)
             )
@@ -37,8 +37,10 @@ from scipy.optimize import minimize_scalar
 from os.path import join
 
 import dolfin as df
+from pulse.mechanicsproblem import SolverDidNotConverge
 
 from .utils import *
+from ..utils import UnableToChangePressureExeption
 
 
 try:
@@ -46,7 +48,291 @@ try:
 except:
     pass
 
-__all__ = ["FixedPoint", "Raghavan", "Hybrid"]
+__all__ = ["FixedPoint", "AndersonFixedPoint", "Raghavan", "Hybrid"]
+
+
+class InflationEngine(object):
+    """
+    Inflate the reference geometries visited during unloading
+    to the target pressure.
+
+    All reference geometries are obtained by moving the same original
+    geometry, so the mesh topology never changes. Therefore the mesh,
+    the material parameters and the mechanics problem (with its function
+    spaces and compiled forms) are created only once. For every new
+    backward displacement the mesh coordinates and the microstructure
+    are updated in place, and the inflation is started from the last
+    converged state. If this fails, the state is reset and the pressure
+    is increased from zero.
+
+    Parameters
+    ----------
+    geometry : object
+        The original geometry, with attributes `mesh`, `fiber`
+        and `markers`.
+    pressure : float or tuple
+        The target pressure. If LV only provide a
+        float, if BiV proble a tuple of the form (p_LV, p_RV).
+    material_parameters : dict
+        A dictionary with material parameters
+    solver_parameters : dict
+        Parameters used to make the solver parameters
+    is_biv : bool
+        Wheter the geometry is biventricular
+    n : int
+        Number of pressure steps used when inflating from zero
+    solve_tries : int
+        Number of attemtps the solver should use to
+        increase the pressure (after pressure reduction)
+    approx : str
+        Approximation used when moving the mesh
+    merge_control : str
+        How to merge the regional material parameters
+
+    """
+
+    def __init__(
+        self,
+        geometry,
+        pressure,
+        material_parameters,
+        solver_parameters,
+        is_biv=False,
+        n=2,
+        solve_tries=1,
+        approx="project",
+        merge_control="",
+    ):
+
+        self.pressure = pressure
+        self.is_biv = is_biv
+        self.n = n
+        self.solve_tries = solve_tries
+        self.approx = approx
+
+        self.reference_geometry = update_geometry(geometry, None, False)
+        self.mesh = self.reference_geometry.mesh
+        self.original_coordinates = self.mesh.coordinates().copy()
+
+        # Minus the backward displacement on the original mesh,
+        # and the same displacement on the reference mesh
+        self.u0 = df.Function(df.VectorFunctionSpace(geometry.mesh, "CG", 1))
+        self.mesh_displacement = df.Function(
+            df.VectorFunctionSpace(self.mesh, "CG", 1)
+        )
+        check_same_layout(
+            self.mesh_displacement.function_space(), self.u0.function_space()
+        )
+
+        # The original microstructure that will be pushed forward
+        df.parameters["form_compiler"]["representation"] = "quadrature"
+        df.parameters["form_compiler"]["quadrature_degree"] = 4
+        self.push_forward = {}
+        for attr, _ in FIELDS:
+            if getattr(geometry, attr, None) is not None:
+                self.push_forward[attr] = VectorFieldPushForward(
+                    getattr(geometry, attr).copy(), self.u0
+                )
+
+        matparams = update_material_parameters(
+            material_parameters, self.mesh, merge_control, self.reference_geometry.sfun
+        )
+
+        logger.info("Create mechanics problem for unloading")
+        self.problem, self.p_expr = create_problem(
+            solver_parameters, self.reference_geometry, matparams
+        )
+        self.converged = False
+
+    def update(self, U):
+        """
+        Update the reference geometry in place, so that it is the
+        original geometry moved by minus the backward displacement `U`.
+
+        Parameters
+        ----------
+        U : :py:class:`dolfin.Function`
+            Backward displacement on the original geometry
+
+        Returns
+        -------
+        reference_geometry : object
+            The updated reference geometry
+        """
+
+        self.u0.interpolate(U)
+        assign_local(self.u0.vector(), self.u0.vector(), -1.0)
+        assign_local(self.mesh_displacement.vector(), self.u0.vector())
+
+        self.mesh.coordinates()[:] = self.original_coordinates
+        df.ALE.move(self.mesh, self.mesh_displacement)
+        self.mesh.bounding_box_tree().build(self.mesh)
+
+        for attr, push_forward in self.push_forward.items():
+            assign_local(getattr(self.reference_geometry, attr).vector(), push_forward())
+
+        return self.reference_geometry
+
+    def assign_pressure(self, pressure):
+
+        if self.is_biv:
+            self.p_expr["p_lv"].assign(df.Constant(pressure[0]))
+            self.p_expr["p_rv"].assign(df.Constant(pressure[1]))
+        else:
+            self.p_expr["p_lv"].assign(df.Constant(pressure))
+
+    def inflate(self):
+        """
+        Inflate the current reference geometry to the target pressure
+        and return the displacement.
+        """
+
+        if self.converged:
+            # Start from the last converged state
+            try:
+                self.assign_pressure(self.pressure)
+                self.problem.solve()
+            except Exception as ex:
+                logger.info("Inflation from previous state failed: {}".format(ex))
+                self.converged = False
+
+        if not self.converged:
+            # Start from zero pressure
+            zero = (0.0, 0.0) if self.is_biv else 0.0
+            self.assign_pressure(zero)
+            self.problem.state.vector().zero()
+
+            inflate_to_pressure(
+                self.pressure,
+                self.problem,
+                self.p_expr,
+                self.is_biv,
+                self.solve_tries,
+                self.n,
+                annotate=False,
+            )
+
+        self.converged = True
+        return get_displacement(self.problem)
+
+
+def create_problem(solver_parameters, geometry, material_parameters):
+    """
+    Create a :py:class:`pulse.MechanicsProblem` for the given geometry,
+    used to inflate the geometry during unloading.
+
+    Parameters
+    ----------
+    solver_parameters : dict
+        Parameters used to make the solver parameters
+    geometry : object
+        The geometry
+    material_parameters : dict
+        A dictionary with material parameters
+
+    Returns
+    -------
+    problem : :py:class:`pulse.MechanicsProblem`
+        The mechanics problem
+    p_expr : dict
+        The pressure constants, with keys `p_lv` (and `p_rv`)
+    """
+
+    from ..setup_optimization import make_solver_parameters, check_patient_attributes
+    from ..heart_problem import create_mechanics_problem
+
+    check_patient_attributes(geometry)
+    params, p_expr = make_solver_parameters(
+        solver_parameters, geometry, material_parameters
+    )
+
+    return create_mechanics_problem(params), p_expr
+
+
+def grid_golden_search(
+    f, f_many, lb, ub, npoints, rounds=2, tol=1e-4, maxiter=10, cache=None
+):
+    """
+    Minimize a scalar function on the interval [lb, ub].
+
+    First the function is evaluated on a uniform grid of `npoints`
+    points using `f_many` (which may evaluate the points concurrently),
+    and the bracket is shrunk to the neighbours of the best point.
+    This is repeated `rounds` times. Finally the bracket is refined
+    using golden-section search, where values that are already
+    computed (within the tolerance) are taken from the cache.
+
+    Parameters
+    ----------
+    f : callable
+        The function to minimize
+    f_many : callable
+        A function that takes a list of points and returns
+        the list of function values
+    lb : float
+        Lower bound
+    ub : float
+        Upper bound
+    npoints : int
+        Number of points in each grid round
+    rounds : int
+        Number of grid rounds
+    tol : float
+        Tolerance for the size of the bracket
+    maxiter : int
+        Maximum number of golden-section iterations
+    cache : dict
+        Already computed values
+
+    Returns
+    -------
+    x : float
+        The minimizer
+    fun : float
+        The minimum value
+
+    """
+
+    cache = {} if cache is None else cache
+
+    def lookup(x):
+        for k, v in cache.items():
+            if abs(k - x) < 0.5 * tol:
+                return v
+        cache[x] = f(x)
+        return cache[x]
+
+    a, b = lb, ub
+    for r in range(rounds):
+
+        ks = [k for k in np.linspace(a, b, npoints) if k not in cache]
+        logger.info("Grid round {}: k = {}".format(r, ks))
+        if ks:
+            cache.update(zip(ks, f_many(ks)))
+
+        keys = sorted(k for k in cache if a <= k <= b)
+        i = int(np.argmin([cache[k] for k in keys]))
+        a, b = keys[max(i - 1, 0)], keys[min(i + 1, len(keys) - 1)]
+
+        if b - a < tol:
+            break
+
+    # Golden-section search
+    invphi = (np.sqrt(5) - 1) / 2.0
+    c = b - invphi * (b - a)
+    d = a + invphi * (b - a)
+    it = 0
+    while b - a > tol and it < maxiter:
+        if lookup(c) < lookup(d):
+            b = d
+        else:
+            a = c
+        c = b - invphi * (b - a)
+        d = a + invphi * (b - a)
+        it += 1
+
+    x = min(cache, key=lambda k: cache[k])
+    return x, cache[x]
 
 
 def step(
@@ -64,42 +350,48 @@ def step(
     approx="project",
     merge_control="",
     regen_fibers=False,
+    engine=None,
 ):
 
     logger.info("\n\nk = {}".format(k))
 
     # Create new reference geometry by moving according to rule
     U = df.Function(u.function_space())
-    assign_to_vector(U.vector(), k * gather_broadcast(u.vector().array()))
-    new_geometry = update_geometry(geometry, U, regen_fibers)
+    assign_local(U.vector(), u.vector(), k)
 
-    matparams = update_material_parameters(
-        material_parameters, new_geometry.mesh, merge_control
-    )
+    if engine is not None:
+        new_geometry = engine.update(U)
+        inflate = engine.inflate
 
-    if isinstance(matparams["a"], float):
-        logger.info("material parameters = {}".format(matparams["a"]))
     else:
-        logger.info(
-            "material parameters = {}".format(
-                gather_broadcast(matparams["a"].vector().array())
-            )
-        )
-    # Make the solver
-    from ..setup_optimization import make_solver_parameters, check_patient_attributes
+        new_geometry = update_geometry(geometry, U, regen_fibers)
 
-    check_patient_attributes(new_geometry)
-    params, p_expr = make_solver_parameters(solver_parameters, new_geometry, matparams)
+        matparams = update_material_parameters(
+            material_parameters, new_geometry.mesh, merge_control, new_geometry.sfun
+        )
 
-    from ..lvsolver import LVSolver as Solver
+        if isinstance(matparams["a"], float):
+            logger.info("material parameters = {}".format(matparams["a"]))
+        else:
+            logger.info(
+                "material parameters = {}".format(
+                    gather_broadcast_comm(
+                        matparams["a"].vector().get_local(),
+                        new_geometry.mesh.mpi_comm(),
+                    )
+                )
+            )
+        # Make the solver
+        problem, p_expr = create_problem(solver_parameters, new_geometry, matparams)
 
-    solver = Solver(params)
+        def inflate():
+            return inflate_to_pressure(
+                pressure, problem, p_expr, is_biv, solve_tries, n, annotate=False
+            )
 
     try:
         # Inflate new geometry to target pressure
-        u0 = inflate_to_pressure(
-            pressure, solver, p_expr, is_biv, solve_tries, n, annotate=False
-        )
+        u0 = inflate()
     except:
         logger.info("Failed to increase pressure")
         return big_res
@@ -129,7 +421,7 @@ class MeshUnloader(object):
         merge_control="",
     ):
 
-        self.geometry = geometry
+        self.geometry = get_geometry_object(geometry)
         self.pressure = pressure
 
         self.approx = approx
@@ -169,13 +461,15 @@ class MeshUnloader(object):
             + "\tApproximation: {}\n".format(approx)
             + "\tmaxiter = {}\n".format(self.parameters["maxiter"])
             + "\ttolerance = {}\n".format(self.parameters["tol"])
-            + "\tregenerate_fibers (serial only)= {}\n\n".format(
+            + "\tregenerate_fibers (serial only)= {}\n".format(
                 self.parameters["regen_fibers"]
             )
+            + "\treuse_solver = {}\n\n".format(self.parameters["reuse_solver"])
             + "".center(72, "-")
             + "\n"
         )
         logger.info(msg)
+        self.engine = None
 
     def setup_solver_parameters(self):
 
@@ -196,6 +490,9 @@ class MeshUnloader(object):
             "ub": 2.0,
             "regen_fibers": False,
             "solve_tries": 20,
+            "reuse_solver": False,
+            "nworkers": 1,
+            "rounds": 2,
         }
 
     def save(self, obj, name, h5group=""):
@@ -246,8 +543,9 @@ class MeshUnloader(object):
         residual = ResidualCalculator(self.geometry.mesh)
         u = self.initial_solve(True)
         self.U = df.Function(u.function_space())
+        self.engine = self.get_engine()
 
-        self.unload_step(u, residual, True)
+        self.unload_step(u, residual, save)
 
         logger.info("".center(72, "#") + "\nUnloading suceeding")
 
@@ -278,27 +576,13 @@ class MeshUnloader(object):
         # Do an initial solve
         logger.info("\nDo an intial solve")
 
-        from ..setup_optimization import (
-            make_solver_parameters,
-            check_patient_attributes,
-        )
-
-        check_patient_attributes(self.geometry)
-        params, p_expr = make_solver_parameters(
-            self.solver_parameters,
-            self.geometry,
-            self.material_parameters,
-            df.Constant(0.0),
+        problem, p_expr = create_problem(
+            self.solver_parameters, self.geometry, self.material_parameters
         )
 
-        from ..lvsolver import LVSolver as Solver
-
-        solver = Solver(params)
-        solver.solve()
-
         u = inflate_to_pressure(
             self.pressure,
-            solver,
+            problem,
             p_expr,
             self.is_biv,
             self.parameters["solve_tries"],
@@ -308,10 +592,53 @@ class MeshUnloader(object):
 
         return u
 
+    def get_engine(self):
+        """
+        Return an :class:`InflationEngine` that reuses the solver
+        between the iterations, if the option `reuse_solver` is set.
+        Otherwise return None, and a new solver is created in each
+        iteration.
+        """
+        if not self.parameters["reuse_solver"]:
+            return None
+
+        if self.parameters["regen_fibers"]:
+            logger.warning(
+                "Fibers cannot be regenerated when the solver is reused. "
+                + "Create a new solver in each iteration instead."
+            )
+            return None
+
+        return InflationEngine(
+            self.geometry,
+            self.pressure,
+            self.material_parameters,
+            self.solver_parameters,
+            self.is_biv,
+            self.n,
+            self.parameters["solve_tries"],
+            self.approx,
+            self.merge_control,
+        )
+
     def get_unloaded_geometry(self):
 
         return update_geometry(self.geometry, self.U, self.parameters["regen_fibers"])
 
+    @property
+    def unloaded_geometry(self):
+        """
+        The unloaded geometry as a :py:class:`pulse.HeartGeometry`
+        """
+        return to_heart_geometry(self.get_unloaded_geometry())
+
+    @property
+    def backward_displacement(self):
+        """
+        The backward displacement on the original geometry
+        """
+        return self.get_backward_displacement()
+
 
 class Raghavan(MeshUnloader):
     """
@@ -363,7 +690,16 @@ class Raghavan(MeshUnloader):
         make the parameters for the solver. 
         See pulse_adjoint.setup_parametere.setup_adjoint_contraction_parameters
 
+    In addition the following options are accepted:
 
+        nworkers : int
+            If larger than one, evaluate the values of `k` on a grid of
+            max(nworkers, 3) points, concurrently in `nworkers` groups
+            of MPI processes (see :meth:`Raghavan.get_evaluate_many`).
+            The bracket is refined in `rounds` grid rounds followed
+            by a golden-section search. Default: 1
+        rounds : int
+            Number of concurrent grid rounds. Default: 2
 
     Reference
     ---------
@@ -379,43 +715,62 @@ class Raghavan(MeshUnloader):
         big_res = 100.0
         residuals = {}
 
+        args = (
+            self.geometry,
+            self.pressure,
+            u,
+            residual,
+            big_res,
+            self.is_biv,
+            self.material_parameters,
+            self.solver_parameters,
+            self.n,
+            self.parameters["solve_tries"],
+            self.approx,
+            self.merge_control,
+            self.parameters["regen_fibers"],
+            self.engine,
+        )
+
         def iterate(k):
 
-            res = step(
-                self.geometry,
-                self.pressure,
-                k,
-                u,
-                residual,
-                big_res,
-                self.is_biv,
-                self.material_parameters,
-                self.solver_parameters,
-                self.n,
-                self.parameters["solve_tries"],
-                self.approx,
-                self.merge_control,
-                self.parameters["regen_fibers"],
-            )
+            res = step(args[0], args[1], k, *args[2:])
             residuals[k] = res
             return res
 
         logger.info("\nStart iterating....")
-        res = minimize_scalar(
-            iterate,
-            method="bounded",
-            bounds=(self.parameters["lb"], self.parameters["ub"]),
-            options={
-                "xatol": self.parameters["tol"],
-                "maxiter": self.parameters["maxiter"],
-            },
-        )
+        nworkers = self.parameters["nworkers"]
+        if nworkers > 1:
+
+            x, fun = grid_golden_search(
+                iterate,
+                self.get_evaluate_many(u, iterate),
+                self.parameters["lb"],
+                self.parameters["ub"],
+                npoints=max(nworkers, 3),
+                rounds=self.parameters["rounds"],
+                tol=self.parameters["tol"],
+                maxiter=self.parameters["maxiter"],
+                cache=residuals,
+            )
+
+        else:
+            res = minimize_scalar(
+                iterate,
+                method="bounded",
+                bounds=(self.parameters["lb"], self.parameters["ub"]),
+                options={
+                    "xatol": self.parameters["tol"],
+                    "maxiter": self.parameters["maxiter"],
+                },
+            )
+            x, fun = res.x, res.fun
 
         logger.info("Minimzation terminated sucessfully".center(72, "-"))
-        logger.info("Found:\n\tk={:.6f}\n\tResidual={:.3e}\n".format(res.x, res.fun))
+        logger.info("Found:\n\tk={:.6f}\n\tResidual={:.3e}\n".format(x, fun))
         logger.info("Save new reference geometry")
 
-        assign_to_vector(self.U.vector(), res.x * gather_broadcast(u.vector().array()))
+        assign_local(self.U.vector(), u.vector(), x)
         new_geometry = update_geometry(
             self.geometry, self.U, self.parameters["regen_fibers"]
         )
@@ -424,6 +779,95 @@ class Raghavan(MeshUnloader):
             self.save(new_geometry.mesh, "reference_geometry/mesh", "")
             # self.save(new_geometry.fiber, "reference_geometry/fiber", "")
 
+    def get_evaluate_many(self, u, iterate):
+        """
+        Return a function that evaluates the residual for a list of
+        values of `k`.
+
+        The processes are split into `nworkers` groups using MPI
+        sub-communicators, and the geometry, the displacement `u` and
+        the material parameters are copied to each group. Each group
+        evaluates every `nworkers`-th value, and the residuals are
+        shared between all processes. No processes are forked, since
+        this is not safe after MPI and PETSc are initialized. With fewer
+        processes than `nworkers`, the number of groups is reduced, and
+        with one process the values are evaluated in sequence.
+
+        Parameters
+        ----------
+        u : :py:class:`dolfin.Function`
+            The displacement obtained by inflating the original geometry
+        iterate : callable
+            Function that evaluates the residual for one value of `k`
+            using all processes
+
+        """
+
+        comm = df.mpi_comm_world()
+        if hasattr(comm, "tompi4py"):
+            comm = comm.tompi4py()
+
+        subcomm, color, ngroups = split_communicator(self.parameters["nworkers"], comm)
+        if ngroups == 1:
+            logger.info("Evaluate k sequentially using all processes")
+            return lambda ks: [iterate(k) for k in ks]
+
+        logger.info("Evaluate k concurrently in {} process groups".format(ngroups))
+        geometry, functions, matparams = transfer_geometry(
+            self.geometry,
+            {"u": u},
+            self.material_parameters,
+            self.h5name,
+            join(self.h5group, "raghavan_groups"),
+            subcomm,
+            self.merge_control,
+        )
+        residual = ResidualCalculator(geometry.mesh)
+
+        engine = None
+        if self.parameters["reuse_solver"] and not self.parameters["regen_fibers"]:
+            engine = InflationEngine(
+                geometry,
+                self.pressure,
+                matparams,
+                self.solver_parameters,
+                self.is_biv,
+                self.n,
+                self.parameters["solve_tries"],
+                self.approx,
+                self.merge_control,
+            )
+
+        def evaluate_many(ks):
+
+            local = {}
+            for k in ks[color::ngroups]:
+                local[k] = step(
+                    geometry,
+                    self.pressure,
+                    k,
+                    functions["u"],
+                    residual,
+                    100.0,
+                    self.is_biv,
+                    matparams,
+                    self.solver_parameters,
+                    self.n,
+                    self.parameters["solve_tries"],
+                    self.approx,
+                    self.merge_control,
+                    self.parameters["regen_fibers"],
+                    engine,
+                )
+
+            # Only one process in each group contributes
+            residuals = {}
+            for d in comm.allgather(local if subcomm.rank == 0 else {}):
+                residuals.update(d)
+            return [residuals[k] for k in ks]
+
+        return evaluate_many
+
 
 class Hybrid(MeshUnloader):
     """
@@ -510,6 +954,7 @@ class Hybrid(MeshUnloader):
             self.solver_parameters,
         )
         fixed_point_unloader.U = self.U
+        fixed_point_unloader.engine = self.engine
 
         res = np.inf
         iter = 0
@@ -520,11 +965,10 @@ class Hybrid(MeshUnloader):
             and res > self.parameters["tol"]
         ):
 
-            u_arr = gather_broadcast(u.vector().array())
-            assign_to_vector(self.U.vector(), u_arr)
+            assign_local(self.U.vector(), u.vector())
             try:
                 u, res = fixed_point_unloader.unload_step(u, residual, True, True, iter)
-            except UnableToChangePressureExeption as ex:
+            except (SolverDidNotConverge, UnableToChangePressureExeption) as ex:
                 logger.info(ex)
                 logger.info("Fixed-point method failed".center(72, "-"))
                 logger.info("Swith to the raghavan method")
@@ -544,6 +988,7 @@ class Hybrid(MeshUnloader):
                         self.n,
                         self.parameters["solve_tries"],
                         self.approx,
+                        engine=self.engine,
                     )
                     residuals[k] = res
                     return res
@@ -564,8 +1009,7 @@ class Hybrid(MeshUnloader):
                     "Found:\n\tk={:.6f}\n\tResidual={:.3e}\n".format(res.x, res.fun)
                 )
                 logger.info("Save new reference geometry")
-                u_arr = np.multiply(res.x, gather_broadcast(u.vector().array()))
-                assign_to_vector(self.U.vector(), u_arr)
+                assign_local(self.U.vector(), u.vector(), res.x)
                 new_geometry = update_geometry(
                     self.geometry, self.U, self.parameters["regen_fibers"]
                 )
@@ -576,8 +1020,7 @@ class Hybrid(MeshUnloader):
 
                 done = True
             else:
-                U_arr = gather_broadcast(self.U.vector().array())
-                assign_to_vector(U_prev.vector(), U_arr)
+                assign_local(U_prev.vector(), self.U.vector())
 
                 iter += 1
 
@@ -637,6 +1080,27 @@ class FixedPoint(MeshUnloader):
 
     """
 
+    def next_displacement(self, u, iter):
+        """
+        Return the backward displacement used to create the
+        next reference geometry.
+
+        Parameters
+        ----------
+        u : :py:class:`dolfin.Function`
+            The displacement obtained by inflating the current
+            reference geometry (stored in `self.U`) to the target pressure
+        iter : int
+            The current iteration
+
+        Returns
+        -------
+        u_arr : :py:class:`numpy.ndarray`
+            The local array of the next backward displacement
+
+        """
+        return u.vector().get_local()
+
     def unload_step(self, u, residual, save=True, return_u=False, iter=0):
         """
         Unload step
@@ -647,8 +1111,7 @@ class FixedPoint(MeshUnloader):
 
             logger.info("\nIteration: {}".format(iter))
 
-            u_arr = gather_broadcast(u.vector().array())
-            assign_to_vector(self.U.vector(), u_arr)
+            assign_local(self.U.vector(), self.next_displacement(u, iter))
 
             # The displacent field that we will move the mesh according to
             if save:
@@ -656,7 +1119,10 @@ class FixedPoint(MeshUnloader):
 
             # Create new reference geomtry
             logger.debug("Create new reference geometry")
-            new_geometry = self.get_unloaded_geometry()
+            if self.engine is not None:
+                new_geometry = self.engine.update(self.U)
+            else:
+                new_geometry = self.get_unloaded_geometry()
 
             # Compute volume of new reference geometry
             logger.info(
@@ -677,37 +1143,31 @@ class FixedPoint(MeshUnloader):
                 self.save(new_geometry.mesh, "reference_geometry/mesh", str(iter))
                 # self.save(new_geometry.fiber, "reference_geometry/fiber", str(iter))
 
-            matparams = update_material_parameters(
-                self.material_parameters, new_geometry.mesh, self.merge_control
-            )
-
-            # Make the solver
-            from ..setup_optimization import (
-                make_solver_parameters,
-                check_patient_attributes,
-            )
-
-            check_patient_attributes(new_geometry)
-            params, p_expr = make_solver_parameters(
-                self.solver_parameters, new_geometry, matparams
-            )
-
-            from ..lvsolver import LVSolver as Solver
+            if self.engine is not None:
+                u = self.engine.inflate()
+            else:
+                matparams = update_material_parameters(
+                    self.material_parameters,
+                    new_geometry.mesh,
+                    self.merge_control,
+                    new_geometry.sfun,
+                )
 
-            solver = Solver(params)
-            logger.info("Initial solve")
-            solver.solve()
+                # Make the solver
+                problem, p_expr = create_problem(
+                    self.solver_parameters, new_geometry, matparams
+                )
 
-            # Solve
-            u = inflate_to_pressure(
-                self.pressure,
-                solver,
-                p_expr,
-                self.is_biv,
-                self.parameters["solve_tries"],
-                self.n,
-                annotate=False,
-            )
+                # Solve
+                u = inflate_to_pressure(
+                    self.pressure,
+                    problem,
+                    p_expr,
+                    self.is_biv,
+                    self.parameters["solve_tries"],
+                    self.n,
+                    annotate=False,
+                )
 
             logger.debug(
                 (
@@ -751,6 +1211,98 @@ class FixedPoint(MeshUnloader):
                 return u, res
 
 
+class AndersonFixedPoint(FixedPoint):
+    """
+    Assumes that the given geometry is loaded 
+    with the given pressure.
+
+    Same as the backward displacement method in :class:`FixedPoint`,
+    but the displacement updates are accelerated using Anderson
+    mixing [1]. The fixed point map :math:`G` takes a backward
+    displacement :math:`x_k` to the displacement obtained by inflating
+    the corresponding reference geometry to the target pressure.
+    Using the residuals :math:`f_k = G(x_k) - x_k` from the last `m`
+    iterations the next iterate is given by
+
+    .. math::
+
+        x_{k+1} = x_k + \\beta f_k - (\\Delta X_k + \\beta \\Delta F_k) \\gamma_k
+
+    where :math:`\\gamma_k` minimizes :math:`\\| f_k - \\Delta F_k \\gamma \\|`.
+    This typically reduces the number of inflations needed to reach
+    a given tolerance.
+
+    Accepts the same arguments as :class:`FixedPoint`, and the
+    following additional options:
+
+        anderson_depth : int
+            Number of previous iterations used in the mixing
+            (m). If 0, this is equal to :class:`FixedPoint`.
+            Default: 5
+        anderson_beta : float
+            Relaxation parameter (beta). Default: 1.0
+
+    Reference
+    ---------
+    .. [1] Walker, Homer F., and Peng Ni. "Anderson acceleration for 
+       fixed-point iterations." SIAM Journal on Numerical Analysis 
+       49.4 (2011): 1715-1735.
+
+    """
+
+    def default_parameters(self):
+        """
+        Default parameters.
+        """
+        params = FixedPoint.default_parameters(self)
+        params.update(anderson_depth=5, anderson_beta=1.0)
+        return params
+
+    def next_displacement(self, u, iter):
+
+        # Work on the locally owned values only
+        g = u.vector().get_local()
+        x = self.U.vector().get_local()
+        f = g - x
+
+        if iter == 0 or not hasattr(self, "_last"):
+            self._last = None
+            self._dx = []
+            self._df = []
+
+        depth = self.parameters["anderson_depth"]
+        beta = self.parameters["anderson_beta"]
+
+        if self._last is not None and depth > 0:
+            x_prev, f_prev = self._last
+            self._dx = (self._dx + [x - x_prev])[-depth:]
+            self._df = (self._df + [f - f_prev])[-depth:]
+        self._last = (x, f)
+
+        if not self._df:
+            return x + beta * f
+
+        dX = np.array(self._dx).T
+        dF = np.array(self._df).T
+
+        # Solve the least squares problem using the normal equations,
+        # so that only the small (depth x depth) system is reduced
+        comm = df.mpi_comm_world()
+        mpi_sum = np.vectorize(lambda a: df.MPI.sum(comm, float(a)), otypes=[float])
+        A = mpi_sum(dF.T.dot(dF))
+        b = mpi_sum(dF.T.dot(f))
+        try:
+            gamma = np.linalg.lstsq(A, b, rcond=None)[0]
+        except np.linalg.LinAlgError:
+            logger.info("Anderson mixing failed. Restart history")
+            self._dx = []
+            self._df = []
+            return x + beta * f
+
+        logger.debug("Anderson coefficients: {}".format(gamma))
+        return x + beta * f - np.dot(dX + beta * dF, gamma)
+
+
 if __name__ == "__main__":
     from mesh_generation.mesh_utils import load_geometry_from_h5
 
@@ -27,6 +27,7 @@
 __author__ = "Henrik Finsberg (henriknf@simula.no)"
 import os
 from pulse.numpy_mpi import *
+from pulse.iterate import iterate
 import dolfin as df
 import numpy as np
 
@@ -41,29 +42,49 @@ except:
 
 
 class ResidualCalculator(object):
-    def __init__(self, mesh):
+    """
+    Compute the maximum distance from the exterior boundary vertices
+    of a mesh to the closest vertex in a reference mesh.
+    The reference coordinates are stored in a KD-tree, so that all
+    the boundary vertices are queried in one vectorized call.
+
+    Parameters
+    ----------
+    mesh : :py:class:`dolfin.Mesh`
+        The reference mesh
+    boundary_only : bool
+        If True, only the exterior boundary vertices of the reference
+        mesh are gathered and used in the tree. Otherwise all vertices
+        are used. A boundary vertex of the deformed mesh can be closer
+        to an interior vertex than to any boundary vertex of the
+        reference mesh, so with boundary_only the residual can be larger.
+        Default: False
+
+    """
+
+    def __init__(self, mesh, boundary_only=False):
+        from scipy.spatial import cKDTree
+
         self.mesh = mesh
-        d = self.mesh.topology().dim()
-        self.bbtree = df.BoundingBoxTree()
-        local_points = [v.point() for v in df.vertices(self.mesh)]
-        coords = [(p.x(), p.y(), p.z()) for p in local_points]
+        self.comm = mesh.mpi_comm()
+        d = self.mesh.geometry().dim()
+
+        if boundary_only:
+            local_coords = df.BoundaryMesh(mesh, "exterior").coordinates()
+        else:
+            local_coords = mesh.coordinates()
 
-        coords = numpy_mpi.gather_broadcast(np.array(coords).flatten())
-        coords.resize(len(coords) / d, d)
-        glob_points = [df.Point(p) for p in coords]
-        self.bbtree.build(glob_points, 3)
+        coords = gather_broadcast_comm(
+            np.ascontiguousarray(local_coords).flatten(), self.comm
+        )
+        self.tree = cKDTree(coords.reshape((-1, d)))
 
     def calculate_residual(self, mesh2):
         boundmesh = df.BoundaryMesh(mesh2, "exterior")
-        d = max(
-            [
-                self.bbtree.compute_closest_point(df.Vertex(boundmesh, v_idx).point())[
-                    1
-                ]
-                for v_idx in range(boundmesh.num_vertices())
-            ]
-        )
-        return df.MPI.max(df.mpi_comm_world(), d)
+        coords = boundmesh.coordinates()
+
+        d = self.tree.query(coords)[0].max() if len(coords) > 0 else 0.0
+        return df.MPI.max(self.comm, float(d))
 
 
 class Object(object):
@@ -136,17 +157,54 @@ def quad_to_xdmf(obj, h5name, h5group="", file_mode="w"):
 
 
 def inflate_to_pressure(
-    pressure, solver, p_expr, is_biv=None, ntries=5, n=2, annotate=False
+    pressure, problem, p_expr, is_biv=None, ntries=5, n=2, annotate=False
 ):
+    """
+    Inflate the geometry to the given pressure and return
+    the displacement.
+
+    Parameters
+    ----------
+    pressure : float or tuple
+        The target pressure. If LV only provide a
+        float, if BiV proble a tuple of the form (p_LV, p_RV).
+    problem : :py:class:`pulse.MechanicsProblem`
+        The mechanics problem
+    p_expr : dict
+        The pressure constants, with keys `p_lv` (and `p_rv`)
+    is_biv : bool
+        Wheter the geometry is biventricular. If None, this is
+        deduced from `pressure`.
+    annotate : bool
+        If True, annotate the last solve
+
+    Returns
+    -------
+    u : :py:class:`dolfin.Function`
+        A copy of the displacement
+    """
 
     if is_biv == None:
         is_biv = isinstance(pressure, tuple) and len(pressure) == 2
     solve = solve_biv if is_biv else solve_lv
 
     logger.debug("\nInflate geometry to p = {} kPa".format(pressure))
-    w = solve(pressure, solver, p_expr, ntries, n, annotate)
+    w = solve(pressure, problem, p_expr, ntries, n, annotate)
 
-    return solver.get_displacement(annotate=annotate)
+    return get_displacement(problem)
+
+
+def get_displacement(problem):
+    """
+    Return a copy of the displacement of a :py:class:`pulse.MechanicsProblem`
+    """
+
+    state = problem.state
+    if state.function_space().sub(0).num_sub_spaces() == 0:
+        # The state is the displacement only
+        return state.copy(deepcopy=True)
+
+    return state.split(deepcopy=True)[0]
 
 
 def print_volumes(geometry, logger=logger, is_biv=False):
@@ -189,6 +247,227 @@ def update_geometry(geometry, u=None, regen_fibers=True, *args):
     return new_geometry
 
 
+# Names of the microstructure and local basis attributes, together
+# with the names used in pulse.HeartGeometry
+FIELDS = [
+    ("fiber", "f0"),
+    ("sheet", "s0"),
+    ("sheet_normal", "n0"),
+    ("circumferential", "c0"),
+    ("radial", "r0"),
+    ("longitudinal", "l0"),
+]
+
+
+def get_geometry_object(geometry):
+    """
+    Return an object with the attributes used in the unloading code,
+    i.e `mesh`, `markers`, `ffun`, `sfun`, and the microstructure
+    and local basis named as in :data:`FIELDS`. The geometry can
+    be a :py:class:`pulse.HeartGeometry` or a patient object.
+    """
+
+    new_geometry = Object()
+    new_geometry.mesh = geometry.mesh
+    new_geometry.markers = geometry.markers
+    new_geometry.ffun = geometry.ffun
+    new_geometry.sfun = getattr(geometry, "sfun", getattr(geometry, "cfun", None))
+
+    for attr, name in FIELDS:
+        setattr(
+            new_geometry, attr, getattr(geometry, attr, getattr(geometry, name, None))
+        )
+
+    return new_geometry
+
+
+def to_heart_geometry(geometry):
+    """
+    Convert a geometry object, as returned by :func:`update_geometry`,
+    to a :py:class:`pulse.HeartGeometry`.
+    """
+    import pulse
+
+    mfun = pulse.MarkerFunctions(ffun=geometry.ffun, cfun=geometry.sfun)
+
+    microstructure = pulse.Microstructure(
+        f0=geometry.fiber,
+        s0=getattr(geometry, "sheet", None),
+        n0=getattr(geometry, "sheet_normal", None),
+    )
+
+    crl_basis = pulse.CRLBasis(
+        c0=getattr(geometry, "circumferential", None),
+        r0=getattr(geometry, "radial", None),
+        l0=getattr(geometry, "longitudinal", None),
+    )
+
+    return pulse.HeartGeometry(
+        mesh=geometry.mesh,
+        markers=geometry.markers,
+        marker_functions=mfun,
+        microstructure=microstructure,
+        crl_basis=crl_basis,
+    )
+
+
+def gather_broadcast_comm(arr, comm):
+    """
+    Gather the local arrays of the processes in `comm` and
+    broadcast the result to all of them. This is the same as
+    :func:`pulse.numpy_mpi.gather_broadcast`, but it only involves
+    the processes in `comm`, so it can be used by a group of
+    processes (see :func:`split_communicator`).
+
+    Parameters
+    ----------
+    arr : :py:class:`numpy.ndarray`
+        The local array
+    comm : communicator
+        The communicator
+
+    Returns
+    -------
+    arr : :py:class:`numpy.ndarray`
+        The local arrays of all processes, concatenated in rank order
+    """
+    if hasattr(comm, "tompi4py"):
+        comm = comm.tompi4py()
+
+    return np.concatenate(comm.allgather(np.asarray(arr).flatten()))
+
+
+def split_communicator(nworkers, comm=None):
+    """
+    Split the processes into (at most) `nworkers` groups
+    with a communicator each.
+
+    Parameters
+    ----------
+    nworkers : int
+        Number of groups
+    comm : communicator
+        The communicator to split. Default: world
+
+    Returns
+    -------
+    subcomm : :py:class:`mpi4py.MPI.Intracomm`
+        The communicator of the group this process belongs to
+    color : int
+        The index of the group
+    ngroups : int
+        The number of groups
+    """
+
+    comm = df.mpi_comm_world() if comm is None else comm
+    if hasattr(comm, "tompi4py"):
+        comm = comm.tompi4py()
+
+    ngroups = max(min(nworkers, comm.size), 1)
+    color = comm.rank % ngroups
+    return comm.Split(color, comm.rank), color, ngroups
+
+
+def transfer_geometry(
+    geometry, functions, material_parameters, h5name, h5group, comm, merge_control=""
+):
+    """
+    Copy a geometry, some functions and the material parameters to
+    another communicator, by writing them to an HDF file with the
+    world communicator and reading them back with `comm`.
+    This must be called on all processes.
+
+    Parameters
+    ----------
+    geometry : object
+        The geometry, with attributes as in :func:`get_geometry_object`
+    functions : dict
+        Functions on the geometry
+    material_parameters : dict
+        A dictionary with material parameters
+    h5name : str
+        Path to the HDF file used for the transfer
+    h5group : str
+        Group within the HDF file
+    comm : communicator
+        The new communicator
+    merge_control : str
+        How to merge the regional material parameters
+
+    Returns
+    -------
+    new_geometry : object
+        The geometry on the new communicator
+    new_functions : dict
+        The functions on the new communicator
+    new_material_parameters : dict
+        The material parameters on the new communicator
+    """
+
+    fields = [
+        attr for attr, _ in FIELDS if getattr(geometry, attr, None) is not None
+    ]
+    matparams = [
+        k for k, v in material_parameters.items() if isinstance(v, df.Function)
+    ]
+
+    if os.path.isfile(h5name):
+        from ..io.utils import check_and_delete
+
+        check_and_delete(h5name, h5group)
+        file_mode = "a"
+    else:
+        file_mode = "w"
+
+    logger.debug("Transfer geometry using {}:{}".format(h5name, h5group))
+    with df.HDF5File(df.mpi_comm_world(), h5name, file_mode) as h5file:
+        h5file.write(geometry.mesh, "/".join([h5group, "mesh"]))
+        h5file.write(geometry.ffun, "/".join([h5group, "ffun"]))
+        h5file.write(geometry.sfun, "/".join([h5group, "sfun"]))
+
+        for attr in fields:
+            h5file.write(getattr(geometry, attr), "/".join([h5group, attr]))
+        for name, f in functions.items():
+            h5file.write(f, "/".join([h5group, "functions", name]))
+        for k in matparams:
+            h5file.write(material_parameters[k], "/".join([h5group, "material", k]))
+
+    mesh = df.Mesh(comm)
+    new_geometry = Object()
+    new_functions = {}
+
+    with df.HDF5File(comm, h5name, "r") as h5file:
+        h5file.read(mesh, "/".join([h5group, "mesh"]), False)
+
+        new_geometry.mesh = mesh
+        new_geometry.markers = geometry.markers
+        new_geometry.ffun = df.MeshFunction("size_t", mesh, 2)
+        h5file.read(new_geometry.ffun, "/".join([h5group, "ffun"]))
+        new_geometry.sfun = df.MeshFunction("size_t", mesh, 3)
+        h5file.read(new_geometry.sfun, "/".join([h5group, "sfun"]))
+
+        for attr, _ in FIELDS:
+            f = None
+            if attr in fields:
+                V = df.FunctionSpace(mesh, getattr(geometry, attr).ufl_element())
+                f = df.Function(V, name=attr)
+                h5file.read(f, "/".join([h5group, attr]))
+            setattr(new_geometry, attr, f)
+
+        for name, f in functions.items():
+            V = df.FunctionSpace(mesh, f.function_space().ufl_element())
+            new_functions[name] = df.Function(V, name=name)
+            h5file.read(new_functions[name], "/".join([h5group, "functions", name]))
+
+        new_matparams = create_material_parameters(
+            material_parameters, mesh, merge_control, new_geometry.sfun
+        )
+        for k in matparams:
+            h5file.read(new_matparams[k], "/".join([h5group, "material", k]))
+
+    return new_geometry, new_functions, new_matparams
+
+
 def copy_geometry(new_mesh, geometry):
 
     new_geometry = Object()
@@ -201,6 +480,65 @@ def copy_geometry(new_mesh, geometry):
     return new_geometry
 
 
+def assign_local(v, w, factor=1.0):
+    """
+    Assign `factor * w` to the vector `v` using only the
+    locally owned values, i.e without gathering the global
+    array on every process.
+
+    Parameters
+    ----------
+    v : :py:class:`dolfin.GenericVector`
+        The vector to assign to
+    w : :py:class:`dolfin.GenericVector` or :py:class:`numpy.ndarray`
+        A vector with the same parallel layout as `v`,
+        or the array of local values
+    factor : float
+        Scaling factor
+
+    """
+    if isinstance(w, np.ndarray):
+        arr = w
+    else:
+        msg = "Vectors do not have the same parallel layout ({} != {})"
+        assert v.local_range() == w.local_range(), msg.format(
+            v.local_range(), w.local_range()
+        )
+        arr = w.get_local()
+
+    msg = "Expected {} local values, got {}"
+    assert len(arr) == v.local_size(), msg.format(v.local_size(), len(arr))
+    v.set_local(factor * arr)
+    v.apply("insert")
+
+
+def check_same_layout(V, W):
+    """
+    Check that the function spaces `V` and `W`, which may be
+    defined on different mesh objects, have the same element
+    and the same dof layout, so that the local values of a
+    function in `W` can be copied to a function in `V`
+    with :func:`assign_local`.
+
+    Parameters
+    ----------
+    V : :py:class:`dolfin.FunctionSpace`
+        The space to assign to
+    W : :py:class:`dolfin.FunctionSpace`
+        The space to assign from
+
+    """
+    msg = "Function spaces have different elements ({} != {})"
+    assert V.ufl_element() == W.ufl_element(), msg.format(
+        V.ufl_element(), W.ufl_element()
+    )
+
+    msg = "Function spaces have different dof layouts ({} != {})"
+    V_range = V.dofmap().ownership_range()
+    W_range = W.dofmap().ownership_range()
+    assert V_range == W_range, msg.format(V_range, W_range)
+
+
 def move(mesh, u, factor=1.0, approx="project"):
 
     W = df.VectorFunctionSpace(u.function_space().mesh(), "CG", 1)
@@ -219,12 +557,12 @@ def move(mesh, u, factor=1.0, approx="project"):
     u_int = df.interpolate(u, W)
 
     u0 = df.Function(W)
-    arr = factor * gather_broadcast(u_int.vector().array())
-    assign_to_vector(u0.vector(), arr)
+    assign_local(u0.vector(), u_int.vector(), factor)
 
     V = df.VectorFunctionSpace(mesh, "CG", 1)
+    check_same_layout(V, W)
     U = df.Function(V)
-    assign_to_vector(U.vector(), arr)
+    assign_local(U.vector(), u0.vector())
 
     df.ALE.move(mesh, U)
 
@@ -261,44 +599,29 @@ def list_sum(l):
     return out
 
 
-def solve_biv(pressure, solver, p_expr, ntries=5, n=2, annotate=False):
+def solve_biv(pressure, problem, p_expr, ntries=5, n=2, annotate=False):
 
-    df.parameters["adjoint"]["stop_annotating"] = True
-    from ..iterate import iterate, logger as logger_it
+    control = (p_expr["p_lv"], p_expr["p_rv"])
+    return _solve(tuple(pressure), problem, control, annotate)
 
-    ps, states = iterate("pressure", solver, pressure, p_expr)
 
-    level = logger_it.level
-    logger_it.setLevel(df.WARNING)
+def solve_lv(pressure, problem, p_expr, ntries=5, n=2, annotate=False):
 
-    if annotate:
-        # Only record the last solve, otherwise it becomes too
-        # expensive on the memory.
-        df.parameters["adjoint"]["stop_annotating"] = not annotate
-        solver.solve()
+    return _solve(pressure, problem, p_expr["p_lv"], annotate)
 
-    logger_it.setLevel(level)
-    w = solver.get_state().copy(True)
-    return w
 
-
-def solve_lv(pressure, solver, p_expr, ntries=5, n=2, annotate=False):
+def _solve(target, problem, control, annotate=False):
 
     df.parameters["adjoint"]["stop_annotating"] = True
-    from ..iterate import iterate, logger as logger_it
-
-    level = logger_it.level
-    logger_it.setLevel(df.WARNING)
+    iterate(problem=problem, control=control, target=target, continuation=True)
 
-    ps, states = iterate("pressure", solver, pressure, p_expr)
     if annotate:
         # Only record the last solve, otherwise it becomes too
         # expensive on the memory.
         df.parameters["adjoint"]["stop_annotating"] = not annotate
-        solver.solve()
+        problem.solve()
 
-    logger_it.setLevel(level)
-    w = solver.get_state().copy(True)
+    w = problem.state.copy(True)
     return w
 
 
@@ -337,9 +660,9 @@ def update_vector_field(
             f0_mesh = f0.function_space().mesh()
             u_elm = u.function_space().ufl_element()
             V = df.FunctionSpace(f0_mesh, u_elm)
+            check_same_layout(V, u.function_space())
             u0 = df.Function(V)
-            arr = gather_broadcast(u.vector().array())
-            assign_to_vector(u0.vector(), arr)
+            assign_local(u0.vector(), u.vector())
 
             F = df.grad(u0) + df.Identity(3)
 
@@ -348,12 +671,12 @@ def update_vector_field(
             if normalize:
                 f0_updated = normalize_vector_field(f0_updated)
 
-            f0_arr = gather_broadcast(f0_updated.vector().array())
-            assign_to_vector(f0_new.vector(), f0_arr)
+            check_same_layout(f0_new.function_space(), f0.function_space())
+            assign_local(f0_new.vector(), f0_updated.vector())
 
         else:
-            f0_arr = gather_broadcast(f0.vector().array())
-            assign_to_vector(f0_new.vector(), f0_arr)
+            check_same_layout(f0_new.function_space(), f0.function_space())
+            assign_local(f0_new.vector(), f0.vector())
 
     return f0_new
 
@@ -372,13 +695,12 @@ def normalize_vector_field(u):
 
     components = vectorfield_to_components(u, S, dim)
     normarray = np.sqrt(
-        sum(gather_broadcast(components[i].vector().array()) ** 2 for i in range(dim))
+        sum(components[i].vector().get_local() ** 2 for i in range(dim))
     )
 
     for i in range(dim):
-        assign_to_vector(
-            components[i].vector(),
-            gather_broadcast(components[i].vector().array()) / normarray,
+        assign_local(
+            components[i].vector(), components[i].vector().get_local() / normarray
         )
 
     assigners = [df.FunctionAssigner(u.function_space().sub(i), S) for i in range(dim)]
@@ -387,6 +709,68 @@ def normalize_vector_field(u):
     return u
 
 
+class VectorFieldPushForward(object):
+    """
+    Push forward a vector field by the deformation gradient of
+    a displacement, i.e compute the projection of
+    :math:`(I + \\nabla u) f_0` onto the function space of :math:`f_0`,
+    and normalize it.
+
+    The right hand side is compiled and the mass matrix is factorized
+    once, so that updating the field after the displacement has changed
+    (in place) only requires one assembly and one back substitution.
+    The normalization is done using the local dofs of each component,
+    so no sub spaces are collapsed.
+
+    Parameters
+    ----------
+    f0 : :py:class:`dolfin.Function`
+        The vector field
+    u : :py:class:`dolfin.Function`
+        The displacement. Should live on the same mesh as `f0`.
+    normalize : bool
+        If True normalize the vector field. Default: True
+
+    """
+
+    def __init__(self, f0, u, normalize=True):
+
+        V = f0.function_space()
+        self.normalize = normalize
+        self.f = df.Function(V)
+
+        F = df.grad(u) + df.Identity(3)
+        v = df.TestFunction(V)
+        self.rhs = df.inner(F * f0, v) * df.dx
+        self.b = None
+
+        M = df.assemble(df.inner(df.TrialFunction(V), v) * df.dx)
+        self.solver = df.LUSolver(M)
+        self.solver.parameters["reuse_factorization"] = True
+
+        first = V.dofmap().ownership_range()[0]
+        self.component_dofs = [
+            np.array(V.sub(i).dofmap().dofs(), dtype=int) - first
+            for i in range(V.num_sub_spaces())
+        ]
+
+    def __call__(self):
+        """
+        Return the local values of the pushed forward vector field
+        """
+
+        self.b = df.assemble(self.rhs, tensor=self.b)
+        self.solver.solve(self.f.vector(), self.b)
+
+        arr = self.f.vector().get_local()
+        if self.normalize:
+            norm = np.sqrt(sum(arr[dofs] ** 2 for dofs in self.component_dofs))
+            for dofs in self.component_dofs:
+                arr[dofs] /= norm
+
+        return arr
+
+
 def get_volume(geometry, u=None, chamber="lv"):
 
     if "ENDO" in geometry.markers:
@@ -421,7 +805,25 @@ def get_volume(geometry, u=None, chamber="lv"):
     return vol
 
 
-def update_material_parameters(material_parameters, mesh, merge_control_str=""):
+def create_material_parameters(
+    material_parameters, mesh, merge_control_str="", sfun=None
+):
+    """
+    Create material parameters of the same type as `material_parameters`
+    on a different mesh. The values are not assigned.
+
+    Parameters
+    ----------
+    material_parameters : dict
+        The material parameters
+    mesh : :py:class:`dolfin.Mesh`
+        The new mesh
+    merge_control_str : str
+        How to merge the regions of regional parameters
+    sfun : :py:class:`dolfin.MeshFunction`
+        Cell markers on the new mesh used for the regional parameters.
+        If None, the mesh domains are used.
+    """
 
     from ..setup_optimization import RegionalParameter, merge_control
 
@@ -430,22 +832,17 @@ def update_material_parameters(material_parameters, mesh, merge_control_str=""):
         if isinstance(v, RegionalParameter):
             geo = lambda: None
             geo.mesh = mesh
-            geo.sfun = df.MeshFunction("size_t", mesh, 3, mesh.domains())
-            sfun = merge_control(geo, merge_control_str)
-
-            v_new = RegionalParameter(sfun)
-            v_arr = gather_broadcast(v.vector().array())
-
-            assign_to_vector(v_new.vector(), v_arr)
-            new_matparams[k] = v_new
+            geo.sfun = (
+                df.MeshFunction("size_t", mesh, 3, mesh.domains())
+                if sfun is None
+                else sfun
+            )
+            new_matparams[k] = RegionalParameter(merge_control(geo, merge_control_str))
 
         elif isinstance(v, df.Function):
-            v_new = df.Function(
+            new_matparams[k] = df.Function(
                 df.FunctionSpace(mesh, v.function_space().ufl_element())
             )
-            v_arr = gather_broadcast(v.vector().array())
-            assign_to_vector(v_new.vector(), v_arr)
-            new_matparams[k] = v_new
 
         else:
             new_matparams[k] = v
@@ -453,12 +850,30 @@ def update_material_parameters(material_parameters, mesh, merge_control_str=""):
     return new_matparams
 
 
+def update_material_parameters(
+    material_parameters, mesh, merge_control_str="", sfun=None
+):
+
+    new_matparams = create_material_parameters(
+        material_parameters, mesh, merge_control_str, sfun
+    )
+    for k, v in material_parameters.items():
+        if isinstance(v, df.Function):
+            check_same_layout(new_matparams[k].function_space(), v.function_space())
+            assign_local(new_matparams[k].vector(), v.vector())
+
+    return new_matparams
+
+
 def load_opt_target(h5name, h5group, key="volume", data="simulated"):
 
     with h5py.File(h5name) as f:
-        vols = [
-            a[:][0] for a in list(f[h5group]["passive_inflation"][key][data].values())
-        ]
+        group = f[h5group]["passive_inflation"][key][data]
+        if isinstance(group, h5py.Dataset):
+            # Stored stacked (step x dof)
+            vols = [a[0] for a in group[:]]
+        else:
+            vols = [a[:][0] for a in list(group.values())]
 
     return vols
 
@@ -146,103 +146,21 @@ def print_line(for_res, it=None, grad_norm=None, func_value=None):
 
 
 def passive_inflation_exists(params):
-    import h5py, os
-    from .adjoint_contraction_args import PASSIVE_INFLATION_GROUP
+    from .io.utils import passive_inflation_exists
 
-    if not os.path.exists(params["sim_file"]):
-        return False
-
-    h5file = h5py.File(params["sim_file"])
-    key = PASSIVE_INFLATION_GROUP
-
-    # Check if pv point is already computed
-    if key in list(h5file.keys()):
-        logger.info(Text.green("Passive inflation, {}".format("fetched from database")))
-        h5file.close()
-        return True
-    logger.info(Text.blue("Passive inflation, {}".format("Run Optimization")))
-    h5file.close()
-    return False
+    return passive_inflation_exists(params)
 
 
 def check_group_exists(h5name, h5group):
-    import h5py, os
-
-    if not os.path.exists(h5name):
-        return False
-
-    try:
-        h5file = h5py.File(h5name)
-    except:
-        return False
+    from .io.utils import check_group_exists
 
-    group_exists = False
-    if h5group in h5file:
-        group_exists = True
-
-    h5file.close()
-    return group_exists
+    return check_group_exists(h5name, h5group)
 
 
 def contract_point_exists(params):
-    import h5py, os
-    import numpy as np
-    from .adjoint_contraction_args import (
-        ACTIVE_CONTRACTION,
-        CONTRACTION_POINT,
-        PASSIVE_INFLATION_GROUP,
-        PHASES,
-    )
+    from .io.utils import contract_point_exists
 
-    if not os.path.exists(params["sim_file"]):
-        logger.info(Text.red("Run passive inflation before systole"))
-        raise IOError("Need state from passive inflation")
-        return False
-
-    h5file = h5py.File(params["sim_file"])
-    key1 = ACTIVE_CONTRACTION
-    key2 = CONTRACTION_POINT.format(params["active_contraction_iteration_number"])
-    key3 = PASSIVE_INFLATION_GROUP
-
-    if not key3 in list(h5file.keys()):
-        logger.info(Text.red("Run passive inflation before systole"))
-        raise IOError("Need state from passive inflation")
-
-    if params["phase"] == PHASES[0]:
-        h5file.close()
-        return False
-
-    if not key1 in list(h5file.keys()):
-        h5file.close()
-        return False
-
-    try:
-
-        # Check if pv point is already computed
-        if key1 in list(h5file.keys()) and key2 in list(h5file[key1].keys()):
-            pressure = np.array(h5file[key1][key2]["bcs"]["pressure"])[-1]
-            logger.info(
-                Text.green(
-                    "Contract point {}, pressure = {:.3f} {}".format(
-                        params["active_contraction_iteration_number"],
-                        pressure,
-                        "fetched from database",
-                    )
-                )
-            )
-            h5file.close()
-            return True
-        logger.info(
-            Text.blue(
-                "Contract point {}, {}".format(
-                    params["active_contraction_iteration_number"], "Run Optimization"
-                )
-            )
-        )
-        h5file.close()
-        return False
-    except KeyError:
-        return False
+    return contract_point_exists(params)
 
 
 def get_simulated_pressure(params):
@@ -255,26 +173,9 @@ def get_simulated_pressure(params):
     :rtype: float
 
     """
+    from .io.utils import get_simulated_pressure
 
-    import h5py, numpy
-    from .adjoint_contraction_args import (
-        ACTIVE_CONTRACTION,
-        CONTRACTION_POINT,
-        PASSIVE_INFLATION_GROUP,
-        PHASES,
-    )
-
-    key1 = ACTIVE_CONTRACTION
-    key2 = CONTRACTION_POINT.format(params["active_contraction_iteration_number"])
-    key3 = PASSIVE_INFLATION_GROUP
-
-    with h5py.File(params["sim_file"], "r") as h5file:
-        try:
-            pressure = numpy.array(h5file[key1][key2]["bcs"]["pressure"])[-1]
-        except:
-            pressure = None
-
-    return pressure
+    return get_simulated_pressure(params)
 
 
 def list_sum(l):
@@ -0,0 +1,366 @@
+"""
+Benchmark suite for the forward and adjoint computations.
+
+The following components are timed on the LV and BiV test
+patients, on meshes of increasing resolution (each level is
+a uniform refinement of the previous level):
+
+* Evaluations of the passive and active forward runners
+* The gradient of the reduced functional (passive and active)
+* The assignment of the simulated volume and regional strain, where the
+  regional strain is computed both per region and for all regions at
+  once (batched_strain)
+* One iteration of the fixed point unloading algorithm, using the
+  same unloader (on pulse.MechanicsProblem) as UnloadedMaterial
+
+The results are written to a JSON file, which can be used as
+a baseline for later runs. If a baseline is given, the results
+are compared to the baseline, and the script exits with a non-zero
+status if a component is slower than the baseline by more than
+the given tolerance.
+
+Usage::
+
+    # Create a baseline
+    python benchmark_suite.py --levels 0 1 --output baseline.json
+
+    # Compare against the baseline
+    python benchmark_suite.py --levels 0 1 --baseline baseline.json
+
+"""
+import os
+import sys
+import copy
+import json
+import time
+import argparse
+
+import numpy as np
+import dolfin
+from pulse.numpy_mpi import gather_broadcast
+
+from pulse_adjoint import LVTestPatient, BiVTestPatient
+from pulse_adjoint.setup_optimization import setup_simulation
+from pulse_adjoint.run_optimization import (
+    run_passive_optimization_step,
+    run_active_optimization_step,
+    solve_oc_problem,
+    get_optimization_targets,
+)
+from pulse_adjoint.unloading import FixedPoint
+from pulse_adjoint.adjoint_contraction_args import logger
+from utils import setup_params
+
+COMPONENTS = [
+    "passive_forward",
+    "passive_derivative",
+    "volume_target",
+    "regional_strain_target",
+    "regional_strain_target_batched",
+    "active_forward",
+    "active_derivative",
+    "fixed_point_iteration",
+]
+
+# End diastolic pressures used for unloading
+UNLOAD_PRESSURE = {"lv": 2.0, "biv": (2.0, 1.0)}
+
+
+def refine_patient(patient, nrefine):
+    """Return a copy of the patient where the mesh is uniformly
+    refined `nrefine` times. Mesh functions are adapted to the new
+    mesh, and functions (e.g the fibers) are interpolated onto the
+    same element on the new mesh.
+    """
+    if nrefine == 0:
+        return patient
+
+    coarse = patient
+    for i in range(nrefine):
+
+        mesh = dolfin.refine(coarse.mesh)
+        fine = copy.copy(coarse)
+        # Attributes that are aliases (e.g sfun and cfun) are only transfered once
+        transfered = {}
+
+        for k, v in coarse.__dict__.items():
+            if id(v) in transfered:
+                setattr(fine, k, transfered[id(v)])
+                continue
+
+            if isinstance(v, dolfin.Mesh):
+                new = mesh
+            elif isinstance(v, dolfin.cpp.mesh.MeshFunctionSizet):
+                new = dolfin.adapt(v, mesh)
+            elif isinstance(v, dolfin.Function):
+                v.set_allow_extrapolation(True)
+                V = dolfin.FunctionSpace(mesh, v.ufl_element())
+                new = dolfin.interpolate(v, V)
+                new.rename(v.name(), v.label())
+            else:
+                continue
+
+            transfered[id(v)] = new
+            setattr(fine, k, new)
+
+        coarse = fine
+
+    return coarse
+
+
+def timeit(func, repeat):
+    """Call `func` `repeat` times and return the
+    minimum and median wall time, maximized over the processes.
+    """
+    comm = dolfin.mpi_comm_world()
+    times = []
+    for i in range(repeat):
+        t0 = time.time()
+        func()
+        times.append(dolfin.MPI.max(comm, time.time() - t0))
+
+    return {"min": float(np.min(times)), "median": float(np.median(times))}
+
+
+def benchmark_passive(patient, mesh_type, level, repeat):
+
+    params = setup_params(
+        "passive", "R_0", mesh_type, ["volume", "regional_strain", "regularization"]
+    )
+    params["sim_file"] = "benchmark_{}_{}.h5".format(mesh_type, level)
+    params["optimize_matparams"] = False
+    if os.path.isfile(params["sim_file"]) and dolfin.mpi_comm_world().rank == 0:
+        os.remove(params["sim_file"])
+    dolfin.MPI.barrier(dolfin.mpi_comm_world())
+
+    measurements, solver_parameters, p_lv, paramvec = setup_simulation(
+        params, patient
+    )
+    rd, paramvec = run_passive_optimization_step(
+        params, patient, solver_parameters, measurements, p_lv, paramvec
+    )
+    for_run = rd.for_run
+    x = gather_broadcast(paramvec.vector().get_local())
+
+    results = {}
+    results["passive_forward"] = timeit(lambda: for_run(paramvec, False), repeat)
+
+    # Record the forward model, and compute the gradient from the recording
+    rd(x)
+    results["passive_derivative"] = timeit(lambda: rd.derivative(), repeat)
+
+    dolfin.parameters["adjoint"]["stop_annotating"] = True
+    u = dolfin.split(for_run.cphm.get_state(False))[0]
+    for name, key in [
+        ("volume_target", "volume"),
+        ("regional_strain_target", "regional_strain"),
+    ]:
+        target = for_run.optimization_targets[key]
+        results[name] = timeit(lambda: target.assign_simulated(u), repeat)
+
+    # The same regional strain target, with all regions in one projection
+    batched_strain = params["batched_strain"]
+    params["batched_strain"] = True
+    target = get_optimization_targets(params, solver_parameters)["regional_strain"]
+    params["batched_strain"] = batched_strain
+    target.set_target_functions()
+    results["regional_strain_target_batched"] = timeit(
+        lambda: target.assign_simulated(u), repeat
+    )
+    logger.info(
+        "Regional strain, batched / per region: {:.2f}".format(
+            results["regional_strain_target_batched"]["min"]
+            / results["regional_strain_target"]["min"]
+        )
+    )
+
+    state_space = for_run.cphm.solver.state.function_space()
+    size = {
+        "num_cells": patient.mesh.num_entities_global(3),
+        "num_dofs": state_space.dim(),
+    }
+
+    # Store the passive results, which are needed in the active phase
+    solve_oc_problem(params, rd, paramvec)
+    dolfin.parameters["adjoint"]["stop_annotating"] = False
+
+    return params, results, size
+
+
+def benchmark_active(params, patient, repeat):
+
+    params["phase"] = "active_contraction"
+    params["active_contraction_iteration_number"] = 0
+
+    measurements, solver_parameters, pressure, gamma = setup_simulation(
+        params, patient
+    )
+    rd, gamma = run_active_optimization_step(
+        params, patient, solver_parameters, measurements, pressure, gamma
+    )
+
+    # Alternate between two controls, so that every
+    # evaluation steps the same distance in gamma
+    controls = []
+    for val in [0.05, 0.1]:
+        g = dolfin.Function(gamma.function_space())
+        g.vector()[:] = val
+        controls.append(g)
+
+    def forward():
+        controls.reverse()
+        rd.for_run(controls[0], False)
+
+    results = {}
+    results["active_forward"] = timeit(forward, repeat)
+
+    rd(gather_broadcast(controls[0].vector().get_local()))
+    results["active_derivative"] = timeit(lambda: rd.derivative(), repeat)
+    dolfin.parameters["adjoint"]["stop_annotating"] = False
+
+    return results
+
+
+def benchmark_unloading(patient, mesh_type, level, repeat):
+    """Time the initial inflation and one fixed point iteration.
+    Nothing is written to the result file.
+    """
+
+    def unload():
+        unloader = FixedPoint(
+            patient,
+            UNLOAD_PRESSURE[mesh_type],
+            h5name="benchmark_unload_{}_{}.h5".format(mesh_type, level),
+            options={"maxiter": 1},
+            remove_old=True,
+        )
+        unloader.unload(save=False)
+
+    return {"fixed_point_iteration": timeit(unload, repeat)}
+
+
+def run(meshes, levels, repeat, components):
+
+    patients = {"lv": LVTestPatient, "biv": BiVTestPatient}
+    benchmarks = {}
+
+    for mesh_type in meshes:
+        base = patients[mesh_type]()
+
+        for level in levels:
+            patient = refine_patient(base, level)
+            logger.info(
+                "\nBenchmark {} mesh, level {} ({} cells)".format(
+                    mesh_type, level, patient.mesh.num_entities_global(3)
+                )
+            )
+
+            params, results, size = benchmark_passive(
+                patient, mesh_type, level, repeat
+            )
+            if "active_forward" in components or "active_derivative" in components:
+                results.update(benchmark_active(params, patient, repeat))
+            if "fixed_point_iteration" in components:
+                results.update(benchmark_unloading(patient, mesh_type, level, repeat))
+
+            for name, timing in results.items():
+                if name not in components:
+                    continue
+                timing.update(size)
+                benchmarks["{}/{}/{}".format(mesh_type, level, name)] = timing
+
+    return {
+        "environment": {
+            "dolfin": dolfin.__version__,
+            "nprocs": dolfin.MPI.size(dolfin.mpi_comm_world()),
+            "repeat": repeat,
+        },
+        "benchmarks": benchmarks,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Compare the minimum time of each benchmark with the baseline
+
+    :param dict results: The results of this run
+    :param dict baseline: The baseline results
+    :param float tolerance: Allowed relative slow down
+    :returns: Names of the benchmarks that are slower than the baseline
+    :rtype: list
+
+    """
+    env, env_base = results["environment"], baseline["environment"]
+    if env["nprocs"] != env_base["nprocs"]:
+        logger.warning(
+            "Baseline is run on {} processes, this run on {}".format(
+                env_base["nprocs"], env["nprocs"]
+            )
+        )
+
+    regressions = []
+    logger.info(
+        "\n{:40}\t{:>10}\t{:>10}\t{:>8}".format("", "baseline", "current", "ratio")
+    )
+    for name, timing in sorted(results["benchmarks"].items()):
+        if name not in baseline["benchmarks"]:
+            logger.info("{:40}\t{:>10}\t{:>10.3f}".format(name, "-", timing["min"]))
+            continue
+
+        base = baseline["benchmarks"][name]
+        ratio = timing["min"] / base["min"]
+        msg = "{:40}\t{:>10.3f}\t{:>10.3f}\t{:>8.2f}".format(
+            name, base["min"], timing["min"], ratio
+        )
+        if ratio > 1.0 + tolerance:
+            regressions.append(name)
+            msg += "  <- slower"
+        logger.info(msg)
+
+    return regressions
+
+
+def main(args=None):
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--meshes", nargs="+", default=["lv", "biv"])
+    parser.add_argument(
+        "--levels",
+        nargs="+",
+        type=int,
+        default=[0, 1],
+        help="Number of uniform refinements of the test meshes",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--components", nargs="+", default=COMPONENTS)
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed relative slow down compared to the baseline",
+    )
+    args = parser.parse_args(args)
+
+    results = run(args.meshes, args.levels, args.repeat, args.components)
+
+    if dolfin.mpi_comm_world().rank == 0:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    logger.info("Results written to {}".format(args.output))
+
+    if args.baseline is None:
+        return 0
+
+    with open(args.baseline, "r") as f:
+        baseline = json.load(f)
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        logger.warning("Slower than the baseline: {}".format(", ".join(regressions)))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""
+Test that reusing the optimization targets and the forward runner
+between the contract points (persistent_active_session) gives the
+same results as building them for every point.
+"""
+import os
+import numpy as np
+import pytest
+import dolfin_adjoint
+
+from pulse_adjoint.run_optimization import (run_passive_optimization,
+                                            run_active_optimization)
+from pulse_adjoint.adjoint_contraction_args import ACTIVE_CONTRACTION_GROUP
+from pulse_adjoint.postprocess.load import load_dict_from_h5
+from pulse_adjoint import LVTestPatient
+from utils import setup_params
+
+parametrize = pytest.mark.parametrize
+
+
+def run(persistent, adaptive_weights):
+
+    params = setup_params("active", "R_0", "lv",
+                          ["volume", "regional_strain", "regularization"])
+    params["sim_file"] = "test_active_session_{}.h5".format(int(persistent))
+    params["persistent_active_session"] = persistent
+    params["adaptive_weights"] = adaptive_weights
+    params["Optimization_parameters"]["active_maxiter"] = 3
+
+    if os.path.isfile(params["sim_file"]):
+        os.remove(params["sim_file"])
+
+    patient = LVTestPatient()
+    # Two contract points are enough to reuse the session once
+    patient.num_contract_points = 2
+
+    params["phase"] = "passive_inflation"
+    params["optimize_matparams"] = False
+    run_passive_optimization(params, patient)
+    dolfin_adjoint.adj_reset()
+
+    params["phase"] = "active_contraction"
+    run_active_optimization(params, patient)
+
+    return [load_dict_from_h5(params["sim_file"],
+                              ACTIVE_CONTRACTION_GROUP.format(i))
+            for i in range(patient.num_contract_points)]
+
+
+@parametrize("adaptive_weights", [False, True])
+def test_persistent_active_session(adaptive_weights):
+
+    results = run(False, adaptive_weights)
+    results_persistent = run(True, adaptive_weights)
+
+    for d, d_persistent in zip(results, results_persistent):
+
+        assert np.allclose(d["optimal_control"]["vector_0"],
+                           d_persistent["optimal_control"]["vector_0"],
+                           rtol=1e-6)
+
+        func_vals = d["optimization_results"]["func_vals"]
+        func_vals_persistent = d_persistent["optimization_results"]["func_vals"]
+        assert len(func_vals) == len(func_vals_persistent)
+        assert np.allclose(func_vals, func_vals_persistent, rtol=1e-6)
+
+        # The targets only hold the results of the current point
+        assert np.allclose(d["volume"]["func_value"],
+                           d_persistent["volume"]["func_value"],
+                           rtol=1e-6)
+        assert np.allclose(d["regional_strain"]["func_value"],
+                           d_persistent["regional_strain"]["func_value"],
+                           rtol=1e-6)
+
+
+if __name__ == "__main__":
+    test_persistent_active_session(False)
+    test_persistent_active_session(True)
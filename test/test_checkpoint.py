@@ -0,0 +1,69 @@
+"""
+Test that the state of the reduced functional can be
+checkpointed and restored.
+"""
+import os
+import numpy as np
+from dolfin import parameters
+from pulse.numpy_mpi import gather_broadcast
+
+from pulse_adjoint.run_optimization import run_passive_optimization_step
+from pulse_adjoint.setup_optimization import setup_simulation
+from pulse_adjoint.io import get_checkpoint
+from pulse_adjoint import LVTestPatient
+from utils import setup_params
+
+patient = LVTestPatient()
+parameters["adjoint"]["stop_annotating"] = False
+
+
+def test_checkpoint():
+
+    params = setup_params("passive", "R_0", "lv", ["volume", "regularization"])
+    params["checkpoint_interval"] = 2
+
+    measurements, solver_parameters, p_lv, paramvec = setup_simulation(
+        params, patient
+    )
+    rd, paramvec = run_passive_optimization_step(
+        params, patient, solver_parameters, measurements, p_lv, paramvec
+    )
+
+    checkpoint = get_checkpoint(params)
+    checkpoint.remove()
+    rd.checkpoint = checkpoint
+
+    x = gather_broadcast(paramvec.vector().get_local())
+    rd(x)
+    assert not os.path.isfile(checkpoint.fname)
+    rd(0.9 * x)
+    assert os.path.isfile(checkpoint.fname)
+
+    # Restore in a new reduced functional
+    rd_new, paramvec_new = run_passive_optimization_step(
+        params, patient, solver_parameters, measurements, p_lv, paramvec.copy(True)
+    )
+    assert get_checkpoint(params).restore(rd_new, paramvec_new)
+    assert np.allclose(rd_new.func_values_lst, rd.func_values_lst)
+    assert rd_new.iter == rd.iter
+
+    best = np.argmin(rd.func_values_lst)
+    assert np.allclose(
+        gather_broadcast(paramvec_new.vector().get_local()),
+        gather_broadcast(rd.controls_lst[best].get_local()),
+    )
+
+    # A checkpoint from an optimization with other weights is ignored
+    params["Passive_optimization_weigths"]["volume"] = 0.5
+    rd_new, paramvec_new = run_passive_optimization_step(
+        params, patient, solver_parameters, measurements, p_lv, paramvec.copy(True)
+    )
+    assert not get_checkpoint(params).restore(rd_new, paramvec_new)
+    assert len(rd_new.func_values_lst) == 0
+
+    checkpoint.remove()
+    assert not os.path.isfile(checkpoint.fname)
+
+
+if __name__ == "__main__":
+    test_checkpoint()
@@ -0,0 +1,83 @@
+"""
+Test that the passive forward problem gives the same
+states with the different continuation predictors, that
+the predictors do not need more newton iterations, and
+that the step size is adapted to the newton iterations.
+"""
+import numpy as np
+from dolfin import parameters
+from pulse.numpy_mpi import gather_broadcast
+
+from pulse_adjoint.run_optimization import run_passive_optimization_step
+from pulse_adjoint.setup_optimization import setup_simulation
+from pulse_adjoint.continuation import StepController
+from pulse_adjoint.trace import tracer
+from pulse_adjoint import LVTestPatient
+from utils import setup_params
+
+patient = LVTestPatient()
+parameters["adjoint"]["stop_annotating"] = True
+
+
+def passive_states(predictor):
+
+    params = setup_params("passive", "R_0", "lv", ["volume", "regularization"])
+    params["continuation_predictor"] = predictor
+    # The newton iterations are recorded by the tracer
+    params["trace_file"] = "test_continuation_trace.json"
+
+    measurements, solver_parameters, p_lv, paramvec = setup_simulation(
+        params, patient
+    )
+    rd, paramvec = run_passive_optimization_step(
+        params, patient, solver_parameters, measurements, p_lv, paramvec
+    )
+
+    tracer.clear()
+    forward_result, _ = rd.for_run(paramvec, False)
+    niter = sum(
+        r["args"].get("newton_iterations", 0)
+        for r in tracer.records
+        if r["name"] == "newton solve"
+    )
+    tracer.disable()
+
+    states = [gather_broadcast(w.vector().get_local()) for w in forward_result["states"]]
+    return states, niter
+
+
+def test_step_controller():
+
+    controller = StepController(initial_step=0.5, target_iterations=4)
+    controller.accept(2)
+    assert np.isclose(controller.step, 1.0)
+    controller.accept(8)
+    assert np.isclose(controller.step, 0.5)
+    # The step is never increased beyond the full step
+    controller.accept(1)
+    controller.accept(1)
+    assert np.isclose(controller.step, 1.0)
+
+    nrejects = 0
+    while controller.reject():
+        nrejects += 1
+    assert nrejects == 4
+    assert controller.step < controller.min_step
+
+
+def test_continuation_predictor():
+
+    states, niter = passive_states("none")
+    assert niter > 0
+    for predictor in ["secant", "tangent"]:
+        states_pred, niter_pred = passive_states(predictor)
+        assert len(states_pred) == len(states)
+        for w, w_pred in zip(states, states_pred):
+            assert np.allclose(w, w_pred, atol=1e-6)
+        # The initial guess from the predictor saves newton iterations
+        assert niter_pred <= niter
+
+
+if __name__ == "__main__":
+    test_step_controller()
+    test_continuation_predictor()
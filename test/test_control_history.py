@@ -0,0 +1,70 @@
+"""
+Test that the history of the evaluated controls
+is bounded, and that the best control is kept.
+"""
+import numpy as np
+import dolfin
+
+from pulse_adjoint.setup_optimization import ControlHistory
+
+
+def vector(V, val):
+    f = dolfin.Function(V)
+    f.vector()[:] = val
+    return f.vector()
+
+
+def test_control_history():
+
+    mesh = dolfin.UnitSquareMesh(2, 2)
+    V = dolfin.FunctionSpace(mesh, "CG", 1)
+
+    history = ControlHistory(3)
+    func_values = [3.0, 1.0, 4.0, 5.0, 6.0]
+    for i, f in enumerate(func_values):
+        history.append(vector(V, float(i)), f)
+
+    # The three latest controls and the best control are kept
+    assert history.count == 5
+    assert history.indices() == [1, 2, 3, 4]
+    assert len(history) == 4
+    assert np.allclose(history[-1].get_local(), 4.0)
+    assert np.allclose(history[1].get_local(), 1.0)
+    index, best = history.best()
+    assert index == 1
+    assert np.allclose(best.get_local(), 1.0)
+
+    try:
+        history[0]
+    except IndexError:
+        pass
+    else:
+        raise AssertionError("Control 0 should not be kept")
+
+    # Remove the latest control, and add a new best control
+    history.pop()
+    assert history.count == 4
+    history.append(vector(V, 10.0), 0.5)
+    assert history.best()[0] == 4
+    assert np.allclose(history[4].get_local(), 10.0)
+
+    assert len(list(history)) == len(history)
+
+
+def test_control_history_unbounded():
+
+    mesh = dolfin.UnitSquareMesh(2, 2)
+    V = dolfin.FunctionSpace(mesh, "CG", 1)
+
+    history = ControlHistory()
+    for i in range(40):
+        history.append(vector(V, float(i)), 40.0 - i)
+
+    assert history.indices() == list(range(40))
+    assert np.allclose(history[0].get_local(), 0.0)
+    assert history.best()[0] == 39
+
+
+if __name__ == "__main__":
+    test_control_history()
+    test_control_history_unbounded()
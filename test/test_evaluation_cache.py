@@ -0,0 +1,130 @@
+"""
+Test that evaluations of the reduced functional
+in a control that is already evaluated are taken
+from the cache.
+"""
+import numpy as np
+from dolfin import parameters
+from pulse.numpy_mpi import gather_broadcast
+
+from pulse_adjoint.run_optimization import run_passive_optimization_step
+from pulse_adjoint.setup_optimization import setup_simulation
+from pulse_adjoint import LVTestPatient
+from utils import setup_params
+
+patient = LVTestPatient()
+parameters["adjoint"]["stop_annotating"] = False
+
+
+def test_evaluation_cache():
+
+    params = setup_params("passive", "R_0", "lv", ["volume", "regularization"])
+    params["Optimization_parameters"]["cache_size"] = 3
+
+    measurements, solver_parameters, p_lv, paramvec = setup_simulation(
+        params, patient
+    )
+    rd, paramvec = run_passive_optimization_step(
+        params, patient, solver_parameters, measurements, p_lv, paramvec
+    )
+
+    x = gather_broadcast(paramvec.vector().get_local())
+    y = 1.1 * x
+
+    f_x = rd(x)
+    dj_x = rd.derivative(x)
+    nforward = rd.iter
+
+    # Evaluate in a new point, so that the recording changes
+    f_y = rd(y)
+    assert rd.iter == nforward + 1
+
+    # Functional value and gradient in x are taken from the cache
+    assert np.isclose(rd(x), f_x)
+    assert np.allclose(rd.derivative(x), dj_x)
+    assert rd.iter == nforward + 1
+    assert rd.nr_der_calls == 1
+
+    # The recording belongs to y, so no new forward run is needed
+    rd.derivative(y)
+    assert rd.iter == nforward + 1
+    assert rd.nr_der_calls == 2
+
+    # Gradient in a point that is cached, but which is not
+    # the latest recording requires a new forward run
+    z = 1.2 * x
+    w = 1.3 * x
+    rd(z)
+    rd(w)
+    assert rd.iter == nforward + 3
+    rd.derivative(z)
+    assert rd.iter == nforward + 4
+    assert np.isclose(rd(y), f_y)
+
+
+def test_derivative_after_cache_hit():
+
+    params = setup_params("passive", "R_0", "lv", ["volume", "regularization"])
+
+    measurements, solver_parameters, p_lv, paramvec = setup_simulation(
+        params, patient
+    )
+    rd_ref, paramvec = run_passive_optimization_step(
+        params, patient, solver_parameters, measurements, p_lv, paramvec
+    )
+    x = gather_broadcast(paramvec.vector().get_local())
+    y = 1.1 * x
+    rd_ref(x)
+    dj_x = rd_ref.derivative()
+
+    params["Optimization_parameters"]["cache_size"] = 3
+    measurements, solver_parameters, p_lv, paramvec = setup_simulation(
+        params, patient
+    )
+    rd, paramvec = run_passive_optimization_step(
+        params, patient, solver_parameters, measurements, p_lv, paramvec
+    )
+
+    rd(x)
+    rd(y)
+    # Taken from the cache, while the recording belongs to y
+    rd(x)
+    nforward = rd.iter
+    assert np.allclose(gather_broadcast(rd.paramvec.vector().get_local()), x)
+
+    # The gradient is taken in the last evaluated control
+    assert np.allclose(rd.derivative(), dj_x)
+    assert rd.iter == nforward + 1
+
+
+def test_cache_hit_restores_state():
+
+    params = setup_params("passive", "R_0", "lv", ["volume", "regularization"])
+    params["Optimization_parameters"]["cache_size"] = 3
+    # The cached evaluations only keep the final state
+    params["Optimization_parameters"]["history_size"] = 2
+
+    measurements, solver_parameters, p_lv, paramvec = setup_simulation(
+        params, patient
+    )
+    rd, paramvec = run_passive_optimization_step(
+        params, patient, solver_parameters, measurements, p_lv, paramvec
+    )
+    x = gather_broadcast(paramvec.vector().get_local())
+    y = 1.1 * x
+
+    rd(x)
+    state_x = rd.for_run.cphm.solver.state.vector().get_local()
+    rd(y)
+    nforward = rd.iter
+
+    # The state of x is restored together with the control
+    rd(x)
+    assert rd.iter == nforward
+    assert np.allclose(rd.for_run.cphm.solver.state.vector().get_local(), state_x)
+
+
+if __name__ == "__main__":
+    test_evaluation_cache()
+    test_derivative_after_cache_hit()
+    test_cache_hit_restores_state()
@@ -0,0 +1,120 @@
+"""
+Test that reusing the passive mechanics problem and warm
+starting the pressure steps do not change the results of
+the passive forward problem or its gradient.
+"""
+import numpy as np
+import dolfin_adjoint
+from dolfin import parameters
+from pulse.numpy_mpi import gather_broadcast
+
+from pulse_adjoint.run_optimization import run_passive_optimization_step
+from pulse_adjoint.setup_optimization import setup_simulation
+from pulse_adjoint import LVTestPatient
+from utils import setup_params
+
+patient = LVTestPatient()
+parameters["adjoint"]["stop_annotating"] = True
+
+
+def passive_forward(**kwargs):
+    """Evaluate the passive forward problem in two controls,
+    and return the states and functional values
+    """
+
+    params = setup_params("passive", "R_0", "lv", ["volume", "regularization"])
+    for k, v in kwargs.items():
+        params[k] = v
+
+    measurements, solver_parameters, p_lv, paramvec = setup_simulation(
+        params, patient
+    )
+    rd, paramvec = run_passive_optimization_step(
+        params, patient, solver_parameters, measurements, p_lv, paramvec
+    )
+
+    x = gather_broadcast(paramvec.vector().get_local())
+    results = []
+    for scale in [1.0, 1.1]:
+        paramvec.vector()[:] = scale * x
+        forward_result, _ = rd.for_run(paramvec, False)
+        states = [
+            gather_broadcast(w.vector().get_local()) for w in forward_result["states"]
+        ]
+        results.append((states, forward_result["func_value"]))
+
+    return results
+
+
+def passive_derivative(**kwargs):
+    """Evaluate the reduced functional in two controls, so that
+    the second recording uses the reused problem, and return the
+    gradient in the last control
+    """
+
+    parameters["adjoint"]["stop_annotating"] = False
+    dolfin_adjoint.adj_reset()
+
+    params = setup_params("passive", "R_0", "lv", ["volume", "regularization"])
+    for k, v in kwargs.items():
+        params[k] = v
+
+    measurements, solver_parameters, p_lv, paramvec = setup_simulation(
+        params, patient
+    )
+    rd, paramvec = run_passive_optimization_step(
+        params, patient, solver_parameters, measurements, p_lv, paramvec
+    )
+
+    x = gather_broadcast(paramvec.vector().get_local())
+    rd(x)
+    func_value = rd(1.1 * x)
+    dj = rd.derivative()
+
+    parameters["adjoint"]["stop_annotating"] = True
+    dolfin_adjoint.adj_reset()
+
+    return func_value, dj
+
+
+def compare(results, results_ref):
+
+    for (states, func_value), (states_ref, func_value_ref) in zip(
+        results, results_ref
+    ):
+        assert len(states) == len(states_ref)
+        for w, w_ref in zip(states, states_ref):
+            assert np.allclose(w, w_ref, atol=1e-6)
+        assert np.isclose(func_value, func_value_ref)
+
+
+def test_reuse_passive_problem():
+
+    compare(
+        passive_forward(reuse_passive_problem=True),
+        passive_forward(reuse_passive_problem=False),
+    )
+
+
+def test_reuse_passive_problem_derivative():
+
+    func_value, dj = passive_derivative(reuse_passive_problem=True)
+    func_value_ref, dj_ref = passive_derivative(reuse_passive_problem=False)
+
+    assert np.isclose(func_value, func_value_ref)
+    assert np.allclose(dj, dj_ref)
+
+
+def test_passive_state_cache():
+
+    # The second evaluation is warm started from the states of the first
+    compare(
+        passive_forward(passive_state_cache_size=2),
+        passive_forward(passive_state_cache_size=0),
+    )
+
+
+if __name__ == "__main__":
+    test_reuse_passive_problem()
+    test_reuse_passive_problem_derivative()
+    test_passive_state_cache()
@@ -71,13 +71,13 @@ def main():
             F_ref = df.grad(u_int) + df.Identity(3)
             
 
-            print "\nApprox = {}:".format(approx)
+            print("\nApprox = {}:".format(approx))
             target_vol = VolumeTarget(patient.mesh, dS, "LV", approx)
             target_vol.set_target_functions()
             target_vol.assign_simulated(u)
             
             vol = target_vol.simulated_fun.vector().array()[0]
-            print "Volume = ", vol
+            print("Volume = ", vol)
 
 
             target_strain = RegionalStrainTarget(patient.mesh,
@@ -93,9 +93,48 @@ def main():
 
             strain = [target_strain.simulated_fun[i].vector().array() \
                       for i in range(nregions)]
-            print "Regional strain = ", strain
+            print("Regional strain = ", strain)
         
 
 
+def test_batched_regional_strain():
+
+    import numpy as np
+    from pulse.numpy_mpi import gather_broadcast
+
+    V = df.VectorFunctionSpace(patient.mesh, "CG", 2)
+    u = df.interpolate(
+        df.Expression(("0.1*x[0]", "-0.05*x[1]*x[0]", "0.02*x[2]"), degree=2), V
+    )
+
+    basis = {}
+    for l in ["circumferential", "radial", "longitudinal"]:
+        basis[l] = getattr(patient, l)
+
+    dX = df.Measure("dx", subdomain_data=patient.sfun, domain=patient.mesh)
+    regions = sorted(set(gather_broadcast(patient.sfun.array())))
+    target_data = {int(r): [[0.01 * i, -0.02, 0.03]] for i, r in enumerate(regions)}
+
+    values = {}
+    for batched in [False, True]:
+        target = RegionalStrainTarget(patient.mesh, basis, dX, batched=batched)
+        target.set_target_functions()
+        target.load_target_data(target_data, 0)
+        target.next_target(0)
+        target.assign_simulated(u)
+        target.assign_functional()
+
+        strains = [
+            gather_broadcast(f.vector().get_local()) for f in target.simulated_fun
+        ]
+        values[batched] = (strains, target.get_value())
+
+    strains, func_value = values[False]
+    strains_batched, func_value_batched = values[True]
+    for s, s_batched in zip(strains, strains_batched):
+        assert np.allclose(s, s_batched)
+    assert np.isclose(func_value, func_value_batched)
+
+
 if __name__ == "__main__":
     main()
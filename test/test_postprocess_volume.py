@@ -0,0 +1,66 @@
+"""
+Test that the volumes computed with the cached volume evaluator
+are the same as with the volume target, and that the number
+of cached evaluators is bounded.
+"""
+import numpy as np
+import dolfin
+
+from pulse_adjoint import LVTestPatient
+from pulse_adjoint.postprocess import utils
+
+patient = LVTestPatient()
+
+
+def displacements(n):
+
+    V = dolfin.VectorFunctionSpace(patient.mesh, "CG", 2)
+    disps = []
+    for i in range(n):
+        u = dolfin.interpolate(
+            dolfin.Expression(
+                ("a*x[0]", "-a*x[1]", "0.5*a*x[2]"), a=0.02 * (i + 1), degree=1
+            ),
+            V,
+        )
+        disps.append(u)
+    return disps
+
+
+def test_volume_evaluator():
+
+    disps = displacements(3)
+    marker = patient.markers["ENDO"][0]
+
+    for approx in ["project", "interpolate", "original"]:
+        volumes = utils.get_volumes(
+            [u.vector().get_local() for u in disps], patient, approx=approx
+        )
+        volumes_ref = [
+            utils.compute_inner_cavity_volume(
+                patient.mesh, patient.ffun, marker, u, approx
+            )
+            for u in disps
+        ]
+        assert np.allclose(volumes, volumes_ref)
+
+
+def test_volume_evaluator_cache_is_bounded():
+
+    marker = patient.markers["ENDO"][0]
+    for i in range(utils.MAX_CACHED_OPERATORS + 2):
+        mesh = dolfin.Mesh(patient.mesh)
+        ffun = dolfin.MeshFunction("size_t", mesh, 2)
+        ffun.array()[:] = patient.ffun.array()
+        utils.get_volume_evaluator(mesh, ffun, marker)
+
+    assert len(utils._volume_evaluators) == utils.MAX_CACHED_OPERATORS
+
+    # The most recently used evaluator is kept
+    evaluator = utils.get_volume_evaluator(mesh, ffun, marker)
+    assert utils.get_volume_evaluator(mesh, ffun, marker) is evaluator
+
+
+if __name__ == "__main__":
+    test_volume_evaluator()
+    test_volume_evaluator_cache_is_bounded()
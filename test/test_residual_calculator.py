@@ -0,0 +1,54 @@
+"""
+Test that the residual computed with the KD-tree in the unloading
+ResidualCalculator is the same as with a bounding box tree over
+all the vertices of the reference mesh.
+"""
+import numpy as np
+import dolfin
+
+from pulse.numpy_mpi import gather_broadcast
+from pulse_adjoint.unloading.utils import ResidualCalculator
+
+
+def old_residual(mesh, mesh2):
+
+    bbtree = dolfin.BoundingBoxTree()
+    coords = gather_broadcast(mesh.coordinates().flatten()).reshape((-1, 3))
+    bbtree.build([dolfin.Point(*p) for p in coords], 3)
+
+    boundmesh = dolfin.BoundaryMesh(mesh2, "exterior")
+    dists = [
+        bbtree.compute_closest_point(dolfin.Point(*p))[1]
+        for p in boundmesh.coordinates()
+    ]
+    d = max(dists + [0.0])
+    return dolfin.MPI.max(dolfin.mpi_comm_world(), d)
+
+
+def deformed_mesh(mesh, scale, seed=1):
+
+    mesh2 = dolfin.Mesh(mesh)
+    x = mesh2.coordinates()
+    np.random.seed(seed)
+    x[:] = 0.5 + scale * (x - 0.5) + 0.01 * np.random.rand(*x.shape)
+    return mesh2
+
+
+def test_residual_calculator():
+
+    mesh = dolfin.UnitCubeMesh(4, 4, 4)
+
+    for scale in [1.0, 1.02, 0.97]:
+        mesh2 = deformed_mesh(mesh, scale)
+        res_old = old_residual(mesh, mesh2)
+
+        res = ResidualCalculator(mesh).calculate_residual(mesh2)
+        assert np.isclose(res, res_old)
+
+        # Using only the boundary vertices gives an upper bound
+        res = ResidualCalculator(mesh, True).calculate_residual(mesh2)
+        assert res >= res_old - 1e-12
+
+
+if __name__ == "__main__":
+    test_residual_calculator()
@@ -0,0 +1,75 @@
+"""
+Test that the store of intermediate active states returns
+all stored states, also the ones that are spilled to file.
+"""
+import os
+import numpy as np
+import dolfin
+
+from pulse_adjoint.heart_problem import StateStore
+
+
+def make_pairs(n):
+
+    mesh = dolfin.UnitCubeMesh(2, 2, 2)
+    W = dolfin.FunctionSpace(mesh, "CG", 1)
+    V = dolfin.FunctionSpace(mesh, "R", 0)
+
+    states, gammas = [], []
+    for i in range(n):
+        w = dolfin.Function(W)
+        w.vector()[:] = float(i)
+        g = dolfin.Function(V)
+        g.vector()[:] = 0.1 * i
+        states.append(w)
+        gammas.append(g)
+
+    return states, gammas
+
+
+def values(functions):
+    return [f.vector().max() for f in functions]
+
+
+def test_state_store_unbounded():
+
+    states, gammas = make_pairs(30)
+    store = StateStore()
+    store.store(states[:10], gammas[:10])
+    store.store(states[10:], gammas[10:])
+
+    assert len(store) == 30
+    old_states, old_gammas = store.load()
+    assert np.allclose(values(old_states), values(states))
+    assert np.allclose(values(old_gammas), values(gammas))
+
+
+def test_state_store_spill():
+
+    fname = "test_state_store_spill.h5"
+    if os.path.isfile(fname) and dolfin.MPI.rank(dolfin.mpi_comm_world()) == 0:
+        os.remove(fname)
+
+    states, gammas = make_pairs(8)
+    store = StateStore(maxsize=3, spill_file=fname)
+    for w, g in zip(states, gammas):
+        store.store([w], [g])
+
+    assert len(store) == 8
+    assert len(store._states) == 3
+
+    # The spilled states are read back, oldest first
+    old_states, old_gammas = store.load()
+    assert np.allclose(values(old_states), values(states))
+    assert np.allclose(values(old_gammas), values(gammas))
+
+    # Without a spill file the oldest states are dropped
+    store = StateStore(maxsize=3)
+    store.store(states, gammas)
+    old_states, old_gammas = store.load()
+    assert np.allclose(values(old_states), values(states[-3:]))
+
+
+if __name__ == "__main__":
+    test_state_store_unbounded()
+    test_state_store_spill()
@@ -2,6 +2,7 @@
 Test that saving optimization results to file
 works as is should.
 """
+import numpy as np
 import dolfin, dolfin_adjoint
 from mesh_generation.mesh_utils import load_geometry_from_h5
 
@@ -19,10 +20,12 @@ from pulse_adjoint import LVTestPatient
 patient = LVTestPatient()
 
 
-def test_store():
+def store(writer=None, **kwargs):
 
     setup_general_parameters()
     params = setup_adjoint_contraction_parameters()
+    for k, v in kwargs.items():
+        params[k] = v
     measurements = get_measurements(params, patient)
     
     solver_parameters, pressure, control = make_solver_params(params, patient)
@@ -65,15 +68,137 @@ def test_store():
     
 
 
-    params["sim_file"] = "test.h5"
     h5group = "active"
 
-    write_opt_results_to_h5(h5group,
-                            params,
-                            for_res,
-                            phm.solver,
-                            opt_result)
-    
+    if writer is None:
+        write_opt_results_to_h5(h5group,
+                                params,
+                                for_res,
+                                phm.solver,
+                                opt_result)
+    else:
+        from pulse_adjoint.io.store_results import submit_opt_results
+        submit_opt_results(writer,
+                           h5group,
+                           params,
+                           for_res,
+                           phm.solver,
+                           opt_result)
+        # Changes after the results are submitted are not written
+        control.vector().zero()
+        w.vector().zero()
+
+    return params["sim_file"], h5group
+
+
+def test_store():
+    store(sim_file = "test.h5")
+
+
+def test_store_compact():
+
+    h5name, h5group = store(sim_file = "test.h5")
+    h5name_compact, _ = store(sim_file = "test_compact.h5",
+                              store_displacement = False)
+
+    from pulse_adjoint.io import read_displacement
+    V = dolfin.VectorFunctionSpace(patient.mesh, "CG", 2)
+    u = dolfin.Function(V)
+    u_compact = dolfin.Function(V)
+
+    with dolfin.HDF5File(dolfin.mpi_comm_world(), h5name, "r") as h5file:
+        read_displacement(h5file, u, h5group, 0)
+
+    with dolfin.HDF5File(dolfin.mpi_comm_world(), h5name_compact, "r") as h5file:
+        assert not h5file.has_dataset(h5group + "/displacement/0")
+        read_displacement(h5file, u_compact, h5group, 0)
+
+    assert np.allclose(u.vector().get_local(), u_compact.vector().get_local())
+
+
+def test_store_stacked():
+
+    h5name, h5group = store(sim_file = "test.h5")
+    h5name_stacked, _ = store(sim_file = "test_stacked.h5",
+                              stack_results = True,
+                              result_compression = "gzip")
+
+    from pulse_adjoint.postprocess.load import load_dict_from_h5
+    d = load_dict_from_h5(h5name, h5group)
+    d_stacked = load_dict_from_h5(h5name_stacked, h5group)
+
+    def compare(a, b):
+        if isinstance(a, dict):
+            assert sorted(a.keys()) == sorted(b.keys())
+            for k in a:
+                compare(a[k], b[k])
+        else:
+            assert np.allclose(a, b)
+
+    compare(d, d_stacked)
+
+
+def test_store_async():
+
+    from pulse_adjoint.io import AsyncResultWriter
+    from pulse_adjoint.postprocess.load import load_dict_from_h5
+
+    h5name, h5group = store(sim_file = "test.h5")
+
+    writer = AsyncResultWriter()
+    h5name_async, _ = store(sim_file = "test_async.h5", writer = writer)
+    writer.close()
+
+    d = load_dict_from_h5(h5name, h5group)
+    d_async = load_dict_from_h5(h5name_async, h5group)
+    assert np.allclose(d["optimal_control"]["vector_0"],
+                       d_async["optimal_control"]["vector_0"])
+    assert np.allclose(d["states"]["0"]["vector_0"],
+                       d_async["states"]["0"]["vector_0"])
+    assert np.allclose(d["bcs"]["pressure"], d_async["bcs"]["pressure"])
+    assert np.allclose(d["optimization_results"]["func_vals"],
+                       d_async["optimization_results"]["func_vals"])
+
+    # The functions written by the writer thread can be read by dolfin
+    cell = patient.mesh.ufl_cell()
+    W = dolfin.FunctionSpace(patient.mesh,
+                             dolfin.MixedElement([dolfin.VectorElement("P", cell, 2),
+                                                  dolfin.FiniteElement("P", cell, 1)]))
+    states = []
+    for fname in [h5name, h5name_async]:
+        w = dolfin.Function(W)
+        with dolfin.HDF5File(dolfin.mpi_comm_world(), fname, "r") as h5file:
+            h5file.read(w, h5group + "/states/0")
+        states.append(w.vector().get_local())
+    assert np.allclose(states[0], states[1])
+
+
+def test_load_lazy():
+
+    h5name, h5group = store(sim_file = "test.h5")
+
+    from pulse_adjoint.postprocess.load import load_dict_from_h5
+    d = load_dict_from_h5(h5name, h5group)
+    d_lazy = load_dict_from_h5(h5name, h5group, lazy = True, cache_size = 2)
+
+    assert sorted(d.keys()) == sorted(d_lazy.keys())
+    assert np.allclose(d["bcs"]["pressure"], d_lazy["bcs"]["pressure"])
+    assert np.allclose(d["bcs"]["pressure"][1:],
+                       d_lazy["bcs"].read("pressure", slice(1, None)))
+    assert d_lazy.to_dict().keys() == d.keys()
+
+    # Items that are set are kept in memory
+    d_lazy["new"] = {}
+    assert "new" in d_lazy
+    assert "new" not in load_dict_from_h5(h5name, h5group, lazy = True)
+
+    # Items set on a subgroup are kept when the subgroup is evicted
+    d_lazy["bcs"]["new"] = 1.0
+    for k in d_lazy.keys():
+        d_lazy[k]
+    assert "new" in d_lazy["bcs"]
+    assert d_lazy["bcs"]["new"] == 1.0
+
 
 if __name__ == "__main__":
     test_store()
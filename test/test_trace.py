@@ -0,0 +1,90 @@
+"""
+Test that the time spent in the different parts
+of the optimization is recorded in the trace file.
+"""
+import json
+from dolfin import parameters
+from pulse.numpy_mpi import gather_broadcast
+
+from pulse_adjoint.run_optimization import run_passive_optimization_step
+from pulse_adjoint.setup_optimization import setup_simulation
+from pulse_adjoint.trace import tracer
+from pulse_adjoint import LVTestPatient
+from utils import setup_params
+
+patient = LVTestPatient()
+parameters["adjoint"]["stop_annotating"] = False
+
+
+def test_trace():
+
+    params = setup_params("passive", "R_0", "lv", ["volume", "regularization"])
+    params["trace_file"] = "trace.json"
+
+    measurements, solver_parameters, p_lv, paramvec = setup_simulation(
+        params, patient
+    )
+    assert tracer.enabled
+    tracer.clear()
+
+    rd, paramvec = run_passive_optimization_step(
+        params, patient, solver_parameters, measurements, p_lv, paramvec
+    )
+
+    x = gather_broadcast(paramvec.vector().get_local())
+    rd(x)
+    rd.derivative(x)
+
+    names = set(r["name"] for r in tracer.records)
+    for name in [
+        "forward run",
+        "adjoint run",
+        "passive step",
+        "newton solve",
+        "update targets",
+        "assemble functional",
+    ]:
+        assert name in names
+
+    # Regions are nested
+    paths = set(r["path"] for r in tracer.records)
+    assert "forward run/passive step/newton solve" in paths
+
+    summary = tracer.summary(tracer.records)
+    assert summary["forward run"]["count"] == 1
+    assert summary["adjoint run"]["count"] == 1
+
+    records = list(tracer.records)
+    tracer.write()
+    assert tracer.records == []
+    with open("trace.json", "r") as f:
+        events = json.load(f)["traceEvents"]
+    assert len(events) == len(records)
+
+    # Only the new records are appended
+    rd(1.01 * x)
+    new_records = list(tracer.records)
+    tracer.write()
+    with open("trace.json", "r") as f:
+        events = json.load(f)["traceEvents"]
+    assert len(events) == len(records) + len(new_records)
+    assert [e["name"] for e in events[len(records):]] == [
+        r["name"] for r in new_records
+    ]
+
+    rd(1.02 * x)
+    records = list(tracer.records)
+    tracer.write("trace.jsonl")
+    with open("trace.jsonl", "r") as f:
+        written = [json.loads(l) for l in f]
+    assert [r["name"] for r in written] == [r["name"] for r in records]
+
+    # The tracer is disabled when no trace file is given
+    params["trace_file"] = ""
+    tracer.setup(params)
+    assert not tracer.enabled
+    assert tracer.records == []
+
+
+if __name__ == "__main__":
+    test_trace()
@@ -1,4 +1,7 @@
+import pytest
+import dolfin
 from pulse_adjoint.unloading import *
+from pulse_adjoint.unloading.utils import get_volume
 from pulse_adjoint.setup_parameters import setup_general_parameters
 setup_general_parameters()
 
@@ -18,6 +21,48 @@ def test_fixed_point_lv():
                           options = {"maxiter":15})
     unloader.unload()
 
+def test_fixed_point_lv_reuse_solver():
+
+    unloader = FixedPoint(geo_lv, p_lv,
+                          h5name = "fixedpoint_reuse_lv.h5",
+                          options = {"maxiter":3,
+                                     "reuse_solver":True})
+    unloader.unload()
+
+def test_reuse_solver_same_volume():
+
+    volumes = []
+    for reuse_solver in [False, True]:
+        unloader = FixedPoint(geo_lv, p_lv,
+                              h5name = "fixedpoint_reuse_lv.h5",
+                              options = {"maxiter":3,
+                                         "reuse_solver":reuse_solver})
+        unloader.unload()
+        volumes.append(get_volume(unloader.get_unloaded_geometry()))
+
+    assert abs(volumes[0] - volumes[1]) < 1e-4 * volumes[0]
+
+def test_anderson_fixed_point_lv():
+
+    unloader = AndersonFixedPoint(geo_lv, p_lv,
+                                  h5name = "anderson_lv.h5",
+                                  options = {"maxiter":5,
+                                             "anderson_depth":3})
+    unloader.unload()
+
+def test_anderson_depth_zero_is_fixed_point():
+
+    volumes = []
+    for Unloader in [FixedPoint, AndersonFixedPoint]:
+        unloader = Unloader(geo_lv, p_lv,
+                            h5name = "anderson_lv.h5",
+                            options = {"maxiter":2,
+                                       "anderson_depth":0})
+        unloader.unload()
+        volumes.append(get_volume(unloader.get_unloaded_geometry()))
+
+    assert abs(volumes[0] - volumes[1]) < 1e-8 * volumes[0]
+
 def test_raghavan_lv():
     unloader = Raghavan(geo_lv, p_lv,
                         h5name = "raghavan_biv.h5",
@@ -25,6 +70,44 @@ def test_raghavan_lv():
     unloader.unload()
 
 
+def test_raghavan_lv_parallel():
+    unloader = Raghavan(geo_lv, p_lv,
+                        h5name = "raghavan_parallel_lv.h5",
+                        options = {"maxiter":1, "nworkers":2,
+                                   "rounds":1})
+    unloader.unload()
+
+
+def test_raghavan_lv_groups():
+    # Run with mpirun -n 2 (or more) to evaluate k in two process groups
+    if dolfin.MPI.size(dolfin.mpi_comm_world()) < 2:
+        pytest.skip("Needs at least two processes")
+
+    # A function valued parameter is gathered when logged in each step
+    a = dolfin.Function(dolfin.FunctionSpace(geo_lv.mesh, "R", 0))
+    a.assign(dolfin.Constant(2.28))
+    matparams = {"a": a, "a_f": 1.685, "b": 9.726, "b_f": 15.779}
+
+    unloader = Raghavan(geo_lv, p_lv,
+                        material_parameters = matparams,
+                        h5name = "raghavan_groups_lv.h5",
+                        options = {"maxiter":1, "nworkers":2,
+                                   "reuse_solver":False})
+    u = unloader.initial_solve()
+    residual = ResidualCalculator(unloader.geometry.mesh)
+
+    def iterate(k):
+        return step(unloader.geometry, unloader.pressure, k, u, residual,
+                    100.0, unloader.is_biv, matparams,
+                    unloader.solver_parameters, unloader.n,
+                    unloader.parameters["solve_tries"])
+
+    ks = [0.8, 1.0, 1.2]
+    residuals = unloader.get_evaluate_many(u, iterate)(ks)
+    assert residuals == pytest.approx([iterate(k) for k in ks], rel=1e-8)
+
+    unloader.unload()
+
 def test_hybrid_lv():
  
     unloader = Hybrid(geo_lv, p_lv,
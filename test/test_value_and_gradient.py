@@ -0,0 +1,51 @@
+"""
+Test that computing the functional value and the gradient
+in one call gives the same optimum as separate callbacks.
+"""
+import numpy as np
+from dolfin import parameters
+from pulse.numpy_mpi import gather_broadcast
+
+from pulse_adjoint.run_optimization import run_passive_optimization_step
+from pulse_adjoint.setup_optimization import setup_simulation
+from pulse_adjoint.optimal_control import OptimalControl
+from pulse_adjoint import LVTestPatient
+from utils import setup_params
+
+patient = LVTestPatient()
+parameters["adjoint"]["stop_annotating"] = False
+
+
+def optimize(value_and_gradient):
+
+    # Regional material parameters, so that the multidimensional
+    # optimizer with the gradient (scipy with jac=True) is used
+    params = setup_params("passive", "regional", "lv", ["volume", "regularization"])
+    params["Optimization_parameters"]["value_and_gradient"] = value_and_gradient
+    params["Optimization_parameters"]["passive_maxiter"] = 5
+
+    measurements, solver_parameters, p_lv, paramvec = setup_simulation(
+        params, patient
+    )
+    rd, paramvec = run_passive_optimization_step(
+        params, patient, solver_parameters, measurements, p_lv, paramvec
+    )
+
+    oc_problem = OptimalControl()
+    oc_problem.build_problem(params, rd, paramvec)
+    rd, opt_result = oc_problem.solve()
+
+    return gather_broadcast(opt_result["x"]), np.min(rd.func_values_lst)
+
+
+def test_value_and_gradient():
+
+    x, f = optimize(False)
+    x_vg, f_vg = optimize(True)
+
+    assert np.allclose(x, x_vg)
+    assert np.isclose(f, f_vg)
+
+
+if __name__ == "__main__":
+    test_value_and_gradient()